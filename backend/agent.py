@@ -3,29 +3,319 @@ LangGraph Agent for Experiment Notes Search
 実験ノート検索用のLangGraphエージェント
 プロンプトとモデルを動的に設定可能
 """
+import hashlib
 import operator
 import json
 import re
+import threading
 import time
-from typing import TypedDict, List, Annotated, Optional
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TypedDict, Dict, Iterator, List, Annotated, Optional, Tuple, Union
 
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
-from langchain_core.messages import HumanMessage, BaseMessage
+from langchain_core.messages import AIMessageChunk, HumanMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 import cohere
 
 from config import config
 from utils import load_master_dict, normalize_text
 from prompts import get_default_prompt
 from synonym_dictionary import get_synonym_dictionary
+from bm25_index import get_collection_index
+from collection_generation import get_named_generation, advance_named_generation
+from embedding_cache import CachedEmbeddings, get_query_embedding_cache
+from dense_index import dense_search, get_dense_backend
+from vector_storage import reduce_embeddings, rescore_results
+from hybrid_search import hybrid_search
+from llm_cache import get_llm_response_cache
+from rerank_cache import rerank
+from focus_classifier import classify_focus_by_rules, record_focus_classification
+from tokenizer import tokenize
 from chroma_sync import (
     get_chroma_vectorstore,
     get_team_chroma_vectorstore,
-    get_team_multi_collection_vectorstores
+    get_team_multi_collection_vectorstores,
+    get_team_vector_storage
 )
 
 
+# 3軸のクエリ生成・検索・リランクを並行実行するスレッドプール（プロセス内の全SearchAgentで共有、v3.3.0）
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_lock = threading.Lock()
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """検索用スレッドプールを取得（初回呼び出し時に作成）"""
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=config.SEARCH_MAX_WORKERS,
+                thread_name_prefix="search"
+            )
+        return _search_executor
+
+
+class SearchCancelled(Exception):
+    """検索が中断された（SSEのクライアントの切断等、v3.3.0）"""
+
+
+def _supports_temperature(model_name: str) -> bool:
+    """temperatureパラメータをサポートするモデルかどうか判定"""
+    no_temp_models = ['o1', 'o1-mini', 'o1-preview', 'o3', 'o3-mini', 'o4-mini', 'gpt-5']
+    return not any(m in model_name for m in no_temp_models)
+
+
+class AgentResources:
+    """SearchAgentが使用するクライアント・辞書・vectorstore（v3.3.0）
+
+    リクエストごとに変わらないもの（チーム・モデル・APIキーで決まるもの）をまとめ、
+    get_agent_resources() でプロセス内の複数のリクエストから共有する。
+    検索モード・プロンプト等のリクエストごとの設定は持たない
+    """
+
+    def __init__(
+        self,
+        openai_api_key: str,
+        cohere_api_key: str,
+        embedding_model: str,
+        search_llm_model: str,
+        summary_llm_model: str,
+        team_id: str = None
+    ):
+        """
+        Args:
+            openai_api_key: OpenAI APIキー
+            cohere_api_key: Cohere APIキー
+            embedding_model: Embeddingモデル名
+            search_llm_model: 検索・判定用LLMモデル名
+            summary_llm_model: 要約生成用LLMモデル名
+            team_id: チームID
+        """
+        self.team_id = team_id
+
+        # v3.3.0: 作成時点の破棄世代番号（他のワーカーでの辞書変更・リセットの検知に使用）
+        # 作成中の変更も検知できるよう、辞書・vectorstoreの読み込みより前に取得する
+        self.invalidation_generation = _get_invalidation_generation(team_id)
+
+        # Cohere クライアント
+        self.cohere_client = cohere.Client(cohere_api_key)
+
+        # 正規化辞書
+        self.norm_map, _ = load_master_dict()
+
+        # 同義語辞書（v3.2.1: クエリ展開用）
+        self.synonym_dict = get_synonym_dictionary(team_id)
+
+        # セマンティック検索バックエンド（v3.3.0）"chroma" | "numpy"
+        self.dense_backend = get_dense_backend(team_id)
+
+        # Embedding関数（v3.3.0: クエリEmbeddingキャッシュを前段に配置）
+        self.embedding_function = CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=embedding_model,
+                api_key=openai_api_key
+            ),
+            model=embedding_model,
+            cache=get_query_embedding_cache()
+        )
+
+        # Vector Store（v3.2.0: 2コレクション対応に変更、v3.2.2: 常に2コレクション取得に変更）
+        if team_id:
+            # チームモード: 常に2コレクションを取得（3軸検索の有効/無効に関わらず）
+            # これにより、3軸検索が無効でもcombinedコレクションで検索可能
+            self.vectorstores = get_team_multi_collection_vectorstores(
+                team_id=team_id,
+                embeddings=self.embedding_function,
+                embedding_model=embedding_model
+            )
+            # vectorstoreはcombinedを参照（単一クエリ検索時に使用）
+            self.vectorstore = self.vectorstores["combined"]
+            # v3.3.0: コレクションのベクトル保存形式（reduced/int8の場合はクエリも縮約して検索）
+            self.vector_storage = get_team_vector_storage(team_id)
+            print(f"2コレクションモード: materials_methods, combined vectorstores初期化完了")
+        else:
+            # 後方互換性: team_idがない場合はグローバルを使用
+            self.vectorstores = None
+            self.vectorstore = get_chroma_vectorstore(
+                self.embedding_function,
+                embedding_model=embedding_model
+            )
+            self.vector_storage = {"mode": "float32", "dimensions": None}
+
+        # LLM（v3.0: 2段階選択対応）
+        # 検索・判定用LLM（正規化、クエリ生成に使用）
+        search_llm_kwargs = {
+            "model": search_llm_model,
+            "api_key": openai_api_key,
+            "seed": 42  # v3.2.4: 再現性のためseedを固定
+        }
+        if _supports_temperature(search_llm_model):
+            search_llm_kwargs["temperature"] = 0
+        self.search_llm = ChatOpenAI(**search_llm_kwargs)
+        # v3.3.0: temperature 0で呼び出せるモデルのみ応答をキャッシュ（非対応のモデルは同じ入力でも応答が変わる）
+        self.search_llm_deterministic = search_llm_kwargs.get("temperature") == 0
+
+        # 要約生成用LLM（比較ノードに使用）
+        summary_llm_kwargs = {
+            "model": summary_llm_model,
+            "api_key": openai_api_key,
+            "seed": 42  # v3.2.4: 再現性のためseedを固定
+        }
+        if _supports_temperature(summary_llm_model):
+            summary_llm_kwargs["temperature"] = 0
+        self.summary_llm = ChatOpenAI(**summary_llm_kwargs)
+
+        # v3.3.0: 作成時点のコレクションID（他のワーカーでのリセットによる作り直しの検知に使用）
+        self.collection_ids = self._get_collection_ids()
+
+    def _get_collection_ids(self) -> Optional[tuple]:
+        """vectorstoreが参照するコレクションの現在のIDを取得（コレクションが削除されている場合はNone）"""
+        vectorstores = list(self.vectorstores.values()) if self.vectorstores else [self.vectorstore]
+        try:
+            return tuple(
+                str(vectorstore._client.get_collection(vectorstore._collection.name).id)
+                for vectorstore in vectorstores
+            )
+        except Exception:
+            return None
+
+    def is_current(self) -> bool:
+        """作成後に他のワーカーを含めて破棄・コレクションの作り直しが行われていないか
+
+        破棄世代番号（辞書の変更・取り込み・リセット時に invalidate_agent_resources() が進める）と
+        コレクションIDを作成時点と比較する。BM25インデックス・埋め込み行列は検索ごとに
+        コレクションの世代番号で検証されるため、ここでは比較しない
+
+        Returns:
+            bool: そのまま使用できる場合True
+        """
+        if _get_invalidation_generation(self.team_id) != self.invalidation_generation:
+            return False
+        return self.collection_ids is not None and self._get_collection_ids() == self.collection_ids
+
+
+# AgentResourcesのプール（プロセス内で共有、v3.3.0）
+# キー: (チームID, Embeddingモデル, 検索用LLM, 要約用LLM, OpenAI APIキーのハッシュ, Cohere APIキーのハッシュ)
+# 値: (AgentResources, 最終使用時刻)
+_agent_resources: "OrderedDict[tuple, tuple]" = OrderedDict()
+_agent_resources_lock = threading.Lock()
+_agent_resources_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "stale": 0}
+
+# 破棄世代番号の名前（EMBEDDING_CACHE_DIR/collection_generations.json に保存し、ワーカー間で共有）
+_INVALIDATION_GENERATION_PREFIX = "agent_resources:"
+_INVALIDATION_GENERATION_ALL = _INVALIDATION_GENERATION_PREFIX + "*"
+
+
+def _get_invalidation_generation(team_id: Optional[str]) -> tuple:
+    """全体とチームの破棄世代番号を取得"""
+    return (
+        get_named_generation(config.EMBEDDING_CACHE_DIR, _INVALIDATION_GENERATION_ALL),
+        get_named_generation(config.EMBEDDING_CACHE_DIR, _INVALIDATION_GENERATION_PREFIX + (team_id or ""))
+    )
+
+
+def get_agent_resources(
+    openai_api_key: str,
+    cohere_api_key: str,
+    embedding_model: str,
+    search_llm_model: str,
+    summary_llm_model: str,
+    team_id: str = None
+) -> AgentResources:
+    """共有のAgentResourcesを取得（プールにない場合は作成して登録）
+
+    AGENT_POOL_MAX_SIZE件を超えた場合は最も古く使われたものから破棄し、
+    AGENT_POOL_IDLE_TTL秒使われていないもの、他のワーカーで破棄・コレクションの作り直しが
+    行われたもの（AgentResources.is_current()）は作り直す。
+    AGENT_POOL_ENABLEDがFalseの場合は毎回作成する
+
+    Returns:
+        AgentResources
+    """
+    if not config.AGENT_POOL_ENABLED:
+        return AgentResources(openai_api_key, cohere_api_key, embedding_model, search_llm_model, summary_llm_model, team_id)
+
+    key = (
+        team_id or "",
+        embedding_model,
+        search_llm_model,
+        summary_llm_model,
+        hashlib.sha256((openai_api_key or "").encode("utf-8")).hexdigest(),
+        hashlib.sha256((cohere_api_key or "").encode("utf-8")).hexdigest()
+    )
+    now = time.time()
+    with _agent_resources_lock:
+        entry = _agent_resources.get(key)
+    if entry is not None and now - entry[1] <= config.AGENT_POOL_IDLE_TTL:
+        # 検証はファイル・Chromaの読み込みを伴うため、ロックの外で行う
+        if entry[0].is_current():
+            with _agent_resources_lock:
+                if _agent_resources.get(key) is entry:
+                    _agent_resources[key] = (entry[0], now)
+                    _agent_resources.move_to_end(key)
+                _agent_resources_stats["hits"] += 1
+            return entry[0]
+        with _agent_resources_lock:
+            _agent_resources_stats["stale"] += 1
+    with _agent_resources_lock:
+        _agent_resources_stats["misses"] += 1
+
+    # 作成には辞書の読み込み・Chromaの初期化を伴うため、ロックの外で行う
+    resources = AgentResources(openai_api_key, cohere_api_key, embedding_model, search_llm_model, summary_llm_model, team_id)
+
+    with _agent_resources_lock:
+        _agent_resources[key] = (resources, time.time())
+        _agent_resources.move_to_end(key)
+        while len(_agent_resources) > config.AGENT_POOL_MAX_SIZE:
+            _agent_resources.popitem(last=False)
+            _agent_resources_stats["evictions"] += 1
+    return resources
+
+
+def invalidate_agent_resources(team_id: str = None) -> int:
+    """プール内のAgentResourcesを破棄（次回のリクエストで作り直す）
+
+    辞書（マスター辞書・同義語辞書）の変更、ノートの取り込み、コレクションのリセット後に呼び出す。
+    破棄世代番号を進めるため、他のワーカーのプールにあるものも次回の取得時に作り直される
+
+    Args:
+        team_id: 対象のチームID（Noneの場合は全件）
+
+    Returns:
+        int: 破棄した件数
+    """
+    with _agent_resources_lock:
+        keys = [key for key in _agent_resources if team_id is None or key[0] == team_id]
+        for key in keys:
+            del _agent_resources[key]
+        _agent_resources_stats["invalidations"] += len(keys)
+    advance_named_generation(
+        config.EMBEDDING_CACHE_DIR,
+        _INVALIDATION_GENERATION_ALL if team_id is None else _INVALIDATION_GENERATION_PREFIX + team_id
+    )
+    return len(keys)
+
+
+def get_agent_pool_stats() -> dict:
+    """AgentResourcesプールの統計情報を取得
+
+    Returns:
+        dict: 件数、ヒット/ミス件数、ヒット率、破棄件数
+    """
+    with _agent_resources_lock:
+        stats = dict(_agent_resources_stats)
+        stats["size"] = len(_agent_resources)
+    total = stats["hits"] + stats["misses"]
+    stats["max_size"] = config.AGENT_POOL_MAX_SIZE
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
+
+
 # --- State定義 ---
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
@@ -66,6 +356,26 @@ class AgentState(TypedDict):
     method_axis_results: List[tuple]  # 方法軸の検索結果 [(doc, score), ...]
     combined_axis_results: List[tuple]  # 総合軸の検索結果 [(doc, score), ...]
 
+    run_id: str  # v3.3.0: グラフの実行ID（投機的に開始したクエリ生成の参照に使用）
+
+
+# 分類と並行して開始したクエリ生成（v3.3.0）{実行ID: {軸: (重点指示, Future)}}
+# stateにはシリアライズ可能な値のみを持たせるため、Futureは実行IDごとにここで管理する
+_speculative_queries: Dict[str, Dict[str, Tuple[str, Future]]] = {}
+_speculative_queries_lock = threading.Lock()
+
+
+def _take_speculative_queries(run_id: Optional[str]) -> Dict[str, Tuple[str, Future]]:
+    """実行IDの投機的クエリ生成を取り出す（取り出したものは呼び出し側が使用・破棄する）"""
+    with _speculative_queries_lock:
+        return _speculative_queries.pop(run_id, {}) if run_id else {}
+
+
+def _discard_speculative_queries(run_id: str) -> None:
+    """実行の終了時に、使用されなかった投機的クエリ生成を取り消す（開始前のもののみ取り消される）"""
+    for _, future in _take_speculative_queries(run_id).values():
+        future.cancel()
+
 
 class SearchAgent:
     """検索エージェント（プロンプト・モデルを動的設定可能）"""
@@ -131,75 +441,34 @@ class SearchAgent:
         # プロンプト設定（カスタムまたはデフォルト）
         self.prompts = prompts or {}
 
-        # Cohere クライアント
-        self.cohere_client = cohere.Client(cohere_api_key)
-
-        # 正規化辞書
-        self.norm_map, _ = load_master_dict()
-
-        # 同義語辞書（v3.2.1: クエリ展開用）
-        self.synonym_dict = get_synonym_dictionary(team_id)
-
-        # Embedding関数
-        self.embedding_function = OpenAIEmbeddings(
-            model=self.embedding_model,
-            api_key=self.openai_api_key
+        # v3.3.0: 中断フラグ（run / stream で指定、セットされた場合はノードの開始時・外部API呼び出しの前に中断）
+        self.cancel_event: Optional[threading.Event] = None
+
+        # v3.3.0: クライアント・辞書・vectorstore等はプロセス内で共有（チーム・モデル・APIキーごと）
+        resources = get_agent_resources(
+            openai_api_key=openai_api_key,
+            cohere_api_key=cohere_api_key,
+            embedding_model=self.embedding_model,
+            search_llm_model=self.search_llm_model,
+            summary_llm_model=self.summary_llm_model,
+            team_id=team_id
         )
-
-        # Vector Store（v3.2.0: 2コレクション対応に変更、v3.2.2: 常に2コレクション取得に変更）
-        if team_id:
-            # チームモード: 常に2コレクションを取得（3軸検索の有効/無効に関わらず）
-            # これにより、3軸検索が無効でもcombinedコレクションで検索可能
-            self.vectorstores = get_team_multi_collection_vectorstores(
-                team_id=team_id,
-                embeddings=self.embedding_function,
-                embedding_model=self.embedding_model
-            )
-            # vectorstoreはcombinedを参照（単一クエリ検索時に使用）
-            self.vectorstore = self.vectorstores["combined"]
-            if self.multi_axis_enabled:
-                print(f"2コレクションモード（3軸検索有効）: materials_methods, combined vectorstores初期化完了")
-            else:
-                print(f"2コレクションモード（単一クエリ検索）: combinedコレクションを使用")
-        else:
-            # 後方互換性: team_idがない場合はグローバルを使用
-            self.vectorstores = None
-            self.vectorstore = get_chroma_vectorstore(
-                self.embedding_function,
-                embedding_model=self.embedding_model
-            )
-
-        # LLM（v3.0: 2段階選択対応）
-        # temperatureをサポートしないモデルの判定
-        def supports_temperature(model_name: str) -> bool:
-            """temperatureパラメータをサポートするモデルかどうか判定"""
-            no_temp_models = ['o1', 'o1-mini', 'o1-preview', 'o3-mini', 'gpt-5-mini', 'gpt-5-nano']
-            return not any(m in model_name for m in no_temp_models)
-
-        # 検索・判定用LLM（正規化、クエリ生成に使用）
-        search_llm_kwargs = {
-            "model": self.search_llm_model,
-            "api_key": self.openai_api_key,
-            "seed": 42  # v3.2.4: 再現性のためseedを固定
-        }
-        if supports_temperature(self.search_llm_model):
-            search_llm_kwargs["temperature"] = 0
-        self.search_llm = ChatOpenAI(**search_llm_kwargs)
-
-        # 要約生成用LLM（比較ノードに使用）
-        summary_llm_kwargs = {
-            "model": self.summary_llm_model,
-            "api_key": self.openai_api_key,
-            "seed": 42  # v3.2.4: 再現性のためseedを固定
-        }
-        if supports_temperature(self.summary_llm_model):
-            summary_llm_kwargs["temperature"] = 0
-        self.summary_llm = ChatOpenAI(**summary_llm_kwargs)
+        self.cohere_client = resources.cohere_client
+        self.norm_map = resources.norm_map
+        self.synonym_dict = resources.synonym_dict
+        self.dense_backend = resources.dense_backend
+        self.embedding_function = resources.embedding_function
+        self.vectorstores = resources.vectorstores
+        self.vectorstore = resources.vectorstore
+        self.vector_storage = resources.vector_storage
+        self.search_llm = resources.search_llm
+        self.search_llm_deterministic = resources.search_llm_deterministic
+        self.summary_llm = resources.summary_llm
         # 後方互換性: self.llmはsearch_llmを参照
         self.llm = self.search_llm
 
-        # グラフを構築
-        self.graph = self._build_graph()
+        # v3.3.0: グラフはプロセス内で1回だけ構築・コンパイルしたものを共有
+        self.graph = get_search_graph()
 
     def _get_prompt(self, prompt_type: str) -> str:
         """プロンプトを取得（カスタムまたはデフォルト）
@@ -212,6 +481,11 @@ class SearchAgent:
             return custom
         return get_default_prompt(prompt_type)
 
+    def _check_cancelled(self) -> None:
+        """中断フラグがセットされている場合はSearchCancelledを送出（v3.3.0）"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SearchCancelled("検索が中断されました")
+
     def _normalize_node(self, state: AgentState):
         """正規化ノード"""
         start_time = time.time()
@@ -333,9 +607,7 @@ class SearchAgent:
             user_focus_instruction=instruction
         )
 
-        response = self.llm.invoke(prompt)
-
-        content = response.content.strip()
+        raw_content = self._invoke_search_llm(prompt, required_key="queries")
 
         # JSONを抽出（マークダウンブロック、余計なテキストに対応）
         def extract_json(text: str) -> str:
@@ -351,7 +623,7 @@ class SearchAgent:
                 return json_match.group(0)
             return text
 
-        content = extract_json(content)
+        content = extract_json(raw_content)
 
         try:
             data = json.loads(content)
@@ -369,7 +641,7 @@ class SearchAgent:
 
         except Exception as e:
             print(f"  > ⚠️ Query Parse Error: {e}")
-            print(f"  > Raw response: {response.content[:200]}...")
+            print(f"  > Raw response: {raw_content[:200]}...")
             # フォールバック: 入力をそのままクエリとして使用
             combined_query = f"{state.get('input_purpose') or ''} {state.get('normalized_materials') or ''} {instruction}"
             print(f"  > Fallback query: {combined_query[:100]}...")
@@ -411,27 +683,87 @@ class SearchAgent:
         Returns:
             List of (doc, score) tuples
         """
-        # クエリを同義語展開
-        expanded_queries = self._expand_query_with_synonyms(query)
+        return self._search_axes_on_vectorstore(
+            vectorstore,
+            axis_queries={"query": query},
+            axis_modes={"query": search_mode},
+            hybrid_alpha=hybrid_alpha,
+            k=k
+        )["query"]
+
+    def _search_axes_on_vectorstore(
+        self,
+        vectorstore,
+        axis_queries: Dict[str, str],
+        axis_modes: Dict[str, str],
+        hybrid_alpha: float,
+        k: int = 30
+    ) -> Dict[str, List[tuple]]:
+        """同じvectorstoreを検索する複数の軸の候補をまとめて取得（v3.3.0）
 
-        if len(expanded_queries) > 1:
-            print(f"    > 同義語展開: {len(expanded_queries)}クエリに展開")
+        材料軸（キーワード）と方法軸（セマンティック）のように同じコレクションを検索する軸について、
+        BM25インデックスの取得を1回、セマンティック側（全軸の全展開クエリ）を1回のEmbedding +
+        1回のベクトル検索で行い、軸ごとに同義語展開の結果をマージする
 
-        # 各クエリで検索し、結果をマージ
-        all_results = {}  # {note_id: (doc, max_score)}
+        Args:
+            vectorstore: 検索対象のvectorstore
+            axis_queries: {軸: 検索クエリ}
+            axis_modes: {軸: 検索モード}
+            hybrid_alpha: ハイブリッド検索の重み
+            k: 返却する上位件数
+
+        Returns:
+            {軸: List of (doc, score) tuples}
+        """
+        # クエリを同義語展開
+        expanded = {}
+        for axis, query in axis_queries.items():
+            expanded[axis] = self._expand_query_with_synonyms(query)
+            if len(expanded[axis]) > 1:
+                print(f"    > 同義語展開: {len(expanded[axis])}クエリに展開")
+
+        # セマンティック側（semantic/hybrid）の全展開クエリをまとめて検索
+        dense_axes = [axis for axis in expanded if axis_modes[axis] in ("semantic", "hybrid")]
+        dense_queries = [query for axis in dense_axes for query in expanded[axis]]
+        query_embeddings = vectorstore.embeddings.embed_documents(dense_queries) if dense_queries else []
+        semantic_result_sets = self._semantic_search_batch(
+            vectorstore, dense_queries, k=k, query_embeddings=query_embeddings
+        )
+
+        index = None
+        if any(axis_modes[axis] in ("keyword", "hybrid") for axis in expanded):
+            index = get_collection_index(vectorstore)
 
-        for eq in expanded_queries:
-            # 検索モードに応じた検索実行
+        results = {}
+        offset = 0
+        for axis, queries in expanded.items():
+            search_mode = axis_modes[axis]
             if search_mode == "keyword":
-                results = self._keyword_search_on_vectorstore(vectorstore, eq, k=k)
-            elif search_mode == "hybrid":
-                results = self._hybrid_search_on_vectorstore(vectorstore, eq, alpha=hybrid_alpha, k=k)
+                # v3.3.0: キーワード検索は全展開クエリを1回の疎行列積でまとめてスコアリング
+                result_sets = [self._keyword_search_on_vectorstore(vectorstore, queries, k=k, index=index)]
             else:
-                # セマンティック検索
-                docs = vectorstore.similarity_search_with_relevance_scores(eq, k=k)
-                results = [(doc, score) for doc, score in docs]
+                axis_slice = slice(offset, offset + len(queries))
+                offset += len(queries)
+                result_sets = semantic_result_sets[axis_slice]
+                if search_mode == "hybrid":
+                    # v3.3.0: セマンティック・キーワード候補をまとめて統合スコアリング
+                    result_sets = hybrid_search(
+                        vectorstore,
+                        index,
+                        queries,
+                        query_embeddings[axis_slice],
+                        result_sets,
+                        self.vector_storage,
+                        alpha=hybrid_alpha,
+                        k=k
+                    )
+            results[axis] = self._merge_results_by_note(result_sets, k)
+        return results
 
-            # 結果をマージ（同じノートは最高スコアを採用）
+    def _merge_results_by_note(self, result_sets: List[List[tuple]], k: int = 30) -> List[tuple]:
+        """展開クエリごとの結果をマージ（同じノートは最高スコアを採用）"""
+        all_results = {}  # {note_id: (doc, max_score)}
+        for results in result_sets:
             for doc, score in results:
                 note_id = doc.metadata.get('note_id', doc.metadata.get('source', doc.page_content[:50]))
                 if note_id not in all_results or score > all_results[note_id][1]:
@@ -442,6 +774,79 @@ class SearchAgent:
         merged_results.sort(key=lambda x: x[1], reverse=True)
         return merged_results[:k]
 
+    def _search_single_query(
+        self,
+        vectorstore,
+        query: str,
+        search_mode: str,
+        hybrid_alpha: float,
+        k: int = 30
+    ) -> List[tuple]:
+        """単一クエリで検索モードに応じた検索を実行"""
+        if search_mode == "keyword":
+            return self._keyword_search_on_vectorstore(vectorstore, query, k=k)
+        elif search_mode == "hybrid":
+            return self._hybrid_search_on_vectorstore(vectorstore, query, alpha=hybrid_alpha, k=k)
+        else:
+            # セマンティック検索
+            return self._semantic_search_batch(vectorstore, [query], k=k)[0]
+
+    def _semantic_search_batch(
+        self,
+        vectorstore,
+        queries: List[str],
+        k: int = 30,
+        query_embeddings: List[List[float]] = None
+    ) -> List[List[tuple]]:
+        """複数クエリのセマンティック検索をまとめて実行（v3.3.0）
+
+        全クエリを1回のembed_documentsでベクトル化し、1回のChromaクエリ（query_embeddings）で検索する。
+        スコアはsimilarity_search_with_relevance_scoresと同じ関連度（コレクションの距離関数に応じて変換）
+        v3.3.0: numpyバックエンドの場合はメモリ上の埋め込み行列で厳密検索する
+        v3.3.0: reduced/int8形式のコレクションでは縮約したクエリで検索し、
+        int8形式では候補を多めに取得して全次元のクエリベクトルで再スコアリングする
+
+        Args:
+            vectorstore: 検索対象のvectorstore
+            queries: 検索クエリのリスト
+            k: クエリごとの上位件数
+            query_embeddings: ベクトル化済みのクエリ（省略時はqueriesをベクトル化）
+
+        Returns:
+            クエリごとの (doc, score) タプルのリスト
+        """
+        from langchain_core.documents import Document
+
+        if not queries:
+            return []
+
+        if query_embeddings is None:
+            query_embeddings = vectorstore.embeddings.embed_documents(list(queries))
+        search_embeddings = reduce_embeddings(query_embeddings, self.vector_storage)
+        rescore = self.vector_storage.get("mode") == "int8"
+        n_results = k * config.VECTOR_RESCORE_MULTIPLIER if rescore else k
+
+        if self.dense_backend == "numpy":
+            result_sets = dense_search(vectorstore, search_embeddings, k=n_results)
+            return rescore_results(vectorstore, query_embeddings, result_sets, k) if rescore else result_sets
+
+        results = vectorstore._collection.query(
+            query_embeddings=search_embeddings,
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
+        )
+        relevance_score_fn = vectorstore._select_relevance_score_fn()
+
+        result_sets = []
+        for ids, documents, metadatas, distances in zip(
+            results["ids"], results["documents"], results["metadatas"], results["distances"]
+        ):
+            result_sets.append([
+                (Document(page_content=document, metadata=metadata or {}, id=doc_id), relevance_score_fn(distance))
+                for doc_id, document, metadata, distance in zip(ids, documents, metadatas, distances)
+            ])
+        return rescore_results(vectorstore, query_embeddings, result_sets, k) if rescore else result_sets
+
     def _keyword_search(self, query: str, k: int = 30) -> List[tuple]:
         """キーワード検索（BM25ベース）
 
@@ -452,63 +857,7 @@ class SearchAgent:
         Returns:
             List of (doc, score) tuples sorted by score descending
         """
-        import math
-        from collections import Counter
-
-        # ChromaDBから全ドキュメントを取得
-        collection = self.vectorstore._collection
-        all_docs = collection.get(include=["documents", "metadatas"])
-
-        if not all_docs["documents"]:
-            return []
-
-        documents = all_docs["documents"]
-        metadatas = all_docs["metadatas"]
-
-        # クエリをトークン化（簡易的な日本語対応）
-        query_tokens = self._tokenize(query)
-
-        # BM25パラメータ
-        k1 = 1.5
-        b = 0.75
-
-        # 文書長の平均を計算
-        doc_lengths = [len(self._tokenize(doc)) for doc in documents]
-        avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 1
-
-        # IDF計算
-        N = len(documents)
-        idf = {}
-        for token in query_tokens:
-            df = sum(1 for doc in documents if token in doc.lower())
-            idf[token] = math.log((N - df + 0.5) / (df + 0.5) + 1)
-
-        # BM25スコア計算
-        scores = []
-        for i, doc in enumerate(documents):
-            doc_tokens = self._tokenize(doc)
-            doc_len = len(doc_tokens)
-            term_freq = Counter(doc_tokens)
-
-            score = 0
-            for token in query_tokens:
-                if token in term_freq:
-                    tf = term_freq[token]
-                    numerator = tf * (k1 + 1)
-                    denominator = tf + k1 * (1 - b + b * doc_len / avgdl)
-                    score += idf.get(token, 0) * numerator / denominator
-
-            # Document objectを作成
-            from langchain_core.documents import Document
-            doc_obj = Document(
-                page_content=doc,
-                metadata=metadatas[i] if metadatas else {}
-            )
-            scores.append((doc_obj, score))
-
-        # スコア降順でソート
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:k]
+        return self._keyword_search_on_vectorstore(self.vectorstore, query, k=k)
 
     def _tokenize(self, text: str) -> List[str]:
         """テキストをトークン化（簡易的な日本語対応）
@@ -519,28 +868,7 @@ class SearchAgent:
         Returns:
             トークンのリスト
         """
-        # 小文字化
-        text = text.lower()
-
-        # 日本語と英語を分離してトークン化
-        # 簡易的に空白、句読点、特殊文字で分割
-        import re
-        # 日本語の場合は文字単位で2-gramを生成
-        tokens = []
-
-        # 英数字の単語を抽出
-        words = re.findall(r'[a-z0-9]+', text)
-        tokens.extend(words)
-
-        # 日本語部分を抽出（ひらがな、カタカナ、漢字）
-        japanese_text = re.sub(r'[a-z0-9\s\.,!?:;()\[\]{}\-_]+', '', text)
-        # 2-gramで分割（より精度の高いマッチングのため）
-        for i in range(len(japanese_text) - 1):
-            tokens.append(japanese_text[i:i+2])
-        # 1-gramも追加
-        tokens.extend(list(japanese_text))
-
-        return tokens
+        return tokenize(text)
 
     def _hybrid_search(self, query: str, alpha: float, k: int = 30) -> List[tuple]:
         """ハイブリッド検索（セマンティック + キーワード）
@@ -553,52 +881,7 @@ class SearchAgent:
         Returns:
             List of (doc, score) tuples sorted by combined score descending
         """
-        # セマンティック検索
-        semantic_results = self.vectorstore.similarity_search_with_relevance_scores(query, k=k)
-
-        # キーワード検索
-        keyword_results = self._keyword_search(query, k=k)
-
-        # スコアの正規化と統合
-        doc_scores = {}
-
-        # セマンティック検索結果をスコア付け
-        if semantic_results:
-            max_semantic = max(score for _, score in semantic_results)
-            min_semantic = min(score for _, score in semantic_results)
-            range_semantic = max_semantic - min_semantic if max_semantic != min_semantic else 1
-
-            for doc, score in semantic_results:
-                # 0-1に正規化
-                normalized_score = (score - min_semantic) / range_semantic if range_semantic > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.page_content[:50])
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['semantic'] = normalized_score
-
-        # キーワード検索結果をスコア付け
-        if keyword_results:
-            max_keyword = max(score for _, score in keyword_results)
-            min_keyword = min(score for _, score in keyword_results)
-            range_keyword = max_keyword - min_keyword if max_keyword != min_keyword else 1
-
-            for doc, score in keyword_results:
-                # 0-1に正規化
-                normalized_score = (score - min_keyword) / range_keyword if range_keyword > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.page_content[:50])
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['keyword'] = normalized_score
-
-        # 統合スコア計算
-        combined_results = []
-        for doc_id, scores in doc_scores.items():
-            combined_score = alpha * scores['semantic'] + (1 - alpha) * scores['keyword']
-            combined_results.append((scores['doc'], combined_score))
-
-        # スコア降順でソート
-        combined_results.sort(key=lambda x: x[1], reverse=True)
-        return combined_results[:k]
+        return self._hybrid_search_on_vectorstore(self.vectorstore, query, alpha=alpha, k=k)
 
     def _search_node(self, state: AgentState):
         """検索 & Cohereリランキングノード（v3.0.1: 検索モード対応）"""
@@ -646,9 +929,11 @@ class SearchAgent:
                 return {"retrieved_docs": [], "iteration": state.get("iteration", 0) + 1}
 
             # Cohere Rerank
+            self._check_cancelled()
             documents_content = [doc.page_content for doc in candidates]
 
-            rerank_results = self.cohere_client.rerank(
+            rerank_results = rerank(
+                self.cohere_client,
                 model=config.DEFAULT_RERANK_MODEL,
                 query=query,
                 documents=documents_content,
@@ -669,7 +954,7 @@ class SearchAgent:
             display_limit = config.RERANK_TOP_N if evaluation_mode else config.UI_DISPLAY_TOP_N
 
             rank_counter = 0  # 重複除去後のランク
-            for i, result in enumerate(rerank_results.results):
+            for i, result in enumerate(rerank_results):
                 original_doc = candidates[result.index]
                 source_id = original_doc.metadata.get('source', 'unknown')
                 score = result.relevance_score
@@ -697,6 +982,8 @@ class SearchAgent:
                 print(f"  --------------------------------------------------")
                 print(f"  > UI向けに上位 {len(docs_for_ui)} 件を選択しました。")
 
+        except SearchCancelled:
+            raise
         except Exception as e:
             print(f"  > ⚠️ Search/Rerank Error: {e}")
             docs_for_ui = []
@@ -731,10 +1018,42 @@ class SearchAgent:
             return json_match.group(0)
         return text
 
+    def _invoke_search_llm(self, prompt: str, required_key: str = None) -> str:
+        """検索用LLMを呼び出し、応答本文を返す（v3.3.0）
+
+        検索用LLMはseed固定・temperature 0のため、同じモデル・プロンプトの応答をキャッシュから返す。
+        JSONオブジェクトとして解釈でき、required_keyの値が空でない応答のみキャッシュする
+        （解釈できない応答をキャッシュから繰り返し返さないため）
+        temperature 0で呼び出せないモデル（o1 / gpt-5 系等）の応答はキャッシュしない
+
+        Args:
+            prompt: 埋め込み済みのプロンプト
+            required_key: 応答のJSONに必須のキー（"queries" 等、Noneの場合はJSONとして解釈できればよい）
+        """
+        cache = get_llm_response_cache() if self.search_llm_deterministic else None
+        if cache is not None:
+            content = cache.get(self.team_id, self.search_llm_model, prompt)
+            if content is not None:
+                print(f"    > LLM応答キャッシュを使用")
+                return content
+
+        content = self.search_llm.invoke(prompt).content.strip()
+
+        if cache is not None:
+            try:
+                data = json.loads(self._extract_json_from_response(content))
+            except json.JSONDecodeError:
+                data = None
+            if isinstance(data, dict) and (required_key is None or data.get(required_key)):
+                cache.put(self.team_id, self.search_llm_model, prompt, content)
+        return content
+
     def _classify_focus_node(self, state: AgentState):
         """重点指示分類ノード（v3.1.0）
 
         重点指示をLLMで解析し、材料/方法/両方/なしを判定する
+        v3.3.0: 判定が明確な重点指示はキーワードで分類し、判定できない場合・カスタムの分類プロンプトがある場合はLLMを使用する
+        v3.3.0: 分類のLLM呼び出しと並行して3軸クエリ生成を投機的に開始する（SPECULATIVE_QUERY_GENERATION）
         """
         start_time = time.time()
         evaluation_mode = state.get("evaluation_mode", False)
@@ -749,17 +1068,41 @@ class SearchAgent:
         # 重点指示が空の場合は"none"
         if not instruction or instruction.strip() in ['', '特になし', 'なし']:
             print(f"  > 重点指示が空のため、分類をスキップ: none")
+            record_focus_classification("skip")
             elapsed_time = time.time() - start_time
             print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
             return {"focus_classification": "none"}
 
+        # v3.3.0: 判定が明確な重点指示はキーワードで分類（LLMを呼ばない）
+        # カスタムの分類プロンプトがある場合は判定基準が異なり得るため、常にLLMで分類する
+        custom_prompt = self.prompts.get("focus_classification")
+        if config.FOCUS_RULE_CLASSIFIER_ENABLED and not (custom_prompt and custom_prompt.strip()):
+            rule_result = classify_focus_by_rules(instruction)
+            if rule_result:
+                classification, reason = rule_result
+                record_focus_classification("rule")
+                print(f"  > 分類結果: {classification}（ルールベース）")
+                print(f"  > 理由: {reason}")
+                elapsed_time = time.time() - start_time
+                print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+                return {"focus_classification": classification}
+            print(f"  > ルールで判定できないため、LLMで分類")
+
+        # v3.3.0: 分類のLLM呼び出しと並行して、クエリ生成を投機的に開始
+        # （実行IDがない場合は終了時に取り消せないため開始しない）
+        run_id = state.get("run_id")
+        if config.SPECULATIVE_QUERY_GENERATION and run_id:
+            speculative_queries = self._start_speculative_queries(state, instruction)
+            with _speculative_queries_lock:
+                _speculative_queries[run_id] = speculative_queries
+
         # LLMで分類
+        record_focus_classification("llm")
         prompt_template = self._get_prompt("focus_classification")
         prompt = prompt_template.format(user_focus_instruction=instruction)
 
         try:
-            response = self.search_llm.invoke(prompt)
-            content = self._extract_json_from_response(response.content.strip())
+            content = self._extract_json_from_response(self._invoke_search_llm(prompt, required_key="classification"))
             data = json.loads(content)
             classification = data.get("classification", "both")
             reason = data.get("reason", "")
@@ -780,10 +1123,50 @@ class SearchAgent:
         print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
         return {"focus_classification": classification}
 
+    def _get_axis_instructions(self, classification: str, instruction: str) -> Dict[str, str]:
+        """分類結果に応じて各軸のクエリ生成に適用する重点指示を決定
+
+        Returns:
+            {軸: 重点指示（適用しない場合は空文字）}
+        """
+        return {
+            # 材料軸に重点指示を適用するかどうか
+            "material": instruction if classification in ["materials", "both"] else "",
+            # 方法軸に重点指示を適用するかどうか
+            "method": instruction if classification in ["methods", "both"] else "",
+            # 総合軸は常に重点指示を適用
+            "combined": instruction
+        }
+
+    def _start_speculative_queries(self, state: AgentState, instruction: str) -> dict:
+        """重点指示の分類結果を待たずにクエリ生成を開始（v3.3.0）
+
+        総合軸は分類結果に関わらず重点指示を使うため常に開始する。
+        材料軸・方法軸は config.SPECULATIVE_FOCUS_PREDICTION の分類結果を予測として開始し、
+        予測が外れた軸はクエリ生成ノードで破棄して生成し直す
+
+        Returns:
+            {軸: (使用した重点指示, Future)}
+        """
+        axis_instructions = self._get_axis_instructions(config.SPECULATIVE_FOCUS_PREDICTION or "", instruction)
+        axes = ["combined"]
+        if config.SPECULATIVE_FOCUS_PREDICTION:
+            axes += ["material", "method"]
+
+        self._check_cancelled()
+        executor = get_search_executor()
+        print(f"  > 投機的クエリ生成を開始: {', '.join(axes)}（予測: {config.SPECULATIVE_FOCUS_PREDICTION or 'なし'}）")
+        return {
+            axis: (axis_instructions[axis], executor.submit(self._generate_axis_query, axis, dict(state), axis_instructions[axis]))
+            for axis in axes
+        }
+
     def _generate_multi_axis_queries_node(self, state: AgentState):
         """3軸クエリ生成ノード（v3.1.0）
 
         材料軸、方法軸、総合軸のクエリを生成する
+        v3.3.0: 3軸のLLM呼び出しを並行実行する
+        v3.3.0: 重点指示分類ノードで投機的に開始した生成は、重点指示の適用が一致する軸のみ使用する
         """
         start_time = time.time()
         evaluation_mode = state.get("evaluation_mode", False)
@@ -796,87 +1179,113 @@ class SearchAgent:
         focus_class = state.get('focus_classification', 'none')
         instruction = state.get('user_focus_instruction', '')
 
-        # 材料軸に重点指示を適用するかどうか
-        apply_focus_to_material = focus_class in ["materials", "both"]
-        # 方法軸に重点指示を適用するかどうか
-        apply_focus_to_method = focus_class in ["methods", "both"]
-
-        material_instruction = instruction if apply_focus_to_material else ""
-        method_instruction = instruction if apply_focus_to_method else ""
+        axis_instructions = self._get_axis_instructions(focus_class, instruction)
+
+        # v3.3.0: 3軸のLLM呼び出しは互いに独立しているため、スレッドプールで並行実行
+        print("  📦 材料軸 / 🔧 方法軸 / 🎯 総合軸クエリを並行生成中...")
+        self._check_cancelled()
+        executor = get_search_executor()
+        speculative_queries = _take_speculative_queries(state.get("run_id"))
+        futures = {}
+        reused, discarded = [], []
+        for axis, axis_instruction in axis_instructions.items():
+            speculative = speculative_queries.get(axis)
+            if speculative and speculative[0] == axis_instruction:
+                # v3.3.0: 分類と並行して開始した生成結果を使用
+                futures[axis] = speculative[1]
+                reused.append(axis)
+                continue
+            if speculative:
+                # 予測が外れた投機実行は破棄（開始前であれば取り消す）
+                speculative[1].cancel()
+                discarded.append(axis)
+            futures[axis] = executor.submit(self._generate_axis_query, axis, state, axis_instruction)
+        if reused or discarded:
+            print(f"  > 投機的クエリ生成: 使用 {reused or 'なし'} / 破棄 {discarded or 'なし'}")
 
         queries = {}
+        for axis, future in futures.items():
+            axis_label = {"material": "材料", "method": "方法", "combined": "総合"}[axis]
+            try:
+                queries[axis] = future.result()
+                print(f"    > {axis_label}軸: {queries[axis][:80]}...")
+            except Exception as e:
+                print(f"    > ⚠️ {axis_label}軸クエリ生成エラー: {e}")
+                if axis == "method":
+                    import traceback
+                    traceback.print_exception(type(e), e, e.__traceback__)
+                queries[axis] = self._fallback_axis_query(axis, state)
 
-        # 材料軸クエリ生成
-        try:
-            print("  📦 材料軸クエリを生成中...")
-            material_prompt = self._get_prompt("material_query_generation").format(
+        elapsed_time = time.time() - start_time
+        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+
+        return {
+            "material_query": queries["material"],
+            "method_query": queries["method"],
+            "combined_query": queries["combined"]
+        }
+
+    def _generate_axis_query(self, axis: str, state: AgentState, instruction: str) -> str:
+        """1軸分のクエリをLLMで生成（v3.3.0: 3軸を並行実行するため分離）
+
+        Args:
+            axis: "material" | "method" | "combined"
+            state: エージェントの状態
+            instruction: 軸に適用する重点指示（適用しない場合は空文字）
+
+        Returns:
+            str: 生成したクエリ（LLMの応答にクエリがない場合は入力から組み立てたクエリ）
+
+        Raises:
+            Exception: LLM呼び出し・応答の解析に失敗した場合（フォールバックは呼び出し側で行う）
+        """
+        if axis == "material":
+            prompt = self._get_prompt("material_query_generation").format(
                 normalized_materials=state.get('normalized_materials', ''),
-                user_focus_instruction=material_instruction or "特になし"
+                user_focus_instruction=instruction or "特になし"
             )
-            response = self.search_llm.invoke(material_prompt)
-            content = self._extract_json_from_response(response.content.strip())
-            data = json.loads(content)
-            queries["material"] = data.get("query", state.get('normalized_materials', ''))
-            print(f"    > {queries['material'][:80]}...")
-        except Exception as e:
-            print(f"    > ⚠️ 材料軸クエリ生成エラー: {e}")
-            queries["material"] = state.get('normalized_materials', '')
-
-        # 方法軸クエリ生成
-        try:
-            print("  🔧 方法軸クエリを生成中...")
+        elif axis == "method":
             # v3.2.0: デバッグログ追加
             materials_for_method = state.get('normalized_materials', '')
             methods_input = state.get('input_methods', '')
             print(f"    [DEBUG] 材料情報: {materials_for_method[:100]}..." if materials_for_method else "    [DEBUG] 材料情報: なし")
             print(f"    [DEBUG] 方法入力: {methods_input[:100]}..." if methods_input else "    [DEBUG] 方法入力: なし")
 
-            method_prompt = self._get_prompt("method_query_generation").format(
+            prompt = self._get_prompt("method_query_generation").format(
                 normalized_materials=materials_for_method,  # v3.2.0: 材料情報を追加
                 input_methods=methods_input,
-                user_focus_instruction=method_instruction or "特になし"
+                user_focus_instruction=instruction or "特になし"
             )
-            print(f"    [DEBUG] プロンプト長: {len(method_prompt)}文字")
-
-            response = self.search_llm.invoke(method_prompt)
-            content = self._extract_json_from_response(response.content.strip())
-            print(f"    [DEBUG] LLM応答: {content[:200]}...")
-            data = json.loads(content)
-            queries["method"] = data.get("query", state.get('input_methods', ''))
-            print(f"    > {queries['method'][:80]}...")
-        except Exception as e:
-            print(f"    > ⚠️ 方法軸クエリ生成エラー: {e}")
-            import traceback
-            traceback.print_exc()
-            queries["method"] = state.get('input_methods', '')
-
-        # 総合軸クエリ生成
-        try:
-            print("  🎯 総合軸クエリを生成中...")
-            combined_prompt = self._get_prompt("combined_query_generation").format(
+            print(f"    [DEBUG] プロンプト長: {len(prompt)}文字")
+        else:
+            prompt = self._get_prompt("combined_query_generation").format(
                 input_purpose=state.get('input_purpose', ''),
                 normalized_materials=state.get('normalized_materials', ''),
                 input_methods=state.get('input_methods', ''),
                 user_focus_instruction=instruction or "特になし"
             )
-            response = self.search_llm.invoke(combined_prompt)
-            content = self._extract_json_from_response(response.content.strip())
-            data = json.loads(content)
-            combined_queries = data.get("queries", [])
-            queries["combined"] = " ".join(combined_queries) if combined_queries else f"{state.get('input_purpose', '')} {state.get('normalized_materials', '')} {state.get('input_methods', '')}"
-            print(f"    > {queries['combined'][:80]}...")
-        except Exception as e:
-            print(f"    > ⚠️ 総合軸クエリ生成エラー: {e}")
-            queries["combined"] = f"{state.get('input_purpose', '')} {state.get('normalized_materials', '')} {state.get('input_methods', '')}"
-
-        elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
 
-        return {
-            "material_query": queries["material"],
-            "method_query": queries["method"],
-            "combined_query": queries["combined"]
-        }
+        # 材料軸・方法軸は "query"、総合軸は "queries" を返す
+        required_key = "queries" if axis == "combined" else "query"
+        content = self._extract_json_from_response(self._invoke_search_llm(prompt, required_key=required_key))
+        if axis == "method":
+            print(f"    [DEBUG] LLM応答: {content[:200]}...")
+        data = json.loads(content)
+
+        if axis == "material":
+            return data.get("query", state.get('normalized_materials', ''))
+        if axis == "method":
+            return data.get("query", state.get('input_methods', ''))
+        combined_queries = data.get("queries", [])
+        return " ".join(combined_queries) if combined_queries else self._fallback_axis_query("combined", state)
+
+    def _fallback_axis_query(self, axis: str, state: AgentState) -> str:
+        """クエリ生成に失敗した場合の軸ごとのクエリ（入力をそのまま使用）"""
+        if axis == "material":
+            return state.get('normalized_materials', '')
+        if axis == "method":
+            return state.get('input_methods', '')
+        return f"{state.get('input_purpose', '')} {state.get('normalized_materials', '')} {state.get('input_methods', '')}"
 
     def _multi_axis_search_node(self, state: AgentState):
         """3軸検索実行ノード（v3.2.0: 2コレクション + 軸別検索方式対応）
@@ -885,6 +1294,8 @@ class SearchAgent:
         - 材料軸: materials_methods_collectionをBM25キーワード検索
         - 方法軸: materials_methods_collectionをセマンティック検索
         - 総合軸: combined_collectionをセマンティック検索
+        v3.3.0: 材料軸・方法軸はmaterials_methods_collectionの候補取得を共有する
+        v3.3.0: コレクションごとの検索と各軸のリランクをスレッドプールで並行実行する
         """
         start_time = time.time()
         evaluation_mode = state.get("evaluation_mode", False)
@@ -915,12 +1326,52 @@ class SearchAgent:
             "combined": config.AXIS_SEARCH_MODES.get("combined", "semantic")   # セマンティック検索
         }
 
-        # 各軸で検索を実行
-        for axis, query in [
-            ("material", state.get("material_query", "")),
-            ("method", state.get("method_query", "")),
-            ("combined", state.get("combined_query", ""))
-        ]:
+        axis_queries = {
+            "material": state.get("material_query", ""),
+            "method": state.get("method_query", ""),
+            "combined": state.get("combined_query", "")
+        }
+
+        # v3.3.0: 同じコレクションを検索する軸（材料軸・方法軸）は候補取得をまとめて1回で行う
+        # {vectorstoreのid: (vectorstore, [軸])}
+        axis_groups = {}
+        for axis, query in axis_queries.items():
+            if query:
+                vectorstore = axis_vectorstores[axis]
+                axis_groups.setdefault(id(vectorstore), (vectorstore, []))[1].append(axis)
+
+        # v3.3.0: コレクションごとの検索をスレッドプールで並行実行
+        self._check_cancelled()
+        executor = get_search_executor()
+        group_futures = [
+            (axes, executor.submit(
+                self._search_axis_group,
+                vectorstore,
+                {axis: axis_queries[axis] for axis in axes},
+                {axis: axis_search_modes[axis] for axis in axes},
+                hybrid_alpha
+            ))
+            for vectorstore, axes in axis_groups.values()
+        ]
+        search_results = {}  # {軸: 検索結果 | 例外}
+        for axes, future in group_futures:
+            try:
+                search_results.update(future.result())
+            except Exception as e:
+                search_results.update({axis: e for axis in axes})
+
+        # v3.3.0: per_axisモードの場合、各軸のリランクも並行実行
+        rerank_futures = {}
+        if rerank_position == "per_axis" and rerank_enabled:
+            self._check_cancelled()
+            for axis, search_result in search_results.items():
+                if isinstance(search_result, list) and search_result:
+                    rerank_futures[axis] = executor.submit(
+                        self._rerank_axis_results, axis_queries[axis], search_result
+                    )
+
+        # 各軸の結果を表示
+        for axis, query in axis_queries.items():
             axis_label = {"material": "材料", "method": "方法", "combined": "総合"}[axis]
             target_vectorstore = axis_vectorstores[axis]
             search_mode = axis_search_modes[axis]
@@ -942,35 +1393,18 @@ class SearchAgent:
                 continue
 
             try:
-                # v3.2.0: 軸別検索方式を適用した検索
-                search_results = self._search_with_synonym_expansion(
-                    vectorstore=target_vectorstore,
-                    query=query,
-                    search_mode=search_mode,  # 軸別の検索方式を使用
-                    hybrid_alpha=hybrid_alpha,
-                    k=config.VECTOR_SEARCH_K
-                )
+                search_result = search_results[axis]
+                if isinstance(search_result, Exception):
+                    raise search_result
 
-                print(f"  📋 候補数: {len(search_results)}件")
+                print(f"  📋 候補数: {len(search_result)}件")
 
                 # per_axisモードの場合、各軸でリランク
-                if rerank_position == "per_axis" and rerank_enabled and search_results:
+                if axis in rerank_futures:
                     print(f"  🔄 リランキング実行中...")
-                    docs_content = [doc.page_content for doc, _ in search_results]
-                    rerank_results = self.cohere_client.rerank(
-                        model=config.DEFAULT_RERANK_MODEL,
-                        query=query,
-                        documents=docs_content,
-                        top_n=min(config.RERANK_TOP_N, len(docs_content))
-                    )
-                    # リランク結果で並び替え
-                    reranked = []
-                    for r in rerank_results.results:
-                        original_doc = search_results[r.index][0]
-                        reranked.append((original_doc, r.relevance_score))
-                    results[axis] = reranked
+                    results[axis] = rerank_futures[axis].result()
                 else:
-                    results[axis] = search_results
+                    results[axis] = search_result
 
                 # v3.1.2: 上位10件の詳細を表示
                 final_results = results[axis]
@@ -1002,96 +1436,149 @@ class SearchAgent:
             "combined_axis_results": results.get("combined", [])
         }
 
-    def _keyword_search_on_vectorstore(self, vectorstore, query: str, k: int = 30) -> List[tuple]:
-        """指定されたvectorstoreでキーワード検索（v3.1.1追加）"""
-        import math
-        from collections import Counter
-        from langchain_core.documents import Document
-
-        collection = vectorstore._collection
-        all_docs = collection.get(include=["documents", "metadatas"])
-
-        if not all_docs["documents"]:
-            return []
-
-        documents = all_docs["documents"]
-        metadatas = all_docs["metadatas"]
+    def _search_axis_group(
+        self,
+        vectorstore,
+        axis_queries: Dict[str, str],
+        axis_modes: Dict[str, str],
+        hybrid_alpha: float
+    ) -> Dict[str, Union[List[tuple], Exception]]:
+        """同じvectorstoreを検索する軸のグループを検索（v3.3.0、スレッドプールで実行）
 
-        query_tokens = self._tokenize(query)
+        2軸以上の場合は候補取得を共有し、失敗した場合は軸ごとに検索する
 
-        k1 = 1.5
-        b = 0.75
+        Returns:
+            {軸: List of (doc, score) tuples | 発生した例外}
+        """
+        results = {}
+        if len(axis_queries) >= 2:
+            try:
+                results.update(self._search_axes_on_vectorstore(
+                    vectorstore,
+                    axis_queries=axis_queries,
+                    axis_modes=axis_modes,
+                    hybrid_alpha=hybrid_alpha,
+                    k=config.VECTOR_SEARCH_K
+                ))
+            except Exception as e:
+                # 失敗した場合は軸ごとに検索する（軸ごとのエラーを分離）
+                print(f"    > ⚠️ 候補の一括取得エラー（軸ごとに検索）: {e}")
 
-        doc_lengths = [len(self._tokenize(doc)) for doc in documents]
-        avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 1
+        for axis, query in axis_queries.items():
+            if axis in results:
+                continue
+            try:
+                # v3.2.0: 軸別検索方式を適用した検索
+                results[axis] = self._search_with_synonym_expansion(
+                    vectorstore=vectorstore,
+                    query=query,
+                    search_mode=axis_modes[axis],  # 軸別の検索方式を使用
+                    hybrid_alpha=hybrid_alpha,
+                    k=config.VECTOR_SEARCH_K
+                )
+            except Exception as e:
+                results[axis] = e
+        return results
+
+    def _rerank_axis_results(self, query: str, search_results: List[tuple]) -> List[tuple]:
+        """軸の検索結果をCohereでリランク（per_axisモード、v3.3.0: スレッドプールで実行）"""
+        docs_content = [doc.page_content for doc, _ in search_results]
+        rerank_results = rerank(
+            self.cohere_client,
+            model=config.DEFAULT_RERANK_MODEL,
+            query=query,
+            documents=docs_content,
+            top_n=min(config.RERANK_TOP_N, len(docs_content))
+        )
+        # リランク結果で並び替え
+        reranked = []
+        for r in rerank_results:
+            original_doc = search_results[r.index][0]
+            reranked.append((original_doc, r.relevance_score))
+        return reranked
+
+    def _keyword_search_on_vectorstore(
+        self,
+        vectorstore,
+        query: Union[str, List[str]],
+        k: int = 30,
+        index=None
+    ) -> List[tuple]:
+        """指定されたvectorstoreでキーワード検索（v3.1.1追加）
+
+        v3.3.0: コレクションごとのBM25転置インデックスを使用し、
+        クエリ語のpostingsのみを走査する。
+        クエリのリスト（同義語展開）を渡した場合はまとめてスコアリングし、文書ごとに最大スコアを採用する
+        v3.3.0: 上位k件の決定まではnote_idとスコアのみで行い、Documentは上位k件分だけ生成する
+        v3.3.0: 取得済みのBM25インデックス（index）を渡した場合はそれを使用する
+        v3.3.0: Documentはヒットした文書番号から生成し、同じnote_idの文書はスコアの高い1件のみ返す
+        """
+        from langchain_core.documents import Document
 
-        N = len(documents)
-        idf = {}
-        for token in query_tokens:
-            df = sum(1 for doc in documents if token in doc.lower())
-            idf[token] = math.log((N - df + 0.5) / (df + 0.5) + 1)
+        if index is None:
+            index = get_collection_index(vectorstore)
+
+        # 同じnote_idの文書で上位が埋まる場合は、k件の異なるノートが揃うまで取得件数を増やす
+        limit = k
+        while True:
+            hits = index.search(query, k=limit)
+            unique_hits: Dict[str, tuple] = {}
+            for doc_index, score in hits:
+                note_id = index.get_note_id(doc_index)
+                if note_id not in unique_hits:
+                    unique_hits[note_id] = (doc_index, score)
+            if len(unique_hits) >= k or len(hits) < limit or limit >= index.doc_count:
+                break
+            limit *= 2
 
-        scores = []
-        for i, doc in enumerate(documents):
-            doc_tokens = self._tokenize(doc)
-            doc_len = len(doc_tokens)
-            term_freq = Counter(doc_tokens)
+        results = []
+        for doc_index, score in list(unique_hits.values())[:k]:
+            doc_id, content, metadata = index.get_document(doc_index)
+            results.append((Document(page_content=content, metadata=metadata, id=doc_id), score))
+        return results
 
-            score = 0
-            for token in query_tokens:
-                if token in term_freq:
-                    tf = term_freq[token]
-                    numerator = tf * (k1 + 1)
-                    denominator = tf + k1 * (1 - b + b * doc_len / avgdl)
-                    score += idf.get(token, 0) * numerator / denominator
+    def _hybrid_search_on_vectorstore(
+        self,
+        vectorstore,
+        query: str,
+        alpha: float,
+        k: int = 30
+    ) -> List[tuple]:
+        """指定されたvectorstoreでハイブリッド検索（v3.1.1追加）"""
+        return self._hybrid_search_batch(vectorstore, [query], alpha=alpha, k=k)[0]
 
-            doc_obj = Document(
-                page_content=doc,
-                metadata=metadatas[i] if metadatas else {}
-            )
-            scores.append((doc_obj, score))
+    def _hybrid_search_batch(self, vectorstore, queries: List[str], alpha: float, k: int = 30) -> List[List[tuple]]:
+        """複数クエリのハイブリッド検索をまとめて実行（v3.3.0）
 
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:k]
+        セマンティック検索（1回のEmbedding + 1回のベクトル検索）とBM25検索の候補の和集合を
+        BM25インデックスの文書番号に揃え、両方のスコアを計算して統合する（hybrid_searchモジュール）
 
-    def _hybrid_search_on_vectorstore(self, vectorstore, query: str, alpha: float, k: int = 30) -> List[tuple]:
-        """指定されたvectorstoreでハイブリッド検索（v3.1.1追加）"""
-        semantic_results = vectorstore.similarity_search_with_relevance_scores(query, k=k)
-        keyword_results = self._keyword_search_on_vectorstore(vectorstore, query, k=k)
+        Args:
+            vectorstore: 検索対象のvectorstore
+            queries: 検索クエリのリスト
+            alpha: セマンティック検索の重み（0.0-1.0）
+            k: クエリごとの上位件数
 
-        doc_scores = {}
+        Returns:
+            クエリごとの (doc, score) タプルのリスト
+        """
+        if not queries:
+            return []
 
-        if semantic_results:
-            max_semantic = max(score for _, score in semantic_results)
-            min_semantic = min(score for _, score in semantic_results)
-            range_semantic = max_semantic - min_semantic if max_semantic != min_semantic else 1
-
-            for doc, score in semantic_results:
-                normalized_score = (score - min_semantic) / range_semantic if range_semantic > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.metadata.get('note_id', doc.page_content[:50]))
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['semantic'] = normalized_score
-
-        if keyword_results:
-            max_keyword = max(score for _, score in keyword_results)
-            min_keyword = min(score for _, score in keyword_results)
-            range_keyword = max_keyword - min_keyword if max_keyword != min_keyword else 1
-
-            for doc, score in keyword_results:
-                normalized_score = (score - min_keyword) / range_keyword if range_keyword > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.metadata.get('note_id', doc.page_content[:50]))
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['keyword'] = normalized_score
-
-        combined_results = []
-        for doc_id, scores in doc_scores.items():
-            combined_score = alpha * scores['semantic'] + (1 - alpha) * scores['keyword']
-            combined_results.append((scores['doc'], combined_score))
-
-        combined_results.sort(key=lambda x: x[1], reverse=True)
-        return combined_results[:k]
+        query_embeddings = vectorstore.embeddings.embed_documents(list(queries))
+        semantic_result_sets = self._semantic_search_batch(
+            vectorstore, queries, k=k, query_embeddings=query_embeddings
+        )
+        return hybrid_search(
+            vectorstore,
+            get_collection_index(vectorstore),
+            queries,
+            query_embeddings,
+            semantic_result_sets,
+            self.vector_storage,
+            alpha=alpha,
+            k=k
+        )
 
     def _score_fusion_node(self, state: AgentState):
         """スコア統合ノード（v3.1.1: note_idでの結果マージ対応）
@@ -1176,6 +1663,7 @@ class SearchAgent:
 
         # after_fusionモードの場合、統合後にリランク
         if rerank_position == "after_fusion" and rerank_enabled and final_scores:
+            self._check_cancelled()
             print(f"  > 統合後リランキング実行中...")
             # 上位候補に対してリランク
             top_candidates = final_scores[:config.RERANK_TOP_N * 2]  # 余裕を持って取得
@@ -1185,7 +1673,8 @@ class SearchAgent:
                 docs_content = [doc.page_content for doc, _, _ in top_candidates]
 
                 try:
-                    rerank_results = self.cohere_client.rerank(
+                    rerank_results = rerank(
+                        self.cohere_client,
                         model=config.DEFAULT_RERANK_MODEL,
                         query=combined_query,
                         documents=docs_content,
@@ -1193,7 +1682,7 @@ class SearchAgent:
                     )
                     # リランク結果で並び替え
                     reranked = []
-                    for r in rerank_results.results:
+                    for r in rerank_results:
                         doc, _, source_id = top_candidates[r.index]
                         reranked.append((doc, r.relevance_score, source_id))
                     final_scores = reranked
@@ -1288,98 +1777,9 @@ class SearchAgent:
         print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec (using {self.summary_llm_model})")
         return {"messages": [response]}
 
-    def _should_compare(self, state: AgentState):
-        """compareノードに進むべきかを判定"""
-        evaluation_mode = state.get("evaluation_mode", False)
-        if evaluation_mode:
-            return END
-        else:
-            return "compare"
-
-    def _should_use_multi_axis(self, state: AgentState):
-        """3軸検索を使用するかどうかを判定"""
-        multi_axis_enabled = state.get("multi_axis_enabled", self.multi_axis_enabled)
-        if multi_axis_enabled:
-            return "classify_focus"
-        else:
-            return "generate_query"
-
-    def _should_compare_multi_axis(self, state: AgentState):
-        """3軸検索後にcompareノードに進むべきかを判定"""
-        evaluation_mode = state.get("evaluation_mode", False)
-        if evaluation_mode:
-            return END
-        else:
-            return "compare"
-
-    def _build_graph(self):
-        """グラフを構築（v3.1.0: 3軸分離検索対応）"""
-        workflow = StateGraph(AgentState)
-
-        # 共通ノード
-        workflow.add_node("normalize", self._normalize_node)
-        workflow.add_node("compare", self._compare_node)
-
-        # 従来の単一クエリ検索ノード
-        workflow.add_node("generate_query", self._generate_query_node)
-        workflow.add_node("search", self._search_node)
-
-        # 3軸分離検索ノード（v3.1.0）
-        workflow.add_node("classify_focus", self._classify_focus_node)
-        workflow.add_node("generate_multi_axis_queries", self._generate_multi_axis_queries_node)
-        workflow.add_node("multi_axis_search", self._multi_axis_search_node)
-        workflow.add_node("score_fusion", self._score_fusion_node)
-
-        # エントリーポイント
-        workflow.set_entry_point("normalize")
-
-        # normalize後に3軸検索か従来検索かを分岐
-        workflow.add_conditional_edges(
-            "normalize",
-            self._should_use_multi_axis,
-            {
-                "classify_focus": "classify_focus",
-                "generate_query": "generate_query"
-            }
-        )
-
-        # 従来の検索フロー
-        workflow.add_edge("generate_query", "search")
-        workflow.add_conditional_edges(
-            "search",
-            self._should_compare,
-            {
-                "compare": "compare",
-                END: END
-            }
-        )
-
-        # 3軸分離検索フロー
-        workflow.add_edge("classify_focus", "generate_multi_axis_queries")
-        workflow.add_edge("generate_multi_axis_queries", "multi_axis_search")
-        workflow.add_edge("multi_axis_search", "score_fusion")
-        workflow.add_conditional_edges(
-            "score_fusion",
-            self._should_compare_multi_axis,
-            {
-                "compare": "compare",
-                END: END
-            }
-        )
-
-        # 比較ノードから終了
-        workflow.add_edge("compare", END)
-
-        return workflow.compile()
-
-    def run(self, input_data: dict, evaluation_mode: bool = False):
-        """エージェントを実行
-
-        Args:
-            input_data: 検索条件（purpose, materials, methods等）
-            evaluation_mode: 評価モード（True: 比較省略、Top10返却、False: 通常動作）
-        """
-        initial_state = {
+    def _initial_state(self, input_data: dict, evaluation_mode: bool) -> dict:
+        """グラフの初期状態を作成"""
+        return {
             "messages": [HumanMessage(content=json.dumps(input_data, ensure_ascii=False))],
             "input_purpose": "",
             "input_materials": "",
@@ -1406,8 +1806,213 @@ class SearchAgent:
             "combined_query": "",
             "material_axis_results": [],
             "method_axis_results": [],
-            "combined_axis_results": []
+            "combined_axis_results": [],
+            # v3.3.0: 実行ID
+            "run_id": uuid.uuid4().hex
         }
 
-        result = self.graph.invoke(initial_state)
+    def run(self, input_data: dict, evaluation_mode: bool = False, cancel_event: threading.Event = None):
+        """エージェントを実行
+
+        Args:
+            input_data: 検索条件（purpose, materials, methods等）
+            evaluation_mode: 評価モード（True: 比較省略、Top10返却、False: 通常動作）
+            cancel_event: 中断フラグ（v3.3.0、セットされた場合はSearchCancelledを送出）
+        """
+        self.cancel_event = cancel_event
+        initial_state = self._initial_state(input_data, evaluation_mode)
+
+        # v3.3.0: 共有のグラフに、このSearchAgentを実行時のコンテキストとして渡す
+        try:
+            result = self.graph.invoke(initial_state, config={"configurable": {SEARCH_AGENT_CONFIG_KEY: self}})
+        finally:
+            _discard_speculative_queries(initial_state["run_id"])
         return result
+
+    def stream(self, input_data: dict, evaluation_mode: bool = False, cancel_event: threading.Event = None) -> Iterator[dict]:
+        """エージェントを実行し、途中経過をイベントとして返す（v3.3.0）
+
+        Args:
+            input_data: 検索条件（purpose, materials, methods等）
+            evaluation_mode: 評価モード（True: 比較省略）
+            cancel_event: 中断フラグ（セットされた場合は次のノードの開始時・外部API呼び出しの前にSearchCancelledを送出）
+
+        Yields:
+            dict: 以下のいずれか
+                {"event": "node", "node": ノード名}  ノードの完了ごと
+                {"event": "results", "note_ids": [...], "retrieved_docs": [...]}  検索結果の確定時（search / score_fusion）
+                {"event": "token", "content": str}  比較・要約の生成中のトークン
+                {"event": "done", "message": str, "retrieved_docs": [...], "normalized_materials": str, "search_query": str}
+        """
+        self.cancel_event = cancel_event
+        initial_state = self._initial_state(input_data, evaluation_mode)
+        final_state = dict(initial_state)
+        final_message = ""
+
+        try:
+            # updates: ノードごとの更新、messages: ノード内のLLMのトークン（compareノードのみ転送）
+            for mode, chunk in self.graph.stream(
+                initial_state,
+                config={"configurable": {SEARCH_AGENT_CONFIG_KEY: self}},
+                stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "compare" and isinstance(message, AIMessageChunk) and message.content:
+                        yield {"event": "token", "content": message.content}
+                    continue
+
+                for node, update in chunk.items():
+                    update = update or {}
+                    if update.get("messages"):
+                        last_message = update["messages"][-1]
+                        final_message = getattr(last_message, "content", str(last_message))
+                    final_state.update({key: value for key, value in update.items() if key != "messages"})
+
+                    yield {"event": "node", "node": node}
+                    if node in ("search", "score_fusion"):
+                        retrieved_docs = update.get("retrieved_docs", [])
+                        yield {
+                            "event": "results",
+                            "note_ids": [
+                                match.group(1)
+                                for match in (_RETRIEVED_NOTE_ID_PATTERN.match(doc) for doc in retrieved_docs)
+                                if match
+                            ],
+                            "retrieved_docs": retrieved_docs
+                        }
+        finally:
+            # v3.3.0: 中断・エラー時を含め、使用されなかった投機的クエリ生成を取り消す
+            _discard_speculative_queries(initial_state["run_id"])
+
+        yield {
+            "event": "done",
+            "message": final_message,
+            "retrieved_docs": final_state.get("retrieved_docs", []),
+            "normalized_materials": final_state.get("normalized_materials", ""),
+            "search_query": final_state.get("search_query", "")
+        }
+
+
+# --- グラフ定義（v3.3.0: プロセス内で1回だけ構築・コンパイルし、全リクエストで共有） ---
+# ノードは実行時のconfig（configurable）から、そのリクエストのSearchAgentを取得して処理する
+SEARCH_AGENT_CONFIG_KEY = "search_agent"
+
+# retrieved_docsの先頭のノートID（"【実験ノートID: ID3-14】\n..."）
+_RETRIEVED_NOTE_ID_PATTERN = re.compile(r"【実験ノートID: (.+?)】")
+
+_search_graph = None
+_search_graph_lock = threading.Lock()
+
+
+def _agent_node(method_name: str):
+    """SearchAgentのノード処理を呼び出すノード関数を作成
+
+    Args:
+        method_name: SearchAgentのメソッド名（"_normalize_node" 等）
+    """
+    def node(state: AgentState, config: RunnableConfig):
+        agent = config["configurable"][SEARCH_AGENT_CONFIG_KEY]
+        # v3.3.0: 中断された検索は次のノードに進まない
+        agent._check_cancelled()
+        return getattr(agent, method_name)(state)
+
+    node.__name__ = method_name
+    return node
+
+
+def _should_compare(state: AgentState):
+    """compareノードに進むべきかを判定"""
+    evaluation_mode = state.get("evaluation_mode", False)
+    if evaluation_mode:
+        return END
+    else:
+        return "compare"
+
+
+def _should_use_multi_axis(state: AgentState):
+    """3軸検索を使用するかどうかを判定"""
+    multi_axis_enabled = state.get("multi_axis_enabled", config.MULTI_AXIS_ENABLED)
+    if multi_axis_enabled:
+        return "classify_focus"
+    else:
+        return "generate_query"
+
+
+def _should_compare_multi_axis(state: AgentState):
+    """3軸検索後にcompareノードに進むべきかを判定"""
+    evaluation_mode = state.get("evaluation_mode", False)
+    if evaluation_mode:
+        return END
+    else:
+        return "compare"
+
+
+def _build_graph():
+    """グラフを構築（v3.1.0: 3軸分離検索対応）"""
+    workflow = StateGraph(AgentState)
+
+    # 共通ノード
+    workflow.add_node("normalize", _agent_node("_normalize_node"))
+    workflow.add_node("compare", _agent_node("_compare_node"))
+
+    # 従来の単一クエリ検索ノード
+    workflow.add_node("generate_query", _agent_node("_generate_query_node"))
+    workflow.add_node("search", _agent_node("_search_node"))
+
+    # 3軸分離検索ノード（v3.1.0）
+    workflow.add_node("classify_focus", _agent_node("_classify_focus_node"))
+    workflow.add_node("generate_multi_axis_queries", _agent_node("_generate_multi_axis_queries_node"))
+    workflow.add_node("multi_axis_search", _agent_node("_multi_axis_search_node"))
+    workflow.add_node("score_fusion", _agent_node("_score_fusion_node"))
+
+    # エントリーポイント
+    workflow.set_entry_point("normalize")
+
+    # normalize後に3軸検索か従来検索かを分岐
+    workflow.add_conditional_edges(
+        "normalize",
+        _should_use_multi_axis,
+        {
+            "classify_focus": "classify_focus",
+            "generate_query": "generate_query"
+        }
+    )
+
+    # 従来の検索フロー
+    workflow.add_edge("generate_query", "search")
+    workflow.add_conditional_edges(
+        "search",
+        _should_compare,
+        {
+            "compare": "compare",
+            END: END
+        }
+    )
+
+    # 3軸分離検索フロー
+    workflow.add_edge("classify_focus", "generate_multi_axis_queries")
+    workflow.add_edge("generate_multi_axis_queries", "multi_axis_search")
+    workflow.add_edge("multi_axis_search", "score_fusion")
+    workflow.add_conditional_edges(
+        "score_fusion",
+        _should_compare_multi_axis,
+        {
+            "compare": "compare",
+            END: END
+        }
+    )
+
+    # 比較ノードから終了
+    workflow.add_edge("compare", END)
+
+    return workflow.compile()
+
+
+def get_search_graph():
+    """コンパイル済みの検索グラフを取得（初回呼び出し時に構築）"""
+    global _search_graph
+    with _search_graph_lock:
+        if _search_graph is None:
+            _search_graph = _build_graph()
+        return _search_graph
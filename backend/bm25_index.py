@@ -0,0 +1,1028 @@
+"""
+BM25転置インデックスモジュール（v3.3.0）
+
+キーワード検索（BM25）用の転置インデックスをChromaコレクションごとに保持する
+- term → postings（文書番号, tf）、文書長、平均文書長（avgdl）を管理
+- クエリ時はクエリ語のpostingsのみを走査する（全文書の再トークン化は行わない）
+- インデックスはプロセス内でキャッシュし、コレクションの件数が変わった場合に再構築する
+- v3.3.0: ingest_notesのバッチ登録に合わせて増分更新（コレクションID・件数・コレクションの世代番号でバージョン管理）
+  世代番号はcollection_generationモジュールでpersist_directory内に保存し、件数が変わらない更新や
+  他ワーカーでの登録も検知する
+- v3.3.0: persist_directory配下（bm25_index/）にバイナリ形式で保存し、mmapで読み込む
+  （uvicornの複数ワーカーで同じページを共有し、起動時の再トークン化を不要にする）
+- v3.3.0: NumPyによるベクトル化スコアリング。postingsを語×文書の疎行列として扱い、
+  同義語展開した複数クエリを1回の疎行列積（bincount）でまとめてスコアリングする
+- v3.3.0: MaxScoreによる上位k件検索。語ごとのスコア上限を使い、上位k件に入り得ない文書の
+  postings走査を打ち切る（頻出する1-gram/2-gramの全postings走査を回避、結果は厳密）
+- v3.3.0: トークン化はtokenizerモジュールに分離。メモリ上のインデックスは語を整数IDで管理する
+- v3.3.0: 検索は文書番号とスコアのみで行い、本文・メタデータはnote_id → 文書番号の表から
+  上位k件分だけ取り出す（Documentの生成は呼び出し側で上位k件のみ）
+- v3.3.0: ChromaのID → 文書番号の表も保持する（ハイブリッド検索でセマンティック検索の結果を
+  同じチャンクの文書番号に揃えるため。note_idの表は同じnote_idの最後のチャンクのみを指す）
+
+ファイル形式（リトルエンディアン、各セクションは8バイト境界に整列）:
+    ヘッダー: magic, 形式バージョン, generation, 文書数, 語彙数, 総文書長, コレクションの世代番号, コレクションID
+    セクション表: 各セクションの (offset, size)
+    term_offsets    uint64[語彙数+1]  terms内の各語のバイト位置
+    terms           UTF-8（コードポイント順にソート済み、二分探索で引く）
+    posting_offsets uint32[語彙数+1]  各語のpostings範囲
+    posting_docs    uint32[総posting数]  文書番号（語ごとに昇順）
+    posting_tfs     uint32[総posting数]  tf
+    term_max_tfs    uint32[語彙数]  語ごとの最大tf（MaxScoreの上限計算用）
+    term_min_lengths uint32[語彙数] 語を含む文書の最小文書長（同上）
+    doc_lengths     uint32[文書数]
+    doc_offsets     uint64[文書数+1]  docs内の各文書のバイト位置
+    docs            JSON [id, 本文, メタデータ] を連結したUTF-8
+    note_ids        JSON 文書番号順のnote_idリスト（初回のnote_id検索時に読み込む）
+    doc_ids         JSON 文書番号順のChromaのIDリスト（初回のID検索時に読み込む）
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from collection_generation import get_generation
+from config import config
+from tokenizer import Vocabulary, iter_tokens, tokenize_query
+
+
+# BM25パラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# インデックスファイル設定
+INDEX_DIR_NAME = "bm25_index"
+INDEX_FILE_SUFFIX = ".bm25"
+_MAGIC = b"BM25IDX1"
+_FORMAT_VERSION = 5
+# magic, format_version, generation, doc_count, term_count, total_length, collection_generation, collection_id
+_HEADER = struct.Struct("<8sIIIIQQ64s")
+_SECTIONS = (
+    "term_offsets", "terms",
+    "posting_offsets", "posting_docs", "posting_tfs",
+    "term_max_tfs", "term_min_lengths",
+    "doc_lengths", "doc_offsets", "docs", "note_ids", "doc_ids"
+)
+_SECTION_TABLE = struct.Struct("<" + "QQ" * len(_SECTIONS))
+_ALIGNMENT = 8
+
+# MaxScoreの打ち切り判定に使う浮動小数点誤差の許容幅（上限を僅かに大きく見積もる）
+_BOUND_SLACK = 1e-9
+
+
+class Postings(NamedTuple):
+    """1語分のpostings"""
+    doc_indices: np.ndarray  # 文書番号（昇順）
+    tfs: np.ndarray  # tf
+    max_tf: int  # 最大tf
+    min_length: int  # 語を含む文書の最小文書長
+
+
+def _term_weights(tfs, doc_lengths, avgdl: float):
+    """BM25のtf飽和項 tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)) を計算"""
+    numerator = tfs * (BM25_K1 + 1)
+    denominator = tfs + BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avgdl)
+    return numerator / denominator
+
+
+def _kth_largest(scores: np.ndarray, k: int) -> float:
+    """k番目に大きいスコア（k件未満の場合は0）"""
+    if len(scores) < k:
+        return 0.0
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+
+class _BM25Base(ABC):
+    """BM25スコア計算の共通処理（メモリ上/mmapのインデックスで共有）"""
+
+    name: str
+    collection_id: str
+    collection_generation: int
+    generation: int
+    total_length: int
+
+    @property
+    @abstractmethod
+    def doc_count(self) -> int:
+        """登録文書数"""
+
+    @property
+    def avgdl(self) -> float:
+        """平均文書長"""
+        return self.total_length / self.doc_count if self.doc_count else 1
+
+    @abstractmethod
+    def get_postings(self, term: str) -> Optional[Postings]:
+        """語のpostingsを取得（存在しない場合はNone）"""
+
+    @abstractmethod
+    def get_document(self, doc_index: int) -> Tuple[str, str, dict]:
+        """文書を (ChromaのID, 本文, メタデータ) で取得"""
+
+    @abstractmethod
+    def get_note_id(self, doc_index: int) -> str:
+        """文書番号に対応するnote_idを取得"""
+
+    @abstractmethod
+    def find_note(self, note_id: str) -> Optional[int]:
+        """note_idに対応する文書番号を取得（存在しない場合はNone）"""
+
+    @abstractmethod
+    def find_document(self, doc_id: str) -> Optional[int]:
+        """ChromaのIDに対応する文書番号を取得（存在しない場合はNone）"""
+
+    def get_note(self, note_id: str) -> Optional[Tuple[str, dict]]:
+        """note_idに対応する文書を (本文, メタデータ) で取得（存在しない場合はNone）"""
+        doc_index = self.find_note(note_id)
+        if doc_index is None:
+            return None
+        _, content, metadata = self.get_document(doc_index)
+        return content, metadata
+
+    def is_current(self, collection, count: int = None, collection_generation: int = None) -> bool:
+        """インデックスがコレクションの現在の状態と一致しているか判定
+
+        Args:
+            collection: chromadbのCollection
+            count: コレクションの件数（取得済みの場合）
+            collection_generation: コレクションの現在の世代番号（Noneの場合は比較しない）
+
+        Returns:
+            bool: 一致していればTrue
+        """
+        if self.collection_id != str(collection.id):
+            return False
+        if collection_generation is not None and self.collection_generation != collection_generation:
+            return False
+        if count is None:
+            count = collection.count()
+        return self.doc_count == count
+
+    @abstractmethod
+    def get_doc_lengths_array(self) -> np.ndarray:
+        """全文書の文書長をNumPy配列で取得"""
+
+    def idf(self, df):
+        """文書頻度からIDFを計算（スカラー/NumPy配列の両方に対応）"""
+        n = self.doc_count
+        return np.log((n - df + 0.5) / (df + 0.5) + 1)
+
+    def score_queries(self, queries: List[str]) -> np.ndarray:
+        """複数クエリのBM25スコアをまとめて計算
+
+        クエリ×語の係数行列（qtf・IDF）と語×文書の重み行列（postings）の疎行列積を、
+        (クエリ番号, 文書番号) の座標に対する1回のbincountで計算する
+
+        Args:
+            queries: 検索クエリのリスト
+
+        Returns:
+            np.ndarray: shape (クエリ数, 文書数) のスコア行列
+        """
+        n = self.doc_count
+        if not n or not queries:
+            return np.zeros((len(queries), n))
+
+        avgdl = self.avgdl
+        doc_lengths = self.get_doc_lengths_array()
+
+        rows, weights = [], []
+        for query_index, query in enumerate(queries):
+            # 同一トークンが複数回現れる場合はその回数分スコアに加算（従来実装と同じ挙動）
+            for term, query_tf in Counter(tokenize_query(query)).items():
+                postings = self.get_postings(term)
+                if postings is None:
+                    continue
+
+                doc_indices = postings.doc_indices.astype(np.int64)
+                idf = self.idf(len(doc_indices))
+                weights.append(query_tf * idf * _term_weights(
+                    postings.tfs.astype(np.float64), doc_lengths[doc_indices], avgdl
+                ))
+                rows.append(doc_indices + query_index * n)
+
+        if not rows:
+            return np.zeros((len(queries), n))
+
+        scores = np.bincount(
+            np.concatenate(rows),
+            weights=np.concatenate(weights),
+            minlength=len(queries) * n
+        )
+        return scores.reshape(len(queries), n)
+
+    def score_documents(self, query: str, doc_indices: np.ndarray) -> np.ndarray:
+        """指定した文書のみのBM25スコアを計算（ハイブリッド検索の候補文書用）
+
+        クエリ語のpostingsを候補文書で二分探索し、候補文書の位置に加算する
+
+        Args:
+            query: 検索クエリ
+            doc_indices: 文書番号の配列（昇順、doc_count以上の番号はスコア0）
+
+        Returns:
+            np.ndarray: doc_indicesと同じ並びのスコア配列
+        """
+        doc_indices = np.asarray(doc_indices, dtype=np.int64)
+        scores = np.zeros(len(doc_indices))
+        if not self.doc_count or not len(doc_indices):
+            return scores
+
+        avgdl = self.avgdl
+        doc_lengths = self.get_doc_lengths_array()
+
+        for term, query_tf in Counter(tokenize_query(query)).items():
+            postings = self.get_postings(term)
+            if postings is None or not len(postings.doc_indices):
+                continue
+            positions = np.searchsorted(postings.doc_indices, doc_indices)
+            positions = np.minimum(positions, len(postings.doc_indices) - 1)
+            hit = postings.doc_indices[positions] == doc_indices
+            docs = doc_indices[hit]
+            scores[hit] += query_tf * self.idf(len(postings.doc_indices)) * _term_weights(
+                postings.tfs[positions[hit]].astype(np.float64), doc_lengths[docs], avgdl
+            )
+        return scores
+
+    def search_maxscore(self, query: str, k: int = 30) -> List[Tuple[int, float]]:
+        """MaxScoreによる上位k件検索（結果は全件スコアリングと同一）
+
+        語をスコア上限の降順に処理し、k番目のスコア（閾値）が残りの語の上限合計を超えた時点で、
+        以降の語は「まだ上位k件に入り得る候補文書」のみをpostingsから探して加算する。
+        IDFの低い頻出語（かな・漢字の1-gram等）の全postings走査を回避できる
+
+        Args:
+            query: 検索クエリ
+            k: 返却する上位件数
+
+        Returns:
+            List of (doc_index, score) tuples sorted by score descending
+        """
+        n = self.doc_count
+        if not n:
+            return []
+
+        avgdl = self.avgdl
+        doc_lengths = self.get_doc_lengths_array()
+
+        # (上限, 係数, postings)
+        terms = []
+        for term, query_tf in Counter(tokenize_query(query)).items():
+            postings = self.get_postings(term)
+            if postings is None:
+                continue
+            coef = query_tf * self.idf(len(postings.doc_indices))
+            upper_bound = coef * _term_weights(postings.max_tf, postings.min_length, avgdl)
+            terms.append((upper_bound, coef, postings))
+
+        if not terms:
+            return []
+
+        terms.sort(key=lambda x: -x[0])
+        # remaining[i]: i番目以降の語の上限合計（誤差分だけ大きく見積もる）
+        bounds = np.array([t[0] for t in terms])
+        remaining = np.append(np.cumsum(bounds[::-1])[::-1], 0.0) * (1 + _BOUND_SLACK)
+
+        # processed[i]: i番目より前の語の上限合計（どの文書のスコアもこれを超えない）
+        processed = np.concatenate(([0.0], np.cumsum(bounds)))
+
+        scores = np.zeros(n)
+        candidates = None  # None: 全文書が候補（必須語フェーズ）
+        is_candidate = None
+        threshold = 0.0
+        postings_since_check = 0
+
+        for i, (_, coef, postings) in enumerate(terms):
+            # 閾値（k番目のスコア）の計算は候補数に比例するコストがかかるため、
+            # 前回の計算以降に候補数の1/4以上のpostingsを加算した時だけ更新する（閾値は単調増加）
+            pool_size = n if candidates is None else len(candidates)
+            if processed[i] > remaining[i] and postings_since_check >= pool_size // 4:
+                postings_since_check = 0
+                if candidates is None:
+                    threshold = _kth_largest(scores, k)
+                    if threshold > 0 and remaining[i] < threshold:
+                        # 残りの語だけでは新たな文書が上位k件に入れない
+                        candidates = np.flatnonzero(scores + remaining[i] >= threshold)
+                        is_candidate = np.zeros(n, dtype=bool)
+                        is_candidate[candidates] = True
+                else:
+                    threshold = _kth_largest(scores[candidates], k)
+                    survivors = scores[candidates] + remaining[i] >= threshold
+                    is_candidate[candidates[~survivors]] = False
+                    candidates = candidates[survivors]
+
+            doc_indices = postings.doc_indices
+            if candidates is None:
+                # 必須語: 全postingsを加算
+                docs = doc_indices.astype(np.int64)
+                tfs = postings.tfs
+            elif len(doc_indices) <= 8 * len(candidates):
+                # 非必須語（postingsが短い）: postingsを候補フラグで絞り込む
+                hit = is_candidate[doc_indices]
+                docs = doc_indices[hit].astype(np.int64)
+                tfs = postings.tfs[hit]
+            else:
+                # 非必須語（postingsが長い）: 候補文書のみpostingsを二分探索
+                positions = np.searchsorted(doc_indices, candidates)
+                positions = np.minimum(positions, len(doc_indices) - 1)
+                hit = doc_indices[positions] == candidates
+                docs = candidates[hit]
+                tfs = postings.tfs[positions[hit]]
+
+            scores[docs] += coef * _term_weights(tfs.astype(np.float64), doc_lengths[docs], avgdl)
+            postings_since_check += len(docs)
+
+        if candidates is None:
+            return top_k(scores, k)
+
+        return [(int(candidates[i]), score) for i, score in top_k(scores[candidates], k)]
+
+    def search(self, query: Union[str, List[str]], k: int = 30) -> List[Tuple[int, float]]:
+        """BM25スコアで上位k件を検索
+
+        クエリ語のpostingsのみを走査してスコアを計算する。
+        複数クエリ（同義語展開）を渡した場合は文書ごとに最大スコアを採用する
+
+        Args:
+            query: 検索クエリ、またはクエリのリスト
+            k: 返却する上位件数
+
+        Returns:
+            List of (doc_index, score) tuples sorted by score descending
+        """
+        queries = [query] if isinstance(query, str) else list(query)
+        if not self.doc_count or not queries:
+            return []
+
+        if config.BM25_MAXSCORE_ENABLED and self.doc_count > k:
+            # クエリごとの厳密な上位k件を文書ごとの最大スコアでマージ
+            # （最大スコアでの上位k件は、いずれかのクエリの上位k件に必ず含まれる）
+            merged: Dict[int, float] = {}
+            for q in queries:
+                for doc_index, score in self.search_maxscore(q, k):
+                    if score > merged.get(doc_index, 0.0):
+                        merged[doc_index] = score
+            return sorted(merged.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+        scores = self.score_queries(queries).max(axis=0)
+        return top_k(scores, k)
+
+    def search_notes(self, query: Union[str, List[str]], k: int = 30) -> List[Tuple[str, float]]:
+        """BM25スコアで上位k件を検索し、note_idで返す（本文・メタデータは読み込まない）
+
+        Args:
+            query: 検索クエリ、またはクエリのリスト
+            k: 返却する上位件数
+
+        Returns:
+            List of (note_id, score) tuples sorted by score descending
+        """
+        return [(self.get_note_id(doc_index), score) for doc_index, score in self.search(query, k=k)]
+
+
+def top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """スコア配列から正のスコアを持つ上位k件を取得（argpartitionで部分ソート）
+
+    Args:
+        scores: 文書ごとのスコア配列
+        k: 返却する上位件数
+
+    Returns:
+        List of (doc_index, score) tuples sorted by score descending（同点は文書番号順）
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        # k番目のスコアと同点の文書はすべて残し、並べ替え後に文書番号順でk件に絞る
+        # （argpartitionは同点の文書を任意に選ぶため、MaxScore検索と結果が一致しなくなる）
+        kth_score = -np.partition(-scores[candidates], k - 1)[k - 1]
+        candidates = candidates[scores[candidates] >= kth_score]
+
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return [(int(candidates[i]), float(scores[candidates[i]])) for i in order]
+
+
+class BM25Index(_BM25Base):
+    """BM25転置インデックス（1コレクション分、メモリ上で更新可能）"""
+
+    def __init__(self, name: str = "", collection_id: str = "", collection_generation: int = 0):
+        """
+        Args:
+            name: インデックス名（コレクション名、ログ表示用）
+            collection_id: 対応するChromaコレクションのID（リセット後の再作成を検知するため）
+            collection_generation: 構築時点のコレクションの世代番号（件数が変わらない更新を検知するため）
+        """
+        self.name = name
+        self.collection_id = collection_id
+        self.collection_generation = collection_generation
+        self.generation = 0  # 更新のたびに増加するバージョン番号
+        self.dirty = False  # ディスク未保存の更新があるか
+
+        # 文書情報（文書番号 = リストのインデックス）
+        self.ids: List[str] = []  # ChromaのドキュメントID
+        self.documents: List[str] = []
+        self.metadatas: List[dict] = []
+        self.note_ids: List[str] = []
+        self.note_positions: Dict[str, int] = {}  # {note_id: 文書番号}
+        self.doc_positions: Dict[str, int] = {}  # {ChromaのID: 文書番号}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+
+        # 転置インデックス（語はVocabularyで整数IDに変換し、語IDをリストのインデックスとする）
+        self.vocabulary = Vocabulary()
+        self.posting_docs: List[array] = []  # 語ごとの文書番号
+        self.posting_tfs: List[array] = []  # 語ごとのtf
+        # 語ごとのスコア上限計算用（最大tf, 語を含む文書の最小文書長）
+        self.term_max_tfs = array("I")
+        self.term_min_lengths = array("I")
+
+    @property
+    def doc_count(self) -> int:
+        """登録文書数"""
+        return len(self.doc_lengths)
+
+    def get_postings(self, term: str) -> Optional[Postings]:
+        term_id = self.vocabulary.get_id(term)
+        if term_id is None:
+            return None
+        # 追記中の配列をバッファ共有しないようコピーを返す
+        return Postings(
+            doc_indices=np.array(self.posting_docs[term_id], dtype=np.uint32),
+            tfs=np.array(self.posting_tfs[term_id], dtype=np.uint32),
+            max_tf=self.term_max_tfs[term_id],
+            min_length=self.term_min_lengths[term_id]
+        )
+
+    def get_doc_lengths_array(self) -> np.ndarray:
+        # 追記中の配列をバッファ共有しないようコピーを返す
+        return np.array(self.doc_lengths, dtype=np.float64)
+
+    def get_document(self, doc_index: int) -> Tuple[str, str, dict]:
+        return self.ids[doc_index], self.documents[doc_index], self.metadatas[doc_index]
+
+    def get_note_id(self, doc_index: int) -> str:
+        return self.note_ids[doc_index]
+
+    def find_note(self, note_id: str) -> Optional[int]:
+        return self.note_positions.get(note_id)
+
+    def find_document(self, doc_id: str) -> Optional[int]:
+        return self.doc_positions.get(doc_id)
+
+    def add_documents(self, ids: List[str], documents: List[str], metadatas: List[dict] = None) -> None:
+        """文書をインデックスに追加
+
+        Args:
+            ids: ChromaのドキュメントIDリスト
+            documents: 文書本文のリスト
+            metadatas: メタデータのリスト
+        """
+        metadatas = metadatas or [{} for _ in documents]
+
+        intern = self.vocabulary.intern
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            doc_index = len(self.doc_lengths)
+            # トークン列は保持せず、語ごとの出現回数のみ集計する
+            term_counts = Counter(iter_tokens(document or ""))
+            doc_length = sum(term_counts.values())
+
+            self.ids.append(doc_id)
+            self.doc_positions[doc_id] = doc_index
+            self.documents.append(document or "")
+            self.metadatas.append(metadata or {})
+            self._add_note_id(resolve_note_id(doc_id, metadata), doc_index)
+            self.doc_lengths.append(doc_length)
+            self.total_length += doc_length
+
+            for term, tf in term_counts.items():
+                term_id = intern(term)
+                if term_id == len(self.posting_docs):
+                    self.posting_docs.append(array("I"))
+                    self.posting_tfs.append(array("I"))
+                    self.term_max_tfs.append(tf)
+                    self.term_min_lengths.append(doc_length)
+                else:
+                    if tf > self.term_max_tfs[term_id]:
+                        self.term_max_tfs[term_id] = tf
+                    if doc_length < self.term_min_lengths[term_id]:
+                        self.term_min_lengths[term_id] = doc_length
+                self.posting_docs[term_id].append(doc_index)
+                self.posting_tfs[term_id].append(tf)
+
+        self.generation += 1
+        self.dirty = True
+
+    def copy(self) -> 'BM25Index':
+        """更新用の複製を作成（検索中のインデックスを変更しないよう、追記される配列はすべて複製する）"""
+        index = BM25Index(
+            name=self.name,
+            collection_id=self.collection_id,
+            collection_generation=self.collection_generation
+        )
+        index.generation = self.generation
+        index.dirty = self.dirty
+        index.ids = list(self.ids)
+        index.documents = list(self.documents)
+        index.metadatas = list(self.metadatas)
+        index.note_ids = list(self.note_ids)
+        index.note_positions = dict(self.note_positions)
+        index.doc_positions = dict(self.doc_positions)
+        index.doc_lengths = array("I", self.doc_lengths)
+        index.total_length = self.total_length
+        index.vocabulary = Vocabulary(self.vocabulary.tokens)
+        index.posting_docs = [array("I", docs) for docs in self.posting_docs]
+        index.posting_tfs = [array("I", tfs) for tfs in self.posting_tfs]
+        index.term_max_tfs = array("I", self.term_max_tfs)
+        index.term_min_lengths = array("I", self.term_min_lengths)
+        return index
+
+    def _add_note_id(self, note_id: str, doc_index: int) -> None:
+        """note_idを登録（同じnote_idが複数ある場合は後から追加した文書を参照する）"""
+        self.note_ids.append(note_id)
+        self.note_positions[note_id] = doc_index
+
+    def save(self, path: str) -> None:
+        """インデックスをバイナリ形式で保存（一時ファイル経由でアトミックに置換）
+
+        Args:
+            path: 保存先ファイルパス
+        """
+        # ファイル上の語彙は二分探索のため語の順にソートする
+        tokens = self.vocabulary.tokens
+        term_ids = sorted(range(len(tokens)), key=tokens.__getitem__)
+
+        term_offsets = array("Q", [0])
+        terms_blob = bytearray()
+        posting_offsets = array("I", [0])
+        posting_docs = array("I")
+        posting_tfs = array("I")
+        term_max_tfs = array("I", [self.term_max_tfs[term_id] for term_id in term_ids])
+        term_min_lengths = array("I", [self.term_min_lengths[term_id] for term_id in term_ids])
+        for term_id in term_ids:
+            terms_blob += tokens[term_id].encode("utf-8")
+            term_offsets.append(len(terms_blob))
+            posting_docs.extend(self.posting_docs[term_id])
+            posting_tfs.extend(self.posting_tfs[term_id])
+            posting_offsets.append(len(posting_docs))
+
+        doc_offsets = array("Q", [0])
+        docs_blob = bytearray()
+        for doc_id, document, metadata in zip(self.ids, self.documents, self.metadatas):
+            docs_blob += json.dumps([doc_id, document, metadata], ensure_ascii=False).encode("utf-8")
+            doc_offsets.append(len(docs_blob))
+
+        sections = {
+            "term_offsets": term_offsets,
+            "terms": terms_blob,
+            "posting_offsets": posting_offsets,
+            "posting_docs": posting_docs,
+            "posting_tfs": posting_tfs,
+            "term_max_tfs": term_max_tfs,
+            "term_min_lengths": term_min_lengths,
+            "doc_lengths": self.doc_lengths,
+            "doc_offsets": doc_offsets,
+            "docs": docs_blob,
+            "note_ids": json.dumps(self.note_ids, ensure_ascii=False).encode("utf-8"),
+            "doc_ids": json.dumps(self.ids, ensure_ascii=False).encode("utf-8"),
+        }
+
+        header = _HEADER.pack(
+            _MAGIC, _FORMAT_VERSION, self.generation, self.doc_count,
+            len(term_ids), self.total_length, self.collection_generation, self.collection_id.encode("utf-8")
+        )
+
+        # セクションの配置を決定
+        layout = []
+        offset = _align(_HEADER.size + _SECTION_TABLE.size)
+        for section in _SECTIONS:
+            data = sections[section]
+            size = len(data) * data.itemsize if isinstance(data, array) else len(data)
+            layout.append((offset, size))
+            offset = _align(offset + size)
+        table = _SECTION_TABLE.pack(*[value for pair in layout for value in pair])
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(table)
+            for section, (offset, _) in zip(_SECTIONS, layout):
+                f.write(b"\0" * (offset - f.tell()))
+                data = sections[section]
+                f.write(data.tobytes() if isinstance(data, array) else bytes(data))
+        os.replace(tmp_path, path)
+
+        self.dirty = False
+
+    @classmethod
+    def from_collection(cls, collection, collection_generation: int = 0) -> 'BM25Index':
+        """Chromaコレクションの全文書からインデックスを構築
+
+        Args:
+            collection: chromadbのCollection
+            collection_generation: 読み込み前に取得したコレクションの世代番号
+
+        Returns:
+            BM25Index
+        """
+        index = cls(name=collection.name, collection_id=str(collection.id), collection_generation=collection_generation)
+        data = collection.get(include=["documents", "metadatas"])
+        index.add_documents(
+            ids=data.get("ids") or [],
+            documents=data.get("documents") or [],
+            metadatas=data.get("metadatas")
+        )
+        return index
+
+
+class MappedBM25Index(_BM25Base):
+    """mmapで開いたBM25インデックス（読み取り専用、ワーカー間でページを共有）"""
+
+    def __init__(self, path: str, name: str = ""):
+        """
+        Args:
+            path: インデックスファイルのパス
+            name: インデックス名（コレクション名、ログ表示用）
+
+        Raises:
+            ValueError: ファイル形式が不正な場合
+        """
+        self.path = path
+        self.name = name
+
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size + _SECTION_TABLE.size:
+            raise ValueError(f"BM25インデックスファイルが不正です: {path}")
+
+        magic, format_version, generation, doc_count, term_count, total_length, collection_generation, collection_id = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            raise ValueError(f"BM25インデックスの形式が異なります: {path}")
+
+        self.generation = generation
+        self.total_length = total_length
+        self.collection_generation = collection_generation
+        self.collection_id = collection_id.rstrip(b"\0").decode("utf-8")
+        self._doc_count = doc_count
+        self._term_count = term_count
+
+        table = _SECTION_TABLE.unpack_from(self._mm, _HEADER.size)
+        buffer = memoryview(self._mm)
+        views = {}
+        for i, section in enumerate(_SECTIONS):
+            offset, size = table[2 * i], table[2 * i + 1]
+            views[section] = buffer[offset:offset + size]
+
+        self._term_offsets = views["term_offsets"].cast("Q")
+        self._terms = views["terms"]
+        self._posting_offsets = views["posting_offsets"].cast("I")
+        self._posting_docs = views["posting_docs"].cast("I")
+        self._posting_tfs = views["posting_tfs"].cast("I")
+        self._term_max_tfs = views["term_max_tfs"].cast("I")
+        self._term_min_lengths = views["term_min_lengths"].cast("I")
+        self._doc_lengths = views["doc_lengths"].cast("I")
+        self._doc_offsets = views["doc_offsets"].cast("Q")
+        self._docs = views["docs"]
+        self._note_ids_blob = views["note_ids"]
+        self._note_ids: Optional[List[str]] = None
+        self._note_positions: Optional[Dict[str, int]] = None
+        self._doc_ids_blob = views["doc_ids"]
+        self._doc_positions: Optional[Dict[str, int]] = None
+
+        # NumPyビュー（mmap上のページをそのまま参照、コピーなし）
+        self._posting_docs_np = np.frombuffer(views["posting_docs"], dtype=np.uint32)
+        self._posting_tfs_np = np.frombuffer(views["posting_tfs"], dtype=np.uint32)
+        self._doc_lengths_np = np.frombuffer(views["doc_lengths"], dtype=np.uint32)
+
+    @property
+    def doc_count(self) -> int:
+        """登録文書数"""
+        return self._doc_count
+
+    def _term_at(self, term_index: int) -> str:
+        start = self._term_offsets[term_index]
+        end = self._term_offsets[term_index + 1]
+        return bytes(self._terms[start:end]).decode("utf-8")
+
+    def _find_term(self, term: str) -> Optional[int]:
+        """語彙から語を二分探索（見つからない場合はNone）"""
+        lo, hi = 0, self._term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._term_count and self._term_at(lo) == term:
+            return lo
+        return None
+
+    def get_postings(self, term: str) -> Optional[Postings]:
+        term_index = self._find_term(term)
+        if term_index is None:
+            return None
+        start = self._posting_offsets[term_index]
+        end = self._posting_offsets[term_index + 1]
+        return Postings(
+            doc_indices=self._posting_docs_np[start:end],
+            tfs=self._posting_tfs_np[start:end],
+            max_tf=self._term_max_tfs[term_index],
+            min_length=self._term_min_lengths[term_index]
+        )
+
+    def get_doc_lengths_array(self) -> np.ndarray:
+        return self._doc_lengths_np
+
+    def get_document(self, doc_index: int) -> Tuple[str, str, dict]:
+        start = self._doc_offsets[doc_index]
+        end = self._doc_offsets[doc_index + 1]
+        doc_id, document, metadata = json.loads(bytes(self._docs[start:end]).decode("utf-8"))
+        return doc_id, document, metadata or {}
+
+    def _load_note_ids(self) -> List[str]:
+        """note_idリストを読み込み（初回のみ）"""
+        if self._note_ids is None:
+            note_ids = json.loads(bytes(self._note_ids_blob).decode("utf-8"))
+            self._note_positions = {note_id: i for i, note_id in enumerate(note_ids)}
+            self._note_ids = note_ids
+        return self._note_ids
+
+    def get_note_id(self, doc_index: int) -> str:
+        return self._load_note_ids()[doc_index]
+
+    def find_note(self, note_id: str) -> Optional[int]:
+        self._load_note_ids()
+        return self._note_positions.get(note_id)
+
+    def find_document(self, doc_id: str) -> Optional[int]:
+        if self._doc_positions is None:
+            # ChromaのIDリストを読み込み（初回のみ）
+            doc_ids = json.loads(bytes(self._doc_ids_blob).decode("utf-8"))
+            self._doc_positions = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        return self._doc_positions.get(doc_id)
+
+    def to_index(self) -> BM25Index:
+        """更新可能なメモリ上のインデックスに変換（再トークン化は行わない）"""
+        index = BM25Index(
+            name=self.name,
+            collection_id=self.collection_id,
+            collection_generation=self.collection_generation
+        )
+        index.generation = self.generation
+        index.total_length = self.total_length
+        index.doc_lengths.frombytes(self._doc_lengths.tobytes())
+
+        for doc_index, note_id in enumerate(self._load_note_ids()):
+            doc_id, document, metadata = self.get_document(doc_index)
+            index.ids.append(doc_id)
+            index.doc_positions[doc_id] = doc_index
+            index.documents.append(document)
+            index.metadatas.append(metadata)
+            index._add_note_id(note_id, doc_index)
+
+        # 語IDはファイル上の語彙の順に割り当てる
+        index.term_max_tfs.frombytes(self._term_max_tfs.tobytes())
+        index.term_min_lengths.frombytes(self._term_min_lengths.tobytes())
+        for term_index in range(self._term_count):
+            start = self._posting_offsets[term_index]
+            end = self._posting_offsets[term_index + 1]
+            doc_indices, tfs = array("I"), array("I")
+            doc_indices.frombytes(self._posting_docs[start:end].tobytes())
+            tfs.frombytes(self._posting_tfs[start:end].tobytes())
+            index.vocabulary.intern(self._term_at(term_index))
+            index.posting_docs.append(doc_indices)
+            index.posting_tfs.append(tfs)
+        return index
+
+
+def resolve_note_id(doc_id: str, metadata: Optional[dict]) -> str:
+    """文書のnote_idを取得（検索結果のマージと同じくnote_id → source → ChromaのIDの順）"""
+    metadata = metadata or {}
+    return str(metadata.get("note_id", metadata.get("source", doc_id)))
+
+
+def _align(offset: int) -> int:
+    """オフセットを8バイト境界に切り上げ"""
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+# ============================================
+# インデックスキャッシュ（プロセス内）とファイル管理
+# ============================================
+
+# {(persist_directory, collection_name): BM25Index | MappedBM25Index}
+_index_cache: Dict[Tuple[str, str], _BM25Base] = {}
+_index_lock = threading.Lock()
+
+
+def _get_cache_key(vectorstore) -> Tuple[str, str]:
+    """vectorstoreからキャッシュキーを生成"""
+    persist_directory = getattr(vectorstore, "_persist_directory", None) or ""
+    return (_normalize_directory(persist_directory), vectorstore._collection.name)
+
+
+def _normalize_directory(path: str) -> str:
+    """persist_directoryを比較可能な形に正規化"""
+    return os.path.abspath(path) if path else ""
+
+
+def get_index_path(persist_directory: str, collection_name: str) -> str:
+    """インデックスファイルのパスを取得
+
+    Args:
+        persist_directory: Chromaのpersist_directory（例: teams/{team_id}/chroma-db）
+        collection_name: コレクション名
+
+    Returns:
+        str: {persist_directory}/bm25_index/{collection_name}.bm25
+    """
+    return os.path.join(persist_directory, INDEX_DIR_NAME, f"{collection_name}{INDEX_FILE_SUFFIX}")
+
+
+def _open_index_file(key: Tuple[str, str]) -> Optional[MappedBM25Index]:
+    """ディスク上のインデックスをmmapで開く（存在しない・不正な場合はNone）"""
+    persist_directory, collection_name = key
+    if not persist_directory or sys.byteorder != "little":
+        return None
+
+    path = get_index_path(persist_directory, collection_name)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return MappedBM25Index(path, name=collection_name)
+    except Exception as e:
+        print(f"  > ⚠️ BM25インデックスの読み込みに失敗: {path} ({e})")
+        return None
+
+
+def _save_index(key: Tuple[str, str], index: BM25Index) -> _BM25Base:
+    """インデックスを保存し、mmap版に差し替えて返す（保存できない場合は元のまま）"""
+    persist_directory, collection_name = key
+    if not persist_directory or sys.byteorder != "little":
+        return index
+
+    try:
+        path = get_index_path(persist_directory, collection_name)
+        index.save(path)
+        return MappedBM25Index(path, name=collection_name)
+    except Exception as e:
+        print(f"  > ⚠️ BM25インデックスの保存に失敗: {collection_name} ({e})")
+        return index
+
+
+def get_collection_index(vectorstore) -> _BM25Base:
+    """vectorstoreに対応するBM25インデックスを取得（必要に応じて構築）
+
+    プロセス内キャッシュ → ディスク上のインデックス → コレクションからの構築 の順に参照し、
+    コレクションの件数・世代番号がインデックスと一致しない場合は再構築する
+
+    Args:
+        vectorstore: Chroma vectorstore
+
+    Returns:
+        BM25Index または MappedBM25Index
+    """
+    key = _get_cache_key(vectorstore)
+    collection = vectorstore._collection
+    # 世代番号は件数・文書より先に取得する（読み込み中に登録された場合は次回再構築される）
+    collection_generation = get_generation(vectorstore)
+    count = collection.count()
+
+    with _index_lock:
+        index: Optional[_BM25Base] = _index_cache.get(key)
+        if index is not None and index.is_current(collection, count, collection_generation):
+            return index
+
+        # 他ワーカーや前回起動時に保存されたインデックスを利用
+        index = _open_index_file(key)
+        if index is not None and index.is_current(collection, count, collection_generation):
+            _index_cache[key] = index
+            return index
+
+        print(f"  > BM25インデックスを構築中: {collection.name} ({count}件)")
+        index = _save_index(key, BM25Index.from_collection(collection, collection_generation))
+        _index_cache[key] = index
+        return index
+
+
+def update_collection_index(
+    vectorstore,
+    ids: List[str],
+    documents: List[str],
+    metadatas: List[dict] = None,
+    collection_generation: int = None
+) -> None:
+    """コレクションへの追加に合わせてBM25インデックスを増分更新（v3.3.0）
+
+    vectorstore.add_documents() と collection_generation.advance_generation() の直後に呼び出す。
+    キャッシュ済みインデックスが追加前のコレクション（件数・世代番号）と一致している場合のみ追記し、
+    一致しない場合（他プロセスによる更新など）はキャッシュを破棄して次回検索時に再構築する。
+    検索はロックを取らずにキャッシュ済みインデックスを参照するため、追記は複製したインデックスに行い、
+    完成後にキャッシュを差し替える（検索中のインデックスは変更しない）。
+    更新内容はメモリ上に保持し、flush_indexes() でディスクに書き出す。
+
+    Args:
+        vectorstore: 追加先のChroma vectorstore
+        ids: 追加したドキュメントのIDリスト
+        documents: 追加した文書本文のリスト
+        metadatas: 追加したメタデータのリスト
+        collection_generation: 追加後のコレクションの世代番号（Noneの場合は現在の世代番号）
+    """
+    if not ids:
+        return
+
+    key = _get_cache_key(vectorstore)
+    collection = vectorstore._collection
+    if collection_generation is None:
+        collection_generation = get_generation(vectorstore)
+    count = collection.count()
+    collection_id = str(collection.id)
+
+    with _index_lock:
+        index = _index_cache.get(key) or _open_index_file(key)
+
+        if index is None or index.collection_id != collection_id:
+            # 空のコレクションへの初回追加（再構築モード等）は新規インデックスとして作成
+            if count != len(ids):
+                _index_cache.pop(key, None)
+                return
+            index = BM25Index(name=collection.name, collection_id=collection_id)
+        elif index.doc_count + len(ids) != count or index.collection_generation != collection_generation - 1:
+            # 追加前の状態と一致しない（他の登録・件数が変わらない置換を含む）場合は再構築
+            _index_cache.pop(key, None)
+            return
+        elif isinstance(index, MappedBM25Index):
+            index = index.to_index()
+        else:
+            index = index.copy()
+
+        index.add_documents(ids, documents, metadatas)
+        index.collection_generation = collection_generation
+        _index_cache[key] = index
+
+
+def flush_indexes(persist_directory: str = None) -> int:
+    """未保存のBM25インデックスをディスクに書き出す
+
+    GCS同期（tar.gz化）の前に呼び出すことで、復元後のインスタンスも
+    インデックスを再構築せずに利用できる
+
+    Args:
+        persist_directory: 対象のpersist_directory（Noneの場合は全て）
+
+    Returns:
+        int: 書き出したインデックス数
+    """
+    target = _normalize_directory(persist_directory) if persist_directory else None
+    flushed = 0
+
+    with _index_lock:
+        for key, index in list(_index_cache.items()):
+            if target is not None and key[0] != target:
+                continue
+            if isinstance(index, BM25Index) and index.dirty:
+                _index_cache[key] = _save_index(key, index)
+                flushed += 1
+
+    if flushed:
+        print(f"BM25インデックスを保存: {flushed}件")
+    return flushed
+
+
+def invalidate_indexes(persist_directory: str = None, remove_files: bool = False) -> int:
+    """BM25インデックスのキャッシュを破棄
+
+    Args:
+        persist_directory: 対象のpersist_directory（Noneの場合は全て破棄）
+        remove_files: ディスク上のインデックスファイルも削除するか
+
+    Returns:
+        int: 破棄したインデックス数
+    """
+    target = _normalize_directory(persist_directory) if persist_directory else None
+
+    with _index_lock:
+        keys = [key for key in _index_cache if target is None or key[0] == target]
+        for key in keys:
+            del _index_cache[key]
+
+        if remove_files and target:
+            index_dir = os.path.join(target, INDEX_DIR_NAME)
+            if os.path.isdir(index_dir):
+                for file_name in os.listdir(index_dir):
+                    os.remove(os.path.join(index_dir, file_name))
+
+    if keys:
+        print(f"BM25インデックスを破棄: {len(keys)}件")
+    return len(keys)
@@ -11,6 +11,10 @@ from pathlib import Path
 from datetime import datetime
 from storage import storage
 from config import config
+from bm25_index import invalidate_indexes, flush_indexes
+from dense_index import invalidate_dense_indexes
+from vector_storage import get_default_vector_storage, remove_quantized_store
+from hnsw_tuning import get_hnsw_collection_metadata, get_hnsw_params, get_tuned_search_ef, apply_search_ef
 
 
 def sync_chroma_from_gcs(local_chroma_path: str = None):
@@ -64,6 +68,7 @@ def sync_chroma_from_gcs(local_chroma_path: str = None):
         # 一時ファイルを削除
         os.remove(tmp_path)
 
+        # BM25インデックス（bm25_index/）もtarballに含まれるため、検索時にそのままmmapで利用される
         print("ChromaDBの同期完了")
 
     except Exception as e:
@@ -95,6 +100,9 @@ def sync_chroma_to_gcs(local_chroma_path: str = None):
     gcs_tarball_path = "chroma_db/chroma_db.tar.gz"
 
     try:
+        # v3.3.0: BM25インデックス（persist_directory/bm25_index/）を書き出してから圧縮
+        flush_indexes(local_chroma_path)
+
         print(f"ChromaDBを圧縮中: {local_chroma_path}")
 
         # 一時ファイルに圧縮
@@ -192,6 +200,10 @@ def reset_chroma_db(local_chroma_path: str = None):
         # 新しいフォルダを作成
         Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
 
+        # v3.3.0: BM25インデックス・埋め込み行列のキャッシュも破棄
+        invalidate_indexes(local_chroma_path)
+        invalidate_dense_indexes(local_chroma_path)
+
         # 設定ファイルも削除
         config_path = get_chroma_config_path()
         if os.path.exists(config_path):
@@ -335,6 +347,10 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
             - combined_collection_{team_id}
         - persist_directory: `teams/{team_id}/chroma-db`
         - v3.2.0: 3コレクション→2コレクション構成に変更
+        - v3.3.0: ベクトル保存形式（vector_storage）をchroma_db_config.jsonに記録。
+          既存データがあり記録がない場合は従来形式（float32）とみなす
+        - v3.3.0: HNSWパラメータをconfig.HNSW_PARAMSから設定。search_efは
+          hnsw_tuning.pyのチューニング結果（chroma_db_config.jsonのhnsw）を優先
     """
     from langchain_chroma import Chroma
 
@@ -351,14 +367,29 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
     }
 
     # 各コレクションのvectorstoreを作成
+    # v3.3.0: HNSWパラメータを指定（M / construction_ef は新規作成時のみ有効）
     vectorstores = {}
     for key, collection_name in collection_names.items():
         vectorstores[key] = Chroma(
             collection_name=collection_name,
             embedding_function=embeddings,
-            persist_directory=team_chroma_path
+            persist_directory=team_chroma_path,
+            collection_metadata=get_hnsw_collection_metadata(key)
         )
 
+    # v3.3.0: search_efを適用（チューニング済みの値 > configの値）
+    config_path = Path(team_chroma_path) / "chroma_db_config.json"
+    team_config = {}
+    try:
+        if config_path.exists():
+            with open(config_path, 'r') as f:
+                team_config = json.load(f)
+    except Exception as e:
+        print(f"警告: チーム設定の読み込みに失敗: {e}")
+    for key, vectorstore in vectorstores.items():
+        search_ef = get_tuned_search_ef(team_config, key) or get_hnsw_params(key)["search_ef"]
+        apply_search_ef(vectorstore, search_ef)
+
     # embedding モデル設定を保存（チームごとに管理）
     if embedding_model:
         config_path = Path(team_chroma_path) / "chroma_db_config.json"
@@ -377,6 +408,14 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
 
             team_config['embedding_model'] = embedding_model
             team_config['multi_collection'] = True  # v3.2.0: 2コレクション対応フラグ
+            # v3.3.0: ベクトル保存形式（コレクション作成時に決定し、以降は変更しない）
+            if 'vector_storage' not in team_config:
+                if vectorstores["combined"]._collection.count() > 0:
+                    team_config['vector_storage'] = {"mode": "float32", "dimensions": None}
+                else:
+                    team_config['vector_storage'] = get_default_vector_storage(embedding_model)
+            elif team_config['vector_storage'] != get_default_vector_storage(embedding_model):
+                print(f"  > チーム {team_id} は記録済みのベクトル保存形式を使用: {team_config['vector_storage']}")
             team_config['updated_at'] = datetime.now().isoformat()
 
             with open(config_path, 'w') as f:
@@ -388,6 +427,28 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
     return vectorstores
 
 
+def get_team_vector_storage(team_id: str) -> dict:
+    """
+    チームのベクトル保存形式を取得（v3.3.0）
+
+    Args:
+        team_id: チームID
+
+    Returns:
+        dict: {"mode": "float32" | "reduced" | "int8", "dimensions": 次元数}（記録がない場合はfloat32）
+    """
+    config_path = Path(storage.get_team_path(team_id, 'chroma')) / "chroma_db_config.json"
+    try:
+        if config_path.exists():
+            with open(config_path, 'r') as f:
+                vector_storage = json.load(f).get('vector_storage')
+                if vector_storage:
+                    return vector_storage
+    except Exception as e:
+        print(f"警告: チーム設定の読み込みに失敗: {e}")
+    return {"mode": "float32", "dimensions": None}
+
+
 def reset_team_collections(team_id: str):
     """
     チームの全コレクションをリセット（v3.2.0更新: 新旧コレクション両方を削除）
@@ -427,6 +488,12 @@ def reset_team_collections(team_id: str):
                 # コレクションが存在しない場合は無視
                 pass
 
+        # v3.3.0: BM25インデックスのキャッシュとファイルも破棄（再構築時に作り直す）
+        invalidate_indexes(team_chroma_path, remove_files=True)
+        invalidate_dense_indexes(team_chroma_path)
+        # v3.3.0: int8形式の量子化ベクトルも削除
+        remove_quantized_store(team_chroma_path)
+
         # 設定ファイルを更新（multi_collectionフラグをリセット）
         config_path = Path(team_chroma_path) / "chroma_db_config.json"
         if config_path.exists():
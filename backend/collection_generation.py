@@ -0,0 +1,116 @@
+"""
+コレクションの世代番号モジュール（v3.3.0）
+
+ingestによるコレクションへの書き込み（登録バッチ）ごとに世代番号を進め、persist_directory内のファイルに保存する
+- BM25インデックス・埋め込み行列（numpyバックエンド）は構築時の世代番号を保持し、
+  現在の世代番号と一致しない場合は作り直す
+  （件数が変わらない更新（upsert・置換）や、他のワーカー・プロセスでの登録も検知できる）
+- ファイル: {persist_directory}/collection_generations.json  {コレクション名: 世代番号}
+- 更新はロックファイル（fcntl.flock）で複数プロセス間を排他し、一時ファイル経由で置換する
+- persist_directoryがない場合（インメモリのChroma）はプロセス内で管理する
+- get_named_generation / advance_named_generation はコレクション以外の共有状態
+  （AgentResourcesのプール等）の変更を他のワーカーへ知らせるために、任意のディレクトリ・名前で使用できる
+"""
+import json
+import os
+import threading
+from typing import Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows（ローカル開発）ではプロセス間の排他なし
+    fcntl = None
+
+
+GENERATION_FILE_NAME = "collection_generations.json"
+
+# persist_directoryがない場合の世代番号 {(persist_directory, collection_name): 世代番号}
+_memory_generations: Dict[Tuple[str, str], int] = {}
+_lock = threading.Lock()
+
+
+def _get_key(vectorstore) -> Tuple[str, str]:
+    persist_directory = getattr(vectorstore, "_persist_directory", None) or ""
+    return (os.path.abspath(persist_directory) if persist_directory else "", vectorstore._collection.name)
+
+
+def _read_generations(path: str) -> Dict[str, int]:
+    """世代番号ファイルを読み込む（存在しない・不正な場合は空）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def get_named_generation(directory: str, name: str) -> int:
+    """ディレクトリ内の世代番号ファイルから名前に対応する世代番号を取得
+
+    Args:
+        directory: 世代番号ファイルを置くディレクトリ（空文字の場合はプロセス内で管理）
+        name: 名前（コレクション名等）
+
+    Returns:
+        int: 世代番号（更新されたことがない場合は0）
+    """
+    if not directory:
+        with _lock:
+            return _memory_generations.get((directory, name), 0)
+    path = os.path.join(directory, GENERATION_FILE_NAME)
+    return int(_read_generations(path).get(name, 0))
+
+
+def advance_named_generation(directory: str, name: str) -> int:
+    """ディレクトリ内の世代番号ファイルで名前に対応する世代番号を進める
+
+    Args:
+        directory: 世代番号ファイルを置くディレクトリ（空文字の場合はプロセス内で管理）
+        name: 名前（コレクション名等）
+
+    Returns:
+        int: 更新後の世代番号
+    """
+    key = (directory, name)
+    with _lock:
+        if not directory:
+            _memory_generations[key] = _memory_generations.get(key, 0) + 1
+            return _memory_generations[key]
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, GENERATION_FILE_NAME)
+        with open(f"{path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            generations = _read_generations(path)
+            generation = int(generations.get(name, 0)) + 1
+            generations[name] = generation
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(generations, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        return generation
+
+
+def get_generation(vectorstore) -> int:
+    """コレクションの現在の世代番号を取得
+
+    Args:
+        vectorstore: Chroma vectorstore
+
+    Returns:
+        int: 世代番号（登録されたことがない場合は0）
+    """
+    return get_named_generation(*_get_key(vectorstore))
+
+
+def advance_generation(vectorstore) -> int:
+    """コレクションへの書き込み後に世代番号を進める
+
+    Args:
+        vectorstore: 書き込んだChroma vectorstore
+
+    Returns:
+        int: 更新後の世代番号
+    """
+    return advance_named_generation(*_get_key(vectorstore))
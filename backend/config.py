@@ -31,9 +31,65 @@ class Config:
 
     # 検索設定
     VECTOR_SEARCH_K = 30  # 初期検索候補数（重複除去を考慮して増加）
+    BM25_MAXSCORE_ENABLED = True  # BM25上位k件検索でMaxScore枝刈りを使用（v3.3.0）
+    TOKENIZER_QUERY_CACHE_SIZE = 1024  # クエリ文字列のトークン化結果のLRUキャッシュ件数（v3.3.0）
     RERANK_TOP_N = 20  # リランキング後の上位件数（重複除去後に10件確保するため）
     UI_DISPLAY_TOP_N = 3  # UI表示用の上位件数
 
+    # セマンティック検索バックエンド設定（v3.3.0）
+    DENSE_SEARCH_BACKEND = os.getenv("DENSE_SEARCH_BACKEND", "chroma")  # "chroma"（HNSW近似検索）| "numpy"（メモリ上の厳密検索）
+    # チームごとの上書き {team_id: "numpy"}（環境変数はカンマ区切りの "チームID:バックエンド"、例: "team-a:numpy,team-b:chroma"）
+    DENSE_SEARCH_BACKEND_BY_TEAM = {
+        team_id.strip(): backend.strip()
+        for team_id, _, backend in (
+            item.partition(":") for item in os.getenv("DENSE_SEARCH_BACKEND_BY_TEAM", "").split(",") if item.strip()
+        )
+    }
+    DENSE_INDEX_DTYPE = "float32"  # numpyバックエンドの行列の型: "float32" | "float16"（メモリ半減）
+
+    # HNSWパラメータ設定（v3.3.0、Chromaのデフォルト値）
+    # M / construction_ef はコレクション作成時のみ適用。search_ef は既存コレクションにも検索時に適用し、
+    # hnsw_tuning.py でチューニングした値（chroma_db_config.json の hnsw）がある場合はそちらを優先
+    HNSW_PARAMS = {"M": 16, "construction_ef": 100, "search_ef": 10}
+    HNSW_PARAMS_BY_COLLECTION = {}  # コレクションごとの上書き {"materials_methods": {"search_ef": 40}, "combined": {...}}
+    HNSW_TUNING_RECALL_TARGET = 0.95  # チューニングで満たすrecall@k（厳密検索との一致率）
+    HNSW_TUNING_SEARCH_EF_CANDIDATES = [10, 20, 30, 40, 60, 80, 120, 160, 240, 320, 480]  # k未満の値は検索時にkとして扱われる（hnswlib）
+    HNSW_TUNING_SAMPLE_QUERIES = 200  # チューニングに使うクエリ数（コレクション内のベクトルから抽出）
+
+    # ベクトル保存形式設定（v3.3.0、新規作成するチームコレクションに適用）
+    # 1件あたりのベクトルサイズ（text-embedding-3-small、1536次元の場合）:
+    #   float32: 6KB / reduced(256次元): 1KB（約1/6、再スコアリングなし）/
+    #   int8: 縮約ベクトル1KB + 全次元int8 1.5KB（約1/2.4、再スコアリングは量子化ベクトルで行うため量子化誤差は残る）
+    VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "float32")  # "float32" | "reduced"（縮約次元）| "int8"（縮約次元 + int8再スコアリング）
+    VECTOR_REDUCED_DIMENSIONS = 256  # reduced/int8形式でChromaに保存する次元数
+    VECTOR_RESCORE_MULTIPLIER = 4  # int8形式で再スコアリングする候補数（k の倍数）
+    # 先頭次元への縮約に対応したモデル（Matryoshka学習済み）。これ以外のモデルではreduced/int8形式を使用しない
+    VECTOR_REDUCIBLE_EMBEDDING_MODELS = ["text-embedding-3-small", "text-embedding-3-large"]
+
+    # Embeddingキャッシュ設定（v3.3.0）
+    QUERY_EMBEDDING_CACHE_SIZE = 4096  # クエリEmbeddingのメモリ上LRUキャッシュ件数
+    QUERY_EMBEDDING_DISK_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_DISK_CACHE_ENABLED", "false").lower() == "true"
+    EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.getenv("STORAGE_BASE_PATH", "."), "cache"))
+    DOCUMENT_EMBEDDING_CACHE_ENABLED = True  # 取り込み時に (モデル, 本文ハッシュ) → ベクトルを保存・再利用
+
+    # LLM応答キャッシュ設定（v3.3.0、クエリ生成・重点指示分類の検索用LLM）
+    # 有効にした場合、temperature 0で呼び出せるモデルの応答のみキャッシュする（o1 / gpt-5 系等はキャッシュしない）
+    LLM_RESPONSE_CACHE_ENABLED = os.getenv("LLM_RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    LLM_RESPONSE_CACHE_SIZE = 2048  # メモリ上のLRUキャッシュ件数
+    LLM_RESPONSE_CACHE_DISK_SIZE = 50000  # ディスク（EMBEDDING_CACHE_DIR/llm_responses.sqlite3）に保存する最大件数
+    LLM_RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60  # 応答の有効期間（秒）
+
+    # SearchAgentのリソース共有設定（v3.3.0）
+    AGENT_POOL_ENABLED = True  # クライアント・辞書・vectorstoreをリクエスト間で共有
+    AGENT_POOL_MAX_SIZE = 16  # 共有する組み合わせ（チーム・モデル・APIキー）の最大数
+    AGENT_POOL_IDLE_TTL = 30 * 60  # この秒数使われていない組み合わせは作り直す
+
+    # 検索リクエストの実行設定（v3.3.0、/search・/evaluate をイベントループ外のスレッドで実行）
+    SEARCH_REQUEST_WORKERS = int(os.getenv("SEARCH_REQUEST_WORKERS", "4"))  # 同時に実行する検索数
+    SEARCH_REQUEST_QUEUE_SIZE = int(os.getenv("SEARCH_REQUEST_QUEUE_SIZE", "8"))  # 実行待ちにできる検索数（超えた場合は503）
+    SEARCH_REQUEST_RETRY_AFTER = 5  # 503応答のRetry-Afterヘッダ（秒）
+    SEARCH_STREAM_DISCONNECT_POLL_INTERVAL = 0.5  # /search/stream でクライアントの切断を確認する間隔（秒）
+
     # 3軸分離検索設定（v3.1.0）
     MULTI_AXIS_ENABLED = True  # 3軸検索の有効/無効（デフォルト: True）
     FUSION_METHOD = "rrf"  # スコア統合方式: "rrf" | "linear"
@@ -44,7 +100,13 @@ class Config:
     }
     RERANK_POSITION = "after_fusion"  # リランク位置: "per_axis" | "after_fusion"
     RERANK_ENABLED = True  # リランキングの有効/無効
+    RERANK_CACHE_ENABLED = True  # (リランクモデル, クエリ, 文書本文) → 関連度スコアをキャッシュ（v3.3.0）
+    RERANK_CACHE_SIZE = 50000  # リランクキャッシュに保持するクエリと文書の組の最大数（メモリ上のLRU）
     RRF_K = 60  # RRF（Reciprocal Rank Fusion）のkパラメータ
+    SEARCH_MAX_WORKERS = 8  # 3軸のクエリ生成・検索・リランクを並行実行するスレッド数（プロセス内で共有、v3.3.0）
+    FOCUS_RULE_CLASSIFIER_ENABLED = True  # 判定が明確な重点指示はキーワードで分類し、LLMを呼ばない（v3.3.0）
+    SPECULATIVE_QUERY_GENERATION = True  # 重点指示の分類と並行して3軸クエリ生成を開始（v3.3.0）
+    SPECULATIVE_FOCUS_PREDICTION = "both"  # 投機実行で予測する分類結果（材料軸・方法軸に使用、Noneの場合は総合軸のみ投機実行）
 
     # セクション別Embeddingコレクション設定（v3.2.0: 2コレクション構成に変更）
     # 旧設定（v3.1.1）- 後方互換性のため残す（リセット時の削除対象）
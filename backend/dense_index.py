@@ -0,0 +1,287 @@
+"""
+厳密ベクトル検索モジュール（v3.3.0）
+
+Chromaコレクションの埋め込みベクトルをNumPy行列（float32/float16）に読み込み、
+HNSW（近似検索）を経由せずに厳密な上位k件を返すセマンティック検索バックエンド
+- 全クエリをまとめて1回の行列積で距離を計算し、argpartitionで上位k件を取得する
+- 距離はコレクションの距離関数（hnsw:space）に合わせて計算し、Chroma経由の検索と同じ関連度を返す
+- 本文・メタデータは上位k件分のみChromaから取得する
+- コレクションの世代番号（collection_generationモジュール、ingestの登録バッチごとに増加し
+  persist_directory内に保存）とコレクションID・件数でChromaと同期し、不一致の場合は次回検索時に読み込み直す
+  （世代番号はファイルで共有するため、他のワーカー・プロセスでの登録も検知できる）
+- 読み込みはコレクションごとのロックで行い、他のコレクションの検索を止めない
+- チームごとに config.DENSE_SEARCH_BACKEND / DENSE_SEARCH_BACKEND_BY_TEAM で "numpy" を指定した場合に使用
+"""
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from collection_generation import get_generation
+from config import config
+
+
+# float16行列の距離計算時にfloat32へ変換するブロックの行数
+_BLOCK_ROWS = 8192
+
+DENSE_SEARCH_BACKENDS = ("chroma", "numpy")
+
+
+def get_dense_backend(team_id: str = None) -> str:
+    """チームのセマンティック検索バックエンドを取得
+
+    Args:
+        team_id: チームID
+
+    Returns:
+        str: "chroma" | "numpy"
+    """
+    backend = config.DENSE_SEARCH_BACKEND
+    if team_id and team_id in config.DENSE_SEARCH_BACKEND_BY_TEAM:
+        backend = config.DENSE_SEARCH_BACKEND_BY_TEAM[team_id]
+    if backend not in DENSE_SEARCH_BACKENDS:
+        print(f"⚠️ 未対応のセマンティック検索バックエンドです: {backend}（chromaを使用）")
+        return "chroma"
+    return backend
+
+
+class DenseIndex:
+    """1コレクション分の埋め込みベクトル行列"""
+
+    def __init__(
+        self,
+        name: str,
+        collection_id: str,
+        ids: List[str],
+        embeddings: np.ndarray,
+        space: str = "l2",
+        generation: int = 0,
+        dtype: str = "float32"
+    ):
+        """
+        Args:
+            name: インデックス名（コレクション名、ログ表示用）
+            collection_id: 対応するChromaコレクションのID
+            ids: ChromaのドキュメントID（行の順）
+            embeddings: shape (文書数, 次元数) の埋め込み行列
+            space: コレクションの距離関数 "l2" | "cosine" | "ip"
+            generation: 読み込み時点の世代番号
+            dtype: 行列の保持形式 "float32" | "float16"
+        """
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"未対応の距離関数です: {space}")
+
+        self.name = name
+        self.collection_id = collection_id
+        self.ids = ids
+        self.space = space
+        self.generation = generation
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(ids):
+            embeddings = embeddings.reshape(len(ids), -1)
+        else:
+            # 空のコレクション: 0行の行列（次元数が不明な場合は0次元）
+            embeddings = embeddings.reshape(0, embeddings.shape[-1] if embeddings.ndim == 2 else 0)
+        if space == "cosine":
+            # コサイン距離は正規化済みベクトルの内積で計算する
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.where(norms > 0, norms, 1)
+        # L2距離用に行ごとのノルムの2乗を保持（float32で計算）
+        self.squared_norms = np.einsum("ij,ij->i", embeddings, embeddings) if space == "l2" else None
+        self.matrix = np.ascontiguousarray(embeddings, dtype=np.dtype(dtype))
+
+    @property
+    def doc_count(self) -> int:
+        """登録文書数"""
+        return len(self.ids)
+
+    def is_current(self, collection, count: int, generation: int) -> bool:
+        """インデックスがコレクションの現在の状態と一致しているか判定"""
+        return (
+            self.collection_id == str(collection.id)
+            and self.doc_count == count
+            and self.generation == generation
+        )
+
+    def _dot(self, queries: np.ndarray) -> np.ndarray:
+        """行列とクエリの内積 shape (文書数, クエリ数)"""
+        if self.matrix.dtype == np.float32 or not self.doc_count:
+            return self.matrix.astype(np.float32, copy=False) @ queries.T
+        # float16はBLASが使えないため、ブロックごとにfloat32へ変換して計算
+        return np.concatenate([
+            self.matrix[i:i + _BLOCK_ROWS].astype(np.float32) @ queries.T
+            for i in range(0, self.doc_count, _BLOCK_ROWS)
+        ])
+
+    def search(self, query_embeddings: List[List[float]], k: int = 30) -> List[List[Tuple[int, float]]]:
+        """全件との距離を計算し、クエリごとに距離の小さい上位k件を返す（厳密検索）
+
+        Args:
+            query_embeddings: クエリの埋め込みベクトルのリスト
+            k: クエリごとの上位件数
+
+        Returns:
+            クエリごとの (行番号, 距離) タプルのリスト（距離の昇順）
+        """
+        if not self.doc_count:
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if self.space == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms > 0, norms, 1)
+
+        dots = self._dot(queries)
+        if self.space == "l2":
+            # Chromaのl2は二乗ユークリッド距離
+            distances = self.squared_norms[:, None] + np.einsum("ij,ij->i", queries, queries)[None, :] - 2 * dots
+            np.maximum(distances, 0, out=distances)
+        else:
+            distances = 1 - dots
+
+        results = []
+        for column in distances.T:
+            candidates = np.arange(len(column))
+            if len(column) > k:
+                candidates = np.argpartition(column, k - 1)[:k]
+            order = np.lexsort((candidates, column[candidates]))
+            results.append([(int(candidates[i]), float(column[candidates[i]])) for i in order])
+        return results
+
+
+# ============================================
+# インデックスキャッシュ（プロセス内）
+# ============================================
+
+# {(persist_directory, collection_name): DenseIndex}
+_dense_cache: Dict[Tuple[str, str], DenseIndex] = {}
+# {(persist_directory, collection_name): 読み込み用のロック}（同じコレクションの読み込みを1回にまとめる）
+_load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_dense_lock = threading.Lock()  # _dense_cache・_load_locksの参照・更新用（読み込み中は保持しない）
+
+
+def _get_cache_key(vectorstore) -> Tuple[str, str]:
+    """vectorstoreからキャッシュキーを生成"""
+    persist_directory = getattr(vectorstore, "_persist_directory", None) or ""
+    return (os.path.abspath(persist_directory) if persist_directory else "", vectorstore._collection.name)
+
+
+def _load_dense_index(collection, generation: int) -> DenseIndex:
+    """Chromaコレクションの全埋め込みベクトルを読み込む"""
+    data = collection.get(include=["embeddings"])
+    ids = data.get("ids") or []
+    embeddings = data.get("embeddings")
+    if embeddings is None or not len(ids):
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    return DenseIndex(
+        name=collection.name,
+        collection_id=str(collection.id),
+        ids=list(ids),
+        embeddings=embeddings,
+        space=space,
+        generation=generation,
+        dtype=config.DENSE_INDEX_DTYPE
+    )
+
+
+def get_dense_index(vectorstore) -> DenseIndex:
+    """vectorstoreに対応する埋め込み行列を取得（必要に応じて読み込み）
+
+    Args:
+        vectorstore: Chroma vectorstore
+
+    Returns:
+        DenseIndex
+    """
+    key = _get_cache_key(vectorstore)
+    collection = vectorstore._collection
+    # 世代番号は件数・ベクトルより先に取得する（読み込み中に登録された場合は次回読み込み直す）
+    generation = get_generation(vectorstore)
+    count = collection.count()
+
+    with _dense_lock:
+        index = _dense_cache.get(key)
+        if index is not None and index.is_current(collection, count, generation):
+            return index
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # 待っている間に他のスレッドが読み込んだ場合はそれを使用
+        with _dense_lock:
+            index = _dense_cache.get(key)
+        if index is not None and index.is_current(collection, count, generation):
+            return index
+
+        print(f"  > 埋め込み行列を読み込み中: {collection.name} ({count}件, {config.DENSE_INDEX_DTYPE})")
+        index = _load_dense_index(collection, generation)
+        with _dense_lock:
+            _dense_cache[key] = index
+        return index
+
+
+def invalidate_dense_indexes(persist_directory: str = None) -> int:
+    """埋め込み行列のキャッシュを破棄
+
+    Args:
+        persist_directory: 対象のpersist_directory（Noneの場合は全て破棄）
+
+    Returns:
+        int: 破棄したインデックス数
+    """
+    target = os.path.abspath(persist_directory) if persist_directory else None
+
+    with _dense_lock:
+        keys = [key for key in _dense_cache if target is None or key[0] == target]
+        for key in keys:
+            del _dense_cache[key]
+    return len(keys)
+
+
+def dense_search(vectorstore, query_embeddings: List[List[float]], k: int = 30) -> List[List[tuple]]:
+    """埋め込み行列による厳密なセマンティック検索
+
+    Args:
+        vectorstore: 検索対象のChroma vectorstore
+        query_embeddings: クエリの埋め込みベクトルのリスト
+        k: クエリごとの上位件数
+
+    Returns:
+        クエリごとの (Document, 関連度) タプルのリスト
+        （関連度はsimilarity_search_with_relevance_scoresと同じ変換）
+    """
+    from langchain_core.documents import Document
+
+    index = get_dense_index(vectorstore)
+    if not index.doc_count:
+        return [[] for _ in query_embeddings]
+
+    hits = index.search(query_embeddings, k=k)
+
+    # 上位k件の本文・メタデータのみChromaから取得
+    top_ids = list(dict.fromkeys(index.ids[row] for result in hits for row, _ in result))
+    data = vectorstore._collection.get(ids=top_ids, include=["documents", "metadatas"])
+    records = {
+        doc_id: (document, metadata)
+        for doc_id, document, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+    }
+
+    relevance_score_fn = vectorstore._select_relevance_score_fn()
+    result_sets = []
+    for result in hits:
+        results = []
+        for row, distance in result:
+            doc_id = index.ids[row]
+            if doc_id not in records:
+                # 読み込み後に削除された文書
+                continue
+            document, metadata = records[doc_id]
+            results.append((
+                Document(page_content=document, metadata=metadata or {}, id=doc_id),
+                relevance_score_fn(distance)
+            ))
+        result_sets.append(results)
+    return result_sets
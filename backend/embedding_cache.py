@@ -0,0 +1,325 @@
+"""
+Embeddingキャッシュモジュール（v3.3.0）
+
+OpenAIEmbeddingsの前段に置くキャッシュ
+- キー: (Embeddingモデル名, テキストのSHA-256)
+- メモリ上のLRU（プロセス内の全SearchAgentで共有）+ 任意でディスク（SQLite）の2段構成
+- ヒット/ミス件数を記録し、get_stats() で参照できる
+- クエリ用（検索時）: 空白を正規化したテキストをキーにする。ディスク保存は任意
+- 文書用（取り込み・再構築時）: page_contentそのものをキーにし、常にディスクに保存する
+  （変更のないノートは再構築時にEmbedding APIを呼ばない）
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from config import config
+
+
+# SQLiteのIN句に渡すパラメータ数の上限（古いSQLiteの上限999に合わせる）
+_SQLITE_BATCH_SIZE = 500
+
+
+def normalize_cache_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化（前後の空白を除去し、連続する空白を1つにまとめる）"""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """テキストのSHA-256（16進文字列）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """SQLiteによるEmbeddingの永続ストア
+
+    (model, text_hash) → ベクトル（float32のバイト列）を保存する
+    - Embedding APIの応答はfloat32相当の精度のため、float32で保存してもコサイン類似度はほぼ変わらない
+      （ファイルサイズはfloat64の半分）
+    - 旧形式（float64、embeddingsテーブル）のベクトルも読み込む。新たな保存はfloat32のテーブルに行う
+    - 読み込みに失敗した場合（ファイルの破損・ロック等）は警告を出してキャッシュミスとして扱う
+    """
+
+    TABLE_NAME = "embeddings_f32"
+    LEGACY_TABLE_NAME = "embeddings"  # 旧形式（float64）
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLiteファイルのパス
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._conn.commit()
+            self._has_legacy_table = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.LEGACY_TABLE_NAME,)
+            ).fetchone() is not None
+
+    def _select(self, table: str, typecode: str, model: str, hashes: List[str], found: Dict[str, List[float]]) -> None:
+        for i in range(0, len(hashes), _SQLITE_BATCH_SIZE):
+            batch = hashes[i:i + _SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM {table} WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *batch]
+            )
+            for hash_value, blob in rows:
+                found[hash_value] = array(typecode, blob).tolist()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """保存済みのベクトルを取得
+
+        Args:
+            model: Embeddingモデル名
+            hashes: テキストハッシュのリスト
+
+        Returns:
+            {text_hash: ベクトル}（保存されていないもの・読み込みに失敗したものは含まない）
+        """
+        found = {}
+        with self._lock:
+            try:
+                self._select(self.TABLE_NAME, "f", model, hashes, found)
+                if self._has_legacy_table:
+                    remaining = [hash_value for hash_value in hashes if hash_value not in found]
+                    if remaining:
+                        self._select(self.LEGACY_TABLE_NAME, "d", model, remaining, found)
+            except sqlite3.Error as e:
+                print(f"  > ⚠️ Embeddingキャッシュの読み込みに失敗（キャッシュなしとして続行）: {e}")
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """ベクトルを保存（既存のものは上書き）
+
+        Args:
+            model: Embeddingモデル名
+            vectors: {text_hash: ベクトル}
+        """
+        if not vectors:
+            return
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.TABLE_NAME} (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, hash_value, array("f", vector).tobytes()) for hash_value, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """全件削除"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE_NAME}")
+            if self._has_legacy_table:
+                self._conn.execute(f"DROP TABLE {self.LEGACY_TABLE_NAME}")
+                self._has_legacy_table = False
+            self._conn.commit()
+
+
+class EmbeddingCache:
+    """Embeddingのキャッシュ（メモリ上のLRU + 任意のディスクストア）"""
+
+    def __init__(self, max_size: int, disk_store: Optional[DiskEmbeddingStore] = None):
+        """
+        Args:
+            max_size: メモリ上に保持する最大件数
+            disk_store: ディスクストア（Noneの場合はメモリのみ）
+        """
+        self.max_size = max_size
+        self.disk_store = disk_store
+        self._entries: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # ヒット/ミス件数
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """キャッシュ済みのベクトルを取得（メモリ → ディスクの順に参照）
+
+        Args:
+            model: Embeddingモデル名
+            hashes: テキストハッシュのリスト（重複なし）
+
+        Returns:
+            {text_hash: ベクトル}（キャッシュにないものは含まない）
+        """
+        found = {}
+        with self._lock:
+            for hash_value in hashes:
+                vector = self._entries.get((model, hash_value))
+                if vector is not None:
+                    self._entries.move_to_end((model, hash_value))
+                    found[hash_value] = vector
+            self.memory_hits += len(found)
+
+        remaining = [hash_value for hash_value in hashes if hash_value not in found]
+        if remaining and self.disk_store is not None:
+            disk_found = self.disk_store.get_many(model, remaining)
+            if disk_found:
+                self._put_memory(model, disk_found)
+                found.update(disk_found)
+            with self._lock:
+                self.disk_hits += len(disk_found)
+
+        with self._lock:
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """ベクトルをキャッシュに登録
+
+        Args:
+            model: Embeddingモデル名
+            vectors: {text_hash: ベクトル}
+        """
+        self._put_memory(model, vectors)
+        if self.disk_store is not None:
+            try:
+                self.disk_store.put_many(model, vectors)
+            except sqlite3.Error as e:
+                print(f"  > ⚠️ Embeddingキャッシュの保存に失敗: {e}")
+
+    def _put_memory(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for hash_value, vector in vectors.items():
+                self._entries[(model, hash_value)] = vector
+                self._entries.move_to_end((model, hash_value))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """キャッシュを全件削除（ディスクストアを含む）"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_store is not None:
+            self.disk_store.clear()
+
+    def get_stats(self) -> dict:
+        """キャッシュの統計情報を取得
+
+        Returns:
+            dict: 件数、ヒット/ミス件数、ヒット率
+        """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "disk_enabled": self.disk_store is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """キャッシュ付きEmbeddings（LangChainのEmbeddingsとして差し替え可能）
+
+    キャッシュにないテキストのみ元のEmbeddingsでまとめてベクトル化する
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache, normalize: bool = True):
+        """
+        Args:
+            embeddings: 元のEmbeddings（OpenAIEmbeddings等）
+            model: Embeddingモデル名（キャッシュキーに使用）
+            cache: 使用するキャッシュ
+            normalize: キーの計算前に空白を正規化するか（Falseの場合はテキストそのもののハッシュ）
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+        self.normalize = normalize
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(normalize_cache_text(text) if self.normalize else text) for text in texts]
+
+        # 同じテキストは1回だけ問い合わせる
+        unique_texts = dict(zip(hashes, texts))
+        found = self.cache.get_many(self.model, list(unique_texts))
+
+        missing = [hash_value for hash_value in unique_texts if hash_value not in found]
+        if missing:
+            vectors = self.embeddings.embed_documents([unique_texts[hash_value] for hash_value in missing])
+            new_vectors = dict(zip(missing, vectors))
+            self.cache.put_many(self.model, new_vectors)
+            found.update(new_vectors)
+
+        # キャッシュ内のリストを呼び出し側で変更されないようコピーを返す
+        return [list(found[hash_value]) for hash_value in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# クエリEmbeddingキャッシュ（プロセス内で共有）
+_query_embedding_cache: Optional[EmbeddingCache] = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> EmbeddingCache:
+    """クエリEmbeddingキャッシュを取得（初回呼び出し時に作成）
+
+    Returns:
+        EmbeddingCache
+    """
+    global _query_embedding_cache
+    with _query_embedding_cache_lock:
+        if _query_embedding_cache is None:
+            disk_store = None
+            if config.QUERY_EMBEDDING_DISK_CACHE_ENABLED:
+                path = os.path.join(config.EMBEDDING_CACHE_DIR, "query_embeddings.sqlite3")
+                try:
+                    disk_store = DiskEmbeddingStore(path)
+                    print(f"クエリEmbeddingのディスクキャッシュ: {path}")
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ クエリEmbeddingのディスクキャッシュを開けません: {path} ({e})")
+            _query_embedding_cache = EmbeddingCache(config.QUERY_EMBEDDING_CACHE_SIZE, disk_store)
+        return _query_embedding_cache
+
+
+# 文書Embeddingキャッシュ（プロセス内で共有）
+_document_embedding_cache: Optional[EmbeddingCache] = None
+_document_embedding_cache_lock = threading.Lock()
+
+
+def get_document_embedding_cache() -> Optional[EmbeddingCache]:
+    """取り込み用の文書Embeddingキャッシュを取得（初回呼び出し時に作成）
+
+    Returns:
+        EmbeddingCache（無効またはディスクストアを開けない場合はNone）
+    """
+    global _document_embedding_cache
+    if not config.DOCUMENT_EMBEDDING_CACHE_ENABLED:
+        return None
+
+    with _document_embedding_cache_lock:
+        if _document_embedding_cache is None:
+            path = os.path.join(config.EMBEDDING_CACHE_DIR, "document_embeddings.sqlite3")
+            try:
+                disk_store = DiskEmbeddingStore(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ 文書Embeddingキャッシュを開けません: {path} ({e})")
+                return None
+            # 取り込みでは同じ文書を繰り返し参照しないため、メモリ上には保持しない
+            _document_embedding_cache = EmbeddingCache(0, disk_store)
+        return _document_embedding_cache
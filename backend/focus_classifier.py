@@ -0,0 +1,96 @@
+"""
+重点指示のルールベース分類モジュール（v3.3.0）
+
+重点指示を材料/方法/両方に分類する際、判定が明確なものはLLMを呼ばずにキーワードで分類する
+- 重点指示が材料関連の語・方法関連の語・定型表現（「が近いもの」「を優先」等）だけで構成される場合のみ判定する
+  材料関連の語のみ → "materials"、方法関連の語のみ → "methods"、両方 → "both"
+  （focus_classificationプロンプトの判定基準と同じ。_normalize_nodeのデフォルトの重点指示は "both"）
+- 化学物質名（NaOH、エタノール等）などそれ以外の語を含む場合、どちらの語も含まない場合、
+  否定表現（「材料は問わない」等）を含む場合は判定不能としてLLMで分類する
+- 分類経路（ルール/LLM/スキップ）ごとの件数を記録し、get_focus_classification_stats() で参照できる
+"""
+import re
+import threading
+from typing import Optional, Tuple
+
+
+# 材料関連の語（材料・試薬の種類、量、濃度）
+_MATERIAL_PATTERN = re.compile(
+    r"化学物質|材料|試薬|薬品|原料|溶媒|濃度|容量|配合|組成|添加量|仕込み量|"
+    r"\d+(?:\.\d+)?\s*(?:mol/L|mmol|mol|mL|ml|mg|wt%|g|L|%)"
+)
+
+# 方法関連の語（操作、手順、条件）
+_METHOD_PATTERN = re.compile(
+    r"方法|手順|操作|工程|プロセス|条件|撹拌|攪拌|加熱|冷却|温度|時間|回転数|rpm|圧力|"
+    r"分散|乾燥|ろ過|濾過|洗浄|混合|遠心|昇温|滴下"
+)
+
+# 分類に影響しない定型表現・助詞・記号（これら以外の語が残る場合はLLMで判定する）
+_FILLER_PATTERN = re.compile(
+    r"最優先|優先|重視|重点|注目|中心|類似|似ている|似た|近い|同じ|同様|一致|"
+    r"使用されている|使用した|使用|記述|実験ノート|ノート|実験|検索|"
+    r"している|してください|ください|して|する|した|されている|もの|について|に関する|"
+    r"[のがをにでとはもや、。・,.!！\s()（）「」]"
+)
+
+# 否定・除外の表現（対象の軸が逆になり得るためLLMで判定する）
+_NEGATION_PATTERN = re.compile(r"問わ|関係な|無視|気にしな|除外|以外|不要|考慮しな")
+
+
+def classify_focus_by_rules(instruction: str) -> Optional[Tuple[str, str]]:
+    """重点指示をキーワードで分類
+
+    Args:
+        instruction: 重点指示
+
+    Returns:
+        (分類結果, 理由)。判定できない場合はNone（LLMで分類する）
+    """
+    if _NEGATION_PATTERN.search(instruction):
+        return None
+
+    has_material = _MATERIAL_PATTERN.search(instruction)
+    has_method = _METHOD_PATTERN.search(instruction)
+
+    # 材料・方法関連の語と定型表現を除いて残る語がある場合（化学物質名等）は判定しない
+    remainder = _FILLER_PATTERN.sub("", _METHOD_PATTERN.sub("", _MATERIAL_PATTERN.sub("", instruction)))
+    if remainder:
+        return None
+
+    if has_material and has_method:
+        return "both", f"材料関連（{has_material.group(0)}）と方法関連（{has_method.group(0)}）の語を含む"
+    if has_material:
+        return "materials", f"材料関連の語（{has_material.group(0)}）のみを含む"
+    if has_method:
+        return "methods", f"方法関連の語（{has_method.group(0)}）のみを含む"
+    return None
+
+
+# 分類経路ごとの件数（プロセス内で共有）
+_stats = {"rule": 0, "llm": 0, "skip": 0}
+_stats_lock = threading.Lock()
+
+
+def record_focus_classification(path: str) -> None:
+    """分類経路を記録
+
+    Args:
+        path: "rule"（ルールベース）| "llm"（LLM）| "skip"（重点指示なし）
+    """
+    with _stats_lock:
+        _stats[path] = _stats.get(path, 0) + 1
+
+
+def get_focus_classification_stats() -> dict:
+    """分類経路ごとの件数と割合を取得
+
+    Returns:
+        dict: {"rule": 件数, "llm": 件数, "skip": 件数, "total": 合計, "rule_rate": ルールで分類した割合（スキップを除く）}
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    classified = stats["rule"] + stats["llm"]
+    stats["total"] = classified + stats["skip"]
+    stats["rule_rate"] = stats["rule"] / classified if classified else 0.0
+    return stats
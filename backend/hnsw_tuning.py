@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+HNSWパラメータ設定・チューニングモジュール（v3.3.0）
+
+- コレクションごとのHNSWパラメータ（hnsw:M / hnsw:construction_ef / hnsw:search_ef）を
+  config.HNSW_PARAMS / HNSW_PARAMS_BY_COLLECTION から組み立てる
+- search_ef はコレクションのメタデータ（hnsw:search_ef）に collection.modify() で設定する（既存コレクションにも適用）
+  chromadb 0.5.x はメタデータの変更を作成済みのHNSWセグメントに反映しないため、0.5.x のローカルクライアントに
+  限り、読み込み済みのHNSWインデックスにも直接設定する（非公開APIのため警告を出力する）
+- チューニングコマンド: コレクション内のベクトルをクエリとして、search_efごとに
+  HNSW検索の recall@k（厳密検索の上位k件との一致率）と平均レイテンシを測定し、
+  目標recallを満たす最小のsearch_efをチームの chroma_db_config.json（hnsw）に保存する
+  （クエリ自身は距離0で必ず1位になりrecallを過大に見積もるため、正解・検索結果の両方から除外する）
+
+使い方:
+    python hnsw_tuning.py --team <team_id> [--target 0.95] [--k 30] [--queries 200] [--dry-run]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+
+
+HNSW_CONFIG_KEY = "hnsw"
+
+
+def get_hnsw_params(collection_key: str) -> Dict[str, int]:
+    """コレクションのHNSWパラメータ（config）を取得
+
+    Args:
+        collection_key: "materials_methods" | "combined"
+
+    Returns:
+        dict: {"M": int, "construction_ef": int, "search_ef": int}
+    """
+    params = dict(config.HNSW_PARAMS)
+    params.update(config.HNSW_PARAMS_BY_COLLECTION.get(collection_key, {}))
+    return params
+
+
+def get_hnsw_collection_metadata(collection_key: str) -> Dict[str, int]:
+    """コレクション作成時に渡すChromaのメタデータ（hnsw:*）を取得
+
+    Args:
+        collection_key: "materials_methods" | "combined"
+
+    Returns:
+        dict: {"hnsw:M": ..., "hnsw:construction_ef": ..., "hnsw:search_ef": ...}
+    """
+    return {f"hnsw:{name}": int(value) for name, value in get_hnsw_params(collection_key).items()}
+
+
+def get_tuned_search_ef(team_config: dict, collection_key: str) -> Optional[int]:
+    """チーム設定に保存されたチューニング済みのsearch_efを取得（ない場合はNone）"""
+    tuned = (team_config.get(HNSW_CONFIG_KEY) or {}).get(collection_key) or {}
+    return tuned.get("search_ef")
+
+
+def apply_search_ef(vectorstore, search_ef: int) -> bool:
+    """vectorstoreのコレクションにsearch_efを設定
+
+    コレクションのメタデータ（hnsw:search_ef）を collection.modify() で更新する。
+    chromadb 0.5.x はメタデータの変更を作成済みのセグメントに反映しないため、
+    0.5.x のローカルクライアントの場合のみ読み込み済みのHNSWインデックスにも設定する
+
+    Args:
+        vectorstore: Chroma vectorstore
+        search_ef: 設定するsearch_ef
+
+    Returns:
+        bool: 検索に反映されたか（反映できない場合はFalse）
+    """
+    import chromadb
+
+    collection = vectorstore._collection
+    search_ef = int(search_ef)
+    metadata = dict(collection.metadata or {})
+
+    if metadata.get("hnsw:search_ef") != search_ef:
+        if "hnsw:space" in metadata:
+            # modify() は距離関数の指定を受け付けず、メタデータは全体が置き換わるため変更しない
+            print(f"  > ⚠️ search_efを設定できません: {collection.name}（hnsw:spaceを指定したコレクション）")
+            return False
+        metadata["hnsw:search_ef"] = search_ef
+        collection.modify(metadata=metadata)
+
+    if not chromadb.__version__.startswith("0.5."):
+        return True
+    return _apply_search_ef_to_loaded_segment(vectorstore, search_ef)
+
+
+def _apply_search_ef_to_loaded_segment(vectorstore, search_ef: int) -> bool:
+    """読み込み済みのHNSWインデックスにsearch_efを設定（chromadb 0.5.x のローカルクライアントのみ）
+
+    0.5.x のセグメントはsearch_efを作成時のメタデータから読むため、パラメータとインデックスを直接更新する
+    （非公開APIを使用するため、chromadbの更新時は apply_search_ef() のバージョン判定を見直すこと）
+    """
+    import chromadb
+    from chromadb.segment import VectorReader
+
+    collection = vectorstore._collection
+    print(f"  > ⚠️ chromadb {chromadb.__version__}: search_ef={search_ef} を読み込み済みのHNSWインデックスに"
+          f"直接設定します（非公開API）: {collection.name}")
+    try:
+        segment = vectorstore._client._server._manager.get_segment(collection.id, VectorReader)
+        segment._params.search_ef = search_ef
+        if getattr(segment, "_index", None) is not None:
+            segment._index.set_ef(search_ef)
+        return True
+    except AttributeError as e:
+        print(f"  > ⚠️ search_efを検索に反映できません: {collection.name} ({e})")
+        return False
+
+
+def measure_recall(vectorstore, search_ef_values: List[int], k: int = 30, num_queries: int = 200, seed: int = 42) -> List[dict]:
+    """search_efごとにHNSW検索のrecall@kとレイテンシを測定
+
+    クエリはコレクション内のベクトルから無作為に抽出し、
+    全件との距離計算（厳密検索）の上位k件を正解とする。
+    クエリ自身（距離0）は正解・HNSWの検索結果の両方から除外する
+
+    Args:
+        vectorstore: 測定対象のChroma vectorstore
+        search_ef_values: 測定するsearch_efのリスト
+        k: 上位件数
+        num_queries: クエリ数
+        seed: クエリ抽出の乱数シード
+
+    Returns:
+        search_efの昇順の [{"search_ef", "recall", "latency_ms"}]（文書数が2件未満の場合は空リスト）
+    """
+    from dense_index import DenseIndex
+
+    collection = vectorstore._collection
+    data = collection.get(include=["embeddings"])
+    ids = data.get("ids") or []
+    if len(ids) < 2:
+        return []
+
+    exact_index = DenseIndex(
+        name=collection.name,
+        collection_id=str(collection.id),
+        ids=list(ids),
+        embeddings=data["embeddings"],
+        space=(collection.metadata or {}).get("hnsw:space", "l2")
+    )
+    k = min(k, exact_index.doc_count - 1)
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(exact_index.doc_count, size=min(num_queries, exact_index.doc_count), replace=False)
+    queries = np.asarray(data["embeddings"], dtype=np.float32)[rows]
+    query_ids = [exact_index.ids[row] for row in rows]
+
+    # クエリ自身を除いた上位k件（自身の分を1件多く取得）
+    expected = [
+        set([exact_index.ids[row] for row, _ in result if exact_index.ids[row] != query_id][:k])
+        for query_id, result in zip(query_ids, exact_index.search(queries, k=k + 1))
+    ]
+
+    measurements = []
+    for search_ef in sorted(set(search_ef_values)):
+        apply_search_ef(vectorstore, search_ef)
+        found = 0
+        elapsed = 0.0
+        for query, query_id, expected_ids in zip(queries, query_ids, expected):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k + 1, include=[])
+            elapsed += time.perf_counter() - start
+            found_ids = [doc_id for doc_id in result["ids"][0] if doc_id != query_id][:k]
+            found += len(expected_ids.intersection(found_ids))
+        measurements.append({
+            "search_ef": search_ef,
+            "recall": found / (k * len(queries)),
+            "latency_ms": elapsed / len(queries) * 1000
+        })
+    return measurements
+
+
+def select_search_ef(measurements: List[dict], target: float) -> Optional[dict]:
+    """目標recallを満たす最小のsearch_efの測定結果を選択
+
+    Args:
+        measurements: measure_recall() の結果
+        target: 目標recall
+
+    Returns:
+        dict: 選択した測定結果（満たすものがない場合はrecallが最大のもの、測定結果がない場合はNone）
+    """
+    if not measurements:
+        return None
+    for measurement in measurements:
+        if measurement["recall"] >= target:
+            return measurement
+    return max(measurements, key=lambda m: m["recall"])
+
+
+def tune_team_collections(
+    team_id: str,
+    target: float = None,
+    k: int = None,
+    num_queries: int = None,
+    search_ef_values: List[int] = None,
+    save: bool = True
+) -> Dict[str, dict]:
+    """チームの各コレクションのsearch_efをチューニング
+
+    Args:
+        team_id: チームID
+        target: 目標recall（デフォルト: config.HNSW_TUNING_RECALL_TARGET）
+        k: recallを測る上位件数（デフォルト: config.VECTOR_SEARCH_K）
+        num_queries: クエリ数（デフォルト: config.HNSW_TUNING_SAMPLE_QUERIES）
+        search_ef_values: 測定するsearch_ef（デフォルト: config.HNSW_TUNING_SEARCH_EF_CANDIDATES）
+        save: 選択したsearch_efをchroma_db_config.jsonに保存するか
+
+    Returns:
+        dict: {collection_key: {"selected": 選択結果, "measurements": 測定結果}}
+    """
+    from chroma_sync import get_team_multi_collection_vectorstores
+    from storage import storage
+
+    target = target if target is not None else config.HNSW_TUNING_RECALL_TARGET
+    k = k or config.VECTOR_SEARCH_K
+    num_queries = num_queries or config.HNSW_TUNING_SAMPLE_QUERIES
+    search_ef_values = search_ef_values or config.HNSW_TUNING_SEARCH_EF_CANDIDATES
+
+    # 検索時と同じvectorstore（Embedding関数は使わないため不要）
+    vectorstores = get_team_multi_collection_vectorstores(team_id, embeddings=None)
+
+    results = {}
+    for collection_key, vectorstore in vectorstores.items():
+        print(f"\n[{collection_key}] {vectorstore._collection.name} ({vectorstore._collection.count()}件)")
+        measurements = measure_recall(vectorstore, search_ef_values, k=k, num_queries=num_queries)
+        selected = select_search_ef(measurements, target)
+        for measurement in measurements:
+            mark = " <=" if measurement is selected else ""
+            print(f"  search_ef={measurement['search_ef']:>4}  recall@{k}={measurement['recall']:.3f}  "
+                  f"{measurement['latency_ms']:.2f} ms/クエリ{mark}")
+        if selected is None:
+            print("  > コレクションが空のためスキップ")
+        elif selected["recall"] < target:
+            print(f"  > ⚠️ 目標recall {target} を満たすsearch_efがありません（最大recallの値を選択）")
+        results[collection_key] = {"selected": selected, "measurements": measurements}
+
+    if save:
+        config_path = Path(storage.get_team_path(team_id, 'chroma')) / "chroma_db_config.json"
+        team_config = {}
+        if config_path.exists():
+            with open(config_path, 'r') as f:
+                team_config = json.load(f)
+
+        hnsw_config = team_config.get(HNSW_CONFIG_KEY) or {}
+        for collection_key, result in results.items():
+            selected = result["selected"]
+            if selected is None:
+                continue
+            hnsw_config[collection_key] = {
+                "search_ef": selected["search_ef"],
+                "recall": round(selected["recall"], 4),
+                "recall_target": target,
+                "k": k,
+                "doc_count": vectorstores[collection_key]._collection.count(),
+                "tuned_at": datetime.now().isoformat()
+            }
+        team_config[HNSW_CONFIG_KEY] = hnsw_config
+        team_config['updated_at'] = datetime.now().isoformat()
+
+        with open(config_path, 'w') as f:
+            json.dump(team_config, f, indent=2)
+        print(f"\nチューニング結果を保存: {config_path}")
+
+    # 測定後のsearch_efを選択結果（保存しない場合は元の値）に戻す
+    for collection_key, vectorstore in vectorstores.items():
+        selected = results[collection_key]["selected"]
+        if save and selected is not None:
+            apply_search_ef(vectorstore, selected["search_ef"])
+        else:
+            apply_search_ef(vectorstore, get_hnsw_params(collection_key)["search_ef"])
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSWのsearch_efをrecall@k目標に合わせてチューニング")
+    parser.add_argument("--team", required=True, help="チームID")
+    parser.add_argument("--target", type=float, default=config.HNSW_TUNING_RECALL_TARGET, help="目標recall")
+    parser.add_argument("--k", type=int, default=config.VECTOR_SEARCH_K, help="recallを測る上位件数")
+    parser.add_argument("--queries", type=int, default=config.HNSW_TUNING_SAMPLE_QUERIES, help="クエリ数")
+    parser.add_argument("--ef", type=int, nargs="+", default=None, help="測定するsearch_efのリスト")
+    parser.add_argument("--dry-run", action="store_true", help="測定のみ行い、結果を保存しない")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"HNSW search_ef チューニング（チーム: {args.team}, 目標 recall@{args.k} >= {args.target}）")
+    print("=" * 70)
+
+    tune_team_collections(
+        args.team,
+        target=args.target,
+        k=args.k,
+        num_queries=args.queries,
+        search_ef_values=args.ef,
+        save=not args.dry_run
+    )
+
+
+if __name__ == "__main__":
+    main()
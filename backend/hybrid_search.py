@@ -0,0 +1,138 @@
+"""
+ハイブリッド検索モジュール（v3.3.0）
+
+セマンティック検索とBM25キーワード検索の候補を、BM25インデックスの文書番号（整数）に揃えて統合する
+- 両方の検索の候補の和集合について、セマンティック関連度とBM25スコアの両方を計算する
+  （片方の検索にしか現れない候補も、もう片方のスコアを0とせず実際の値で評価する）
+- 2つのスコア配列をそれぞれmin-max正規化し、alphaで重み付けした和で上位k件を選ぶ
+- Documentは上位k件分のみ生成する（セマンティック検索の結果を再利用し、
+  キーワード検索のみの候補はBM25インデックス内の本文・メタデータから生成）
+- セマンティック検索の結果はChromaのIDで文書番号に揃える（同じnote_idの別チャンクと取り違えない）
+- 同じnote_idの候補（複数チャンク）は統合スコアの高い1件のみ返す
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from bm25_index import resolve_note_id
+from vector_storage import score_candidates
+
+
+def _min_max_normalize(scores: np.ndarray) -> np.ndarray:
+    """スコア配列を0-1に正規化（全て同じ値の場合は0）"""
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+def hybrid_search(
+    vectorstore,
+    index,
+    queries: List[str],
+    query_embeddings: List[List[float]],
+    semantic_result_sets: List[List[tuple]],
+    vector_storage: dict,
+    alpha: float,
+    k: int = 30
+) -> List[List[tuple]]:
+    """セマンティック検索とキーワード検索の候補を統合してスコアリング
+
+    Args:
+        vectorstore: 検索対象のChroma vectorstore
+        index: vectorstoreのBM25インデックス
+        queries: 検索クエリのリスト
+        query_embeddings: 全次元のクエリベクトルのリスト
+        semantic_result_sets: クエリごとのセマンティック検索結果 (Document, 関連度) のリスト
+        vector_storage: コレクションのベクトル保存形式
+        alpha: セマンティック検索の重み（0.0-1.0）
+        k: クエリごとの上位件数
+
+    Returns:
+        クエリごとの (Document, 統合スコア) タプルのリスト
+    """
+    from langchain_core.documents import Document
+
+    doc_count = index.doc_count
+    # BM25インデックスにない文書（セマンティック検索のみ）に割り当てる番号（doc_count以降、BM25スコアは0）
+    extra_documents: Dict[str, int] = {}
+
+    candidates = []
+    for query, semantic_results in zip(queries, semantic_result_sets):
+        # セマンティック検索の候補: {文書番号: (Document, 関連度)}
+        semantic_hits = {}
+        for doc, score in semantic_results:
+            # 同じチャンクの文書番号に揃える（IDがインデックスにない場合のみnote_idで引く）
+            doc_index = index.find_document(doc.id) if doc.id else None
+            if doc_index is None:
+                doc_index = index.find_note(resolve_note_id(doc.id, doc.metadata))
+            if doc_index is None:
+                key = doc.id or resolve_note_id(doc.id, doc.metadata)
+                doc_index = extra_documents.setdefault(key, doc_count + len(extra_documents))
+            if doc_index not in semantic_hits:
+                semantic_hits[doc_index] = (doc, score)
+
+        keyword_hits = [doc_index for doc_index, _ in index.search(query, k=k)]
+        doc_indices = np.union1d(
+            np.fromiter(semantic_hits, dtype=np.int64, count=len(semantic_hits)),
+            np.asarray(keyword_hits, dtype=np.int64)
+        )
+        candidates.append((doc_indices, semantic_hits))
+
+    # キーワード検索のみの候補: Chroma IDでまとめてセマンティック関連度を計算
+    keyword_only = sorted({
+        int(doc_index)
+        for doc_indices, semantic_hits in candidates
+        for doc_index in doc_indices
+        if doc_index not in semantic_hits
+    })
+    keyword_documents = {doc_index: index.get_document(doc_index) for doc_index in keyword_only}
+    keyword_columns = {doc_index: i for i, doc_index in enumerate(keyword_only)}
+    keyword_semantic_scores = score_candidates(
+        vectorstore,
+        query_embeddings,
+        [keyword_documents[doc_index][0] for doc_index in keyword_only],
+        vector_storage
+    )
+
+    result_sets = []
+    for query_index, (query, (doc_indices, semantic_hits)) in enumerate(zip(queries, candidates)):
+        if not len(doc_indices):
+            result_sets.append([])
+            continue
+
+        # 文書番号に揃えたセマンティック関連度・BM25スコアの配列
+        semantic_scores = np.array([
+            semantic_hits[doc_index][1] if doc_index in semantic_hits
+            else keyword_semantic_scores[query_index, keyword_columns[doc_index]]
+            for doc_index in doc_indices
+        ], dtype=np.float64)
+        # ベクトルを取得できなかった候補は最低スコアとして扱う
+        if np.isnan(semantic_scores).any():
+            valid = semantic_scores[~np.isnan(semantic_scores)]
+            semantic_scores = np.nan_to_num(semantic_scores, nan=valid.min() if len(valid) else 0.0)
+        keyword_scores = index.score_documents(query, doc_indices)
+
+        combined = alpha * _min_max_normalize(semantic_scores) + (1 - alpha) * _min_max_normalize(keyword_scores)
+        order = np.lexsort((doc_indices, -combined))
+
+        results = []
+        seen_notes = set()
+        for i in order:
+            doc_index = int(doc_indices[i])
+            if doc_index in semantic_hits:
+                doc = semantic_hits[doc_index][0]
+            else:
+                doc_id, content, metadata = keyword_documents[doc_index]
+                doc = Document(page_content=content, metadata=metadata, id=doc_id)
+            note_id = resolve_note_id(doc.id, doc.metadata)
+            if note_id in seen_notes:
+                continue
+            seen_notes.add(note_id)
+            results.append((doc, float(combined[i])))
+            if len(results) >= k:
+                break
+        result_sets.append(results)
+    return result_sets
@@ -21,8 +21,14 @@ from chroma_sync import (
     get_chroma_vectorstore,
     get_team_chroma_vectorstore,
     get_team_multi_collection_vectorstores,
+    get_team_vector_storage,
     sync_chroma_to_gcs
 )
+from bm25_index import update_collection_index, invalidate_indexes, flush_indexes
+from collection_generation import advance_generation
+from embedding_cache import CachedEmbeddings, get_document_embedding_cache
+from dense_index import invalidate_dense_indexes
+from vector_storage import add_texts_with_storage
 # v3.2.0: 省略形展開処理を廃止（検索時にLLMが文脈から解釈）
 # from experimenter_profile import (
 #     extract_shortcuts_from_materials,
@@ -244,6 +250,12 @@ def ingest_notes(
     # ChromaDBの初期化（v3.2.0: 2コレクション対応）
     embeddings = OpenAIEmbeddings(model=embedding_model, api_key=api_key)
 
+    # v3.3.0: 本文ハッシュによるEmbeddingキャッシュ（再構築時、変更のないノートはAPIを呼ばない）
+    embedding_cache = get_document_embedding_cache()
+    if embedding_cache is not None:
+        embeddings = CachedEmbeddings(embeddings, model=embedding_model, cache=embedding_cache, normalize=False)
+        cache_stats_before = embedding_cache.get_stats()
+
     if team_id and multi_collection:
         # v3.2.0: 2コレクションモード
         vectorstores = get_team_multi_collection_vectorstores(
@@ -254,6 +266,9 @@ def ingest_notes(
         # 既存IDチェックはcombinedコレクションを使用
         primary_vectorstore = vectorstores["combined"]
         print("2コレクションモード: materials_methods, combinedに登録します")
+        # v3.3.0: チームのベクトル保存形式（float32 | reduced | int8）
+        vector_storage = get_team_vector_storage(team_id)
+        print(f"ベクトル保存形式: {vector_storage['mode']}")
     elif team_id:
         vectorstores = None
         primary_vectorstore = get_team_chroma_vectorstore(
@@ -270,6 +285,9 @@ def ingest_notes(
         # 再構築モード：既存IDのチェックをスキップ（全て取り込む）
         existing_ids = []
         print("再構築モード: 全てのノートを取り込みます")
+        # v3.3.0: 再構築前のBM25インデックス（ディスク上のファイルを含む）・埋め込み行列は破棄（登録バッチごとに作り直す）
+        invalidate_indexes(getattr(primary_vectorstore, "_persist_directory", None), remove_files=True)
+        invalidate_dense_indexes(getattr(primary_vectorstore, "_persist_directory", None))
     else:
         existing_ids = get_existing_ids(primary_vectorstore)
         print(f"既存の登録ノート数: {len(existing_ids)}")
@@ -384,7 +402,23 @@ def ingest_notes(
                     print(f"    バッチ {batch_num}/{total_batches}: {len(batch)}件を処理中...")
 
                     try:
-                        vectorstore.add_documents(documents=batch)
+                        # v3.3.0: add_texts（Chromaへはupsert）でキャッシュ済みEmbeddingを利用
+                        # （reduced/int8形式では縮約ベクトルを保存）
+                        added_ids = add_texts_with_storage(
+                            vectorstore,
+                            embeddings,
+                            texts=[doc.page_content for doc in batch],
+                            metadatas=[doc.metadata for doc in batch],
+                            vector_storage=vector_storage
+                        )
+                        # v3.3.0: 世代番号を進め（BM25インデックス・埋め込み行列の更新検知）、BM25インデックスを増分更新
+                        update_collection_index(
+                            vectorstore,
+                            ids=added_ids,
+                            documents=[doc.page_content for doc in batch],
+                            metadatas=[doc.metadata for doc in batch],
+                            collection_generation=advance_generation(vectorstore)
+                        )
                         print(f"    バッチ {batch_num}/{total_batches}: 完了")
                     except Exception as e:
                         print(f"    バッチ {batch_num}/{total_batches}: エラー - {str(e)}")
@@ -400,7 +434,19 @@ def ingest_notes(
                 print(f"  バッチ {batch_num}/{total_batches}: {len(batch)}件を処理中...")
 
                 try:
-                    primary_vectorstore.add_documents(documents=batch)
+                    # v3.3.0: add_texts（Chromaへはupsert）でキャッシュ済みEmbeddingを利用
+                    added_ids = primary_vectorstore.add_texts(
+                        texts=[doc.page_content for doc in batch],
+                        metadatas=[doc.metadata for doc in batch]
+                    )
+                    # v3.3.0: 世代番号を進め（BM25インデックス・埋め込み行列の更新検知）、BM25インデックスを増分更新
+                    update_collection_index(
+                        primary_vectorstore,
+                        ids=added_ids,
+                        documents=[doc.page_content for doc in batch],
+                        metadatas=[doc.metadata for doc in batch],
+                        collection_generation=advance_generation(primary_vectorstore)
+                    )
                     print(f"  バッチ {batch_num}/{total_batches}: 完了")
                 except Exception as e:
                     print(f"  バッチ {batch_num}/{total_batches}: エラー - {str(e)}")
@@ -408,6 +454,14 @@ def ingest_notes(
 
         timing_stats["embedding_total"] = time.time() - embedding_start
         print(f"\n登録完了。(Embedding生成+DB追加: {timing_stats['embedding_total']:.2f}秒)")
+        if embedding_cache is not None:
+            cache_stats = embedding_cache.get_stats()
+            cache_hits = cache_stats["disk_hits"] - cache_stats_before["disk_hits"]
+            cache_misses = cache_stats["misses"] - cache_stats_before["misses"]
+            print(f"Embeddingキャッシュ: 再利用 {cache_hits}件, 新規生成 {cache_misses}件")
+
+        # v3.3.0: 更新したBM25インデックスをディスクに保存（GCS同期・他ワーカーで利用）
+        flush_indexes(getattr(primary_vectorstore, "_persist_directory", None))
 
         # GCSに同期（本番環境のみ）
         sync_chroma_to_gcs()
@@ -0,0 +1,268 @@
+"""
+LLM応答キャッシュモジュール（v3.3.0）
+
+検索用LLM（seed固定・temperature 0）の応答をキャッシュし、同じ入力での再検索・評価でLLMを呼ばない
+- config.LLM_RESPONSE_CACHE_ENABLED（環境変数）で有効化する（デフォルト無効）
+- temperature 0で呼び出せないモデル（o1 / gpt-5 系等）の応答はキャッシュしない（SearchAgent側で判定）
+- キー: (チームID, LLMモデル名, 埋め込み済みプロンプトのSHA-256)
+- メモリ上のLRU（プロセス内の全SearchAgentで共有）+ ディスク（SQLite）の2段構成
+- ディスクの件数は LLM_RESPONSE_CACHE_DISK_SIZE 件まで（超えた分は古いものから削除）
+- LLM_RESPONSE_CACHE_TTL 秒を過ぎた応答は使用しない
+- チームのプロンプトが保存・更新・削除された場合は invalidate_team() でそのチームの応答を削除する
+- ヒット/ミス件数を記録し、get_stats() で参照できる
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config import config
+from embedding_cache import text_hash
+
+
+class DiskLLMResponseStore:
+    """SQLiteによるLLM応答の永続ストア
+
+    (team_id, model, prompt_hash) → (応答本文, 保存時刻) を保存する
+    """
+
+    def __init__(self, path: str, max_size: int):
+        """
+        Args:
+            path: SQLiteファイルのパス
+            max_size: 保存する最大件数
+        """
+        self.path = path
+        self.max_size = max_size
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "team_id TEXT NOT NULL, model TEXT NOT NULL, prompt_hash TEXT NOT NULL, "
+                "content TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (team_id, model, prompt_hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_responses_created_at ON llm_responses (created_at)"
+            )
+            self._conn.commit()
+
+    def get(self, team_id: str, model: str, prompt_hash: str) -> Optional[Tuple[str, float]]:
+        """保存済みの応答を取得
+
+        Returns:
+            (応答本文, 保存時刻)（保存されていない場合はNone）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM llm_responses WHERE team_id = ? AND model = ? AND prompt_hash = ?",
+                (team_id, model, prompt_hash)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, team_id: str, model: str, prompt_hash: str, content: str, created_at: float) -> None:
+        """応答を保存（既存のものは上書き）し、上限を超えた分を古いものから削除"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (team_id, model, prompt_hash, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (team_id, model, prompt_hash, content, created_at)
+            )
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE rowid IN ("
+                "SELECT rowid FROM llm_responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self._conn.commit()
+
+    def delete_expired(self, before: float) -> None:
+        """保存時刻がbeforeより前の応答を削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (before,))
+            self._conn.commit()
+
+    def delete_team(self, team_id: str) -> None:
+        """チームの応答を全件削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses WHERE team_id = ?", (team_id,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """全件削除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+
+
+class LLMResponseCache:
+    """LLM応答のキャッシュ（メモリ上のLRU + 任意のディスクストア）"""
+
+    def __init__(self, max_size: int, ttl: float, disk_store: Optional[DiskLLMResponseStore] = None):
+        """
+        Args:
+            max_size: メモリ上に保持する最大件数
+            ttl: 応答の有効期間（秒）
+            disk_store: ディスクストア（Noneの場合はメモリのみ）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_store = disk_store
+        self._entries: "OrderedDict[tuple, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # ヒット/ミス件数
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_store is not None:
+            disk_store.delete_expired(time.time() - ttl)
+
+    def get(self, team_id: Optional[str], model: str, prompt: str) -> Optional[str]:
+        """キャッシュ済みの応答を取得（メモリ → ディスクの順に参照）
+
+        Args:
+            team_id: チームID（Noneの場合はチームなし）
+            model: LLMモデル名
+            prompt: 埋め込み済みのプロンプト
+
+        Returns:
+            応答本文（キャッシュにない、または有効期間を過ぎている場合はNone）
+        """
+        key = (team_id or "", model, text_hash(prompt))
+        expires_before = time.time() - self.ttl
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= expires_before:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self.disk_store is not None:
+            try:
+                entry = self.disk_store.get(*key)
+            except sqlite3.Error as e:
+                print(f"  > ⚠️ LLM応答キャッシュの読み込みに失敗: {e}")
+                entry = None
+            if entry is not None and entry[1] >= expires_before:
+                self._put_memory(key, entry)
+                with self._lock:
+                    self.disk_hits += 1
+                return entry[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, team_id: Optional[str], model: str, prompt: str, content: str) -> None:
+        """応答をキャッシュに登録
+
+        Args:
+            team_id: チームID（Noneの場合はチームなし）
+            model: LLMモデル名
+            prompt: 埋め込み済みのプロンプト
+            content: 応答本文
+        """
+        key = (team_id or "", model, text_hash(prompt))
+        entry = (content, time.time())
+        self._put_memory(key, entry)
+        if self.disk_store is not None:
+            try:
+                self.disk_store.put(*key, *entry)
+            except sqlite3.Error as e:
+                print(f"  > ⚠️ LLM応答キャッシュの保存に失敗: {e}")
+
+    def _put_memory(self, key: tuple, entry: Tuple[str, float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_team(self, team_id: Optional[str]) -> None:
+        """チームの応答を全件削除（プロンプトの変更時に呼び出す）"""
+        team_key = team_id or ""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == team_key]:
+                del self._entries[key]
+        if self.disk_store is not None:
+            try:
+                self.disk_store.delete_team(team_key)
+            except sqlite3.Error as e:
+                print(f"  > ⚠️ LLM応答キャッシュの削除に失敗: {e}")
+
+    def clear(self) -> None:
+        """キャッシュを全件削除（ディスクストアを含む）"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_store is not None:
+            self.disk_store.clear()
+
+    def get_stats(self) -> dict:
+        """キャッシュの統計情報を取得
+
+        Returns:
+            dict: 件数、ヒット/ミス件数、ヒット率
+        """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "disk_enabled": self.disk_store is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+
+# LLM応答キャッシュ（プロセス内で共有）
+_llm_response_cache: Optional[LLMResponseCache] = None
+_llm_response_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> Optional[LLMResponseCache]:
+    """LLM応答キャッシュを取得（初回呼び出し時に作成）
+
+    Returns:
+        LLMResponseCache（無効の場合はNone。ディスクストアを開けない場合はメモリのみ）
+    """
+    global _llm_response_cache
+    if not config.LLM_RESPONSE_CACHE_ENABLED:
+        return None
+
+    with _llm_response_cache_lock:
+        if _llm_response_cache is None:
+            path = os.path.join(config.EMBEDDING_CACHE_DIR, "llm_responses.sqlite3")
+            disk_store = None
+            try:
+                disk_store = DiskLLMResponseStore(path, config.LLM_RESPONSE_CACHE_DISK_SIZE)
+                print(f"LLM応答のディスクキャッシュ: {path}")
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ LLM応答のディスクキャッシュを開けません: {path} ({e})")
+            _llm_response_cache = LLMResponseCache(
+                config.LLM_RESPONSE_CACHE_SIZE,
+                config.LLM_RESPONSE_CACHE_TTL,
+                disk_store
+            )
+        return _llm_response_cache
+
+
+def invalidate_team_llm_responses(team_id: Optional[str]) -> None:
+    """チームのLLM応答キャッシュを削除（キャッシュ無効時は何もしない）"""
+    cache = get_llm_response_cache()
+    if cache is not None:
+        cache.invalidate_team(team_id)
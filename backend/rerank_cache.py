@@ -0,0 +1,176 @@
+"""
+Cohereリランクのキャッシュモジュール（v3.3.0）
+
+同じ候補文書を繰り返しリランクする場合（再検索、評価、per_axisモード）にCohere APIの呼び出しを減らす
+- キー: (リランクモデル, クエリのSHA-256, 文書本文のSHA-256) → 関連度スコア
+  （Cohereの関連度スコアはクエリと文書の組ごとに決まり、同時に渡す他の文書に依存しない）
+- 候補の一部だけがキャッシュ済みの場合は、キャッシュにない文書のみAPIに送り、結果を合わせて順位付けする
+- メモリ上のLRU（プロセス内の全SearchAgentで共有、RERANK_CACHE_SIZE件まで）
+- ヒット/ミス件数とAPI呼び出し件数を記録し、get_stats() で参照できる
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional
+
+from config import config
+from embedding_cache import text_hash
+
+
+# リランク結果（Cohereのレスポンスのresultsと同じ属性名）
+RerankResult = namedtuple("RerankResult", ["index", "relevance_score"])
+
+
+class RerankCache:
+    """(モデル, クエリ, 文書) → 関連度スコアのキャッシュ（メモリ上のLRU）"""
+
+    def __init__(self, max_size: int):
+        """
+        Args:
+            max_size: 保持する最大件数（クエリと文書の組の数）
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # ヒット/ミス件数（クエリと文書の組単位）
+        self.hits = 0
+        self.misses = 0
+        # リランク要求のうちAPIを呼ばずに済んだ件数、API呼び出し回数
+        self.full_hits = 0
+        self.api_calls = 0
+
+    def get_many(self, model: str, query_hash: str, doc_hashes: List[str]) -> Dict[str, float]:
+        """キャッシュ済みのスコアを取得
+
+        Args:
+            model: リランクモデル名
+            query_hash: クエリのハッシュ
+            doc_hashes: 文書本文のハッシュのリスト（重複なし）
+
+        Returns:
+            {doc_hash: 関連度スコア}（キャッシュにないものは含まない）
+        """
+        found = {}
+        with self._lock:
+            for doc_hash in doc_hashes:
+                key = (model, query_hash, doc_hash)
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                    found[doc_hash] = score
+            self.hits += len(found)
+            self.misses += len(doc_hashes) - len(found)
+            if len(found) == len(doc_hashes):
+                self.full_hits += 1
+            else:
+                self.api_calls += 1
+        return found
+
+    def put_many(self, model: str, query_hash: str, scores: Dict[str, float]) -> None:
+        """スコアをキャッシュに登録
+
+        Args:
+            model: リランクモデル名
+            query_hash: クエリのハッシュ
+            scores: {doc_hash: 関連度スコア}
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for doc_hash, score in scores.items():
+                key = (model, query_hash, doc_hash)
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """キャッシュを全件削除"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """キャッシュの統計情報を取得
+
+        Returns:
+            dict: 件数、ヒット/ミス件数（クエリと文書の組単位）、ヒット率、API呼び出し回数
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "full_hits": self.full_hits,
+                "api_calls": self.api_calls
+            }
+
+
+def rerank(cohere_client, model: str, query: str, documents: List[str], top_n: int) -> List[RerankResult]:
+    """Cohereで文書をリランク（キャッシュ済みのスコアを再利用）
+
+    Args:
+        cohere_client: cohere.Client
+        model: リランクモデル名
+        query: クエリ
+        documents: 文書本文のリスト
+        top_n: 返す上位件数
+
+    Returns:
+        関連度スコアの降順の RerankResult(index=documentsでの位置, relevance_score) のリスト（top_n件まで）
+    """
+    if not documents:
+        return []
+
+    cache = get_rerank_cache()
+    if cache is None:
+        response = cohere_client.rerank(model=model, query=query, documents=documents, top_n=top_n)
+        return [RerankResult(r.index, r.relevance_score) for r in response.results]
+
+    query_hash = text_hash(query)
+    doc_hashes = [text_hash(document) for document in documents]
+    # 同じ本文の文書は1回だけ問い合わせる
+    unique_documents = dict(zip(doc_hashes, documents))
+    scores = cache.get_many(model, query_hash, list(unique_documents))
+
+    missing = [doc_hash for doc_hash in unique_documents if doc_hash not in scores]
+    if missing:
+        # キャッシュするため、キャッシュにない文書は全件のスコアを取得する
+        response = cohere_client.rerank(
+            model=model,
+            query=query,
+            documents=[unique_documents[doc_hash] for doc_hash in missing],
+            top_n=len(missing)
+        )
+        new_scores = {missing[r.index]: r.relevance_score for r in response.results}
+        cache.put_many(model, query_hash, new_scores)
+        scores.update(new_scores)
+
+    ranked = sorted(
+        (RerankResult(i, scores[doc_hash]) for i, doc_hash in enumerate(doc_hashes) if doc_hash in scores),
+        key=lambda r: (-r.relevance_score, r.index)
+    )
+    return ranked[:top_n]
+
+
+# リランクキャッシュ（プロセス内で共有）
+_rerank_cache: Optional[RerankCache] = None
+_rerank_cache_lock = threading.Lock()
+
+
+def get_rerank_cache() -> Optional[RerankCache]:
+    """リランクキャッシュを取得（初回呼び出し時に作成）
+
+    Returns:
+        RerankCache（無効の場合はNone）
+    """
+    global _rerank_cache
+    if not config.RERANK_CACHE_ENABLED:
+        return None
+
+    with _rerank_cache_lock:
+        if _rerank_cache is None:
+            _rerank_cache = RerankCache(config.RERANK_CACHE_SIZE)
+        return _rerank_cache
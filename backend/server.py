@@ -4,21 +4,26 @@ FastAPI Server for Experiment Notes Search System
 """
 from fastapi import FastAPI, HTTPException, File, UploadFile, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 import os
 import json
 import re
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from config import config
-from agent import SearchAgent
+from agent import SearchAgent, SearchCancelled, get_search_graph, invalidate_agent_resources, get_agent_pool_stats
 from prompts import get_all_default_prompts
 from ingest import ingest_notes
 from history import get_history_manager
 from evaluation import get_evaluator
 from storage import storage
 from prompt_manager import PromptManager
+from llm_cache import invalidate_team_llm_responses
 from middleware import AuthMiddleware, TeamMiddleware
 from auth import verify_firebase_token
 from experimenter_profile import get_experimenter_profile_manager
@@ -293,8 +298,86 @@ class TeamsListResponse(BaseModel):
     teams: List[Dict]
 
 
+# === 検索の実行（v3.3.0） ===
+# SearchAgentは同期処理（LLM・Embedding・Chroma・Cohere呼び出し）のため、イベントループをブロックしないよう
+# 専用のスレッドプールで実行する。実行中・待機中の検索が上限に達した場合は503を返す（バックプレッシャー）
+
+_search_request_executor = ThreadPoolExecutor(
+    max_workers=config.SEARCH_REQUEST_WORKERS,
+    thread_name_prefix="search-request"
+)
+_pending_search_requests = 0  # 実行中・待機中の検索数（イベントループのスレッドからのみ更新）
+
+
+def create_search_agent(request, team_id: Optional[str]) -> SearchAgent:
+    """リクエストの設定でSearchAgentを作成（/search、/evaluate、/evaluate/batch 共通）
+
+    Args:
+        request: SearchRequest | EvaluateRequest | BatchEvaluateRequest
+        team_id: チームID
+    """
+    return SearchAgent(
+        openai_api_key=request.openai_api_key,
+        cohere_api_key=request.cohere_api_key,
+        embedding_model=request.embedding_model,
+        llm_model=request.llm_model,  # 後方互換性
+        search_llm_model=request.search_llm_model,  # v3.0: 検索・判定用LLM
+        summary_llm_model=request.summary_llm_model,  # v3.0: 要約生成用LLM
+        search_mode=request.search_mode,  # v3.0.1: 検索モード
+        hybrid_alpha=request.hybrid_alpha,  # v3.0.1: ハイブリッド検索の重み
+        prompts=request.custom_prompts,
+        team_id=team_id,  # v3.0: チームID指定
+        # v3.1.0: 3軸分離検索設定
+        multi_axis_enabled=request.multi_axis_enabled,
+        fusion_method=request.fusion_method,
+        axis_weights=request.axis_weights,
+        rerank_position=request.rerank_position,
+        rerank_enabled=request.rerank_enabled
+    )
+
+
+def check_search_capacity():
+    """実行中・待機中の検索が上限（SEARCH_REQUEST_WORKERS + SEARCH_REQUEST_QUEUE_SIZE）に達している場合は503"""
+    if _pending_search_requests >= config.SEARCH_REQUEST_WORKERS + config.SEARCH_REQUEST_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=503,
+            detail="検索リクエストが混み合っています。しばらくしてから再度お試しください。",
+            headers={"Retry-After": str(config.SEARCH_REQUEST_RETRY_AFTER)}
+        )
+
+
+async def run_search_in_executor(func, *args, reject_when_busy: bool = True):
+    """同期の検索処理を検索用スレッドプールで実行
+
+    Args:
+        func: 実行する関数
+        *args: funcの引数
+        reject_when_busy: 実行中・待機中の検索が上限（SEARCH_REQUEST_WORKERS + SEARCH_REQUEST_QUEUE_SIZE）に
+            達している場合に503を返すか（Falseの場合は空くまで待機）
+
+    Returns:
+        funcの戻り値
+    """
+    global _pending_search_requests
+    if reject_when_busy:
+        check_search_capacity()
+
+    _pending_search_requests += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_search_request_executor, functools.partial(func, *args))
+    finally:
+        _pending_search_requests -= 1
+
+
 # === Endpoints ===
 
+@app.on_event("startup")
+async def compile_search_graph():
+    """検索グラフを起動時にコンパイル（v3.3.0: 最初の検索の処理時間に含めない）"""
+    get_search_graph()
+
+
 @app.get("/")
 async def root():
     """ルートエンドポイント"""
@@ -482,6 +565,9 @@ async def delete_team(request: Request, team_id: str):
     try:
         result = teams.delete_team(team_id)
 
+        # v3.3.0: チームを削除したため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return DeleteTeamResponse(
             success=result['success'],
             message=result['message']
@@ -522,6 +608,9 @@ async def update_folder_paths(request: FolderPathsRequest):
             chroma_db=request.chroma_db
         )
 
+        # v3.3.0: ChromaDBのパスが変わる可能性があるため、共有中の検索リソースを破棄
+        invalidate_agent_resources()
+
         return FolderPathsResponse(
             success=True,
             message="フォルダパス設定を更新しました",
@@ -554,6 +643,40 @@ async def get_folder_paths():
     }
 
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """キャッシュの統計情報（ヒット/ミス件数）を取得（v3.3.0）"""
+    from embedding_cache import get_query_embedding_cache, get_document_embedding_cache
+    from llm_cache import get_llm_response_cache
+    from rerank_cache import get_rerank_cache
+
+    document_embedding_cache = get_document_embedding_cache()
+    llm_response_cache = get_llm_response_cache()
+    rerank_cache = get_rerank_cache()
+
+    return {
+        "success": True,
+        "caches": {
+            "query_embedding": get_query_embedding_cache().get_stats(),
+            "document_embedding": document_embedding_cache.get_stats() if document_embedding_cache else None,
+            "llm_response": llm_response_cache.get_stats() if llm_response_cache else None,
+            "rerank": rerank_cache.get_stats() if rerank_cache else None,
+            "agent_resources": get_agent_pool_stats(),
+        }
+    }
+
+
+@app.get("/focus-classification/stats")
+async def get_focus_classification_stats():
+    """重点指示の分類経路（ルール/LLM/スキップ）ごとの件数を取得（v3.3.0）"""
+    from focus_classifier import get_focus_classification_stats as get_stats
+
+    return {
+        "success": True,
+        "stats": get_stats()
+    }
+
+
 @app.post("/search", response_model=SearchResponse)
 async def search_experiments(req_obj: Request, request: SearchRequest):
     """実験ノート検索（v3.0: マルチテナント対応、v3.1.0: 3軸分離検索対応）"""
@@ -567,26 +690,6 @@ async def search_experiments(req_obj: Request, request: SearchRequest):
         axis_str = "3軸" if request.multi_axis_enabled else "単一"
         print(f"\n📝 [/search] {mode_str}モード | プロンプト: {prompt_display} | {axis_str}検索 | {request.search_mode or 'semantic'}")
 
-        # エージェント初期化（v3.1.0: 3軸分離検索対応）
-        agent = SearchAgent(
-            openai_api_key=request.openai_api_key,
-            cohere_api_key=request.cohere_api_key,
-            embedding_model=request.embedding_model,
-            llm_model=request.llm_model,  # 後方互換性
-            search_llm_model=request.search_llm_model,  # v3.0: 検索・判定用LLM
-            summary_llm_model=request.summary_llm_model,  # v3.0: 要約生成用LLM
-            search_mode=request.search_mode,  # v3.0.1: 検索モード
-            hybrid_alpha=request.hybrid_alpha,  # v3.0.1: ハイブリッド検索の重み
-            prompts=request.custom_prompts,
-            team_id=team_id,  # v3.0: チームID指定
-            # v3.1.0: 3軸分離検索設定
-            multi_axis_enabled=request.multi_axis_enabled,
-            fusion_method=request.fusion_method,
-            axis_weights=request.axis_weights,
-            rerank_position=request.rerank_position,
-            rerank_enabled=request.rerank_enabled
-        )
-
         # 検索実行
         input_data = {
             "type": request.type,
@@ -596,7 +699,12 @@ async def search_experiments(req_obj: Request, request: SearchRequest):
             "instruction": request.instruction
         }
 
-        result = agent.run(input_data, evaluation_mode=request.evaluation_mode)
+        # v3.3.0: エージェント初期化・検索を検索用スレッドプールで実行（イベントループをブロックしない）
+        def execute_search():
+            agent = create_search_agent(request, team_id)
+            return agent.run(input_data, evaluation_mode=request.evaluation_mode)
+
+        result = await run_search_in_executor(execute_search)
 
         # 結果から最後のメッセージを取得
         final_message = ""
@@ -615,6 +723,8 @@ async def search_experiments(req_obj: Request, request: SearchRequest):
             search_query=result.get("search_query", "")
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_str = str(e)
@@ -628,6 +738,91 @@ async def search_experiments(req_obj: Request, request: SearchRequest):
         raise HTTPException(status_code=500, detail=f"検索エラー: {error_str}")
 
 
+@app.post("/search/stream")
+async def search_experiments_stream(req_obj: Request, request: SearchRequest):
+    """実験ノート検索（Server-Sent Events、v3.3.0）
+
+    /search と同じリクエストで、処理の途中経過をSSEで返す
+    - event: node     各ノードの完了時 {"event": "node", "node": ノード名}
+    - event: results  検索結果の確定時（要約の生成前） {"note_ids": [...], "retrieved_docs": [...]}
+    - event: token    比較・要約のトークン {"content": str}
+    - event: done     完了時（/search のレスポンスと同じ内容） {"message", "retrieved_docs", "normalized_materials", "search_query"}
+    - event: error    エラー時 {"detail": str}
+    """
+    team_id = getattr(req_obj.state, 'team_id', None)
+    print(f"\n📝 [/search/stream] プロンプト: {request.prompt_name or ('カスタム' if request.custom_prompts else 'デフォルト')} | {request.search_mode or 'semantic'}")
+
+    input_data = {
+        "type": request.type,
+        "purpose": request.purpose,
+        "materials": request.materials,
+        "methods": request.methods,
+        "instruction": request.instruction
+    }
+
+    # 混雑時はストリームを開始する前に503を返す
+    check_search_capacity()
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def execute_search():
+        """検索用スレッドプールで実行し、イベントをイベントループのキューに渡す"""
+        try:
+            # 実行待ちの間にクライアントが切断した場合は開始しない
+            if cancelled.is_set():
+                print("⚠️ [/search/stream] クライアントが切断したため、検索を開始しません")
+                return
+            agent = create_search_agent(request, team_id)
+            for event in agent.stream(input_data, evaluation_mode=request.evaluation_mode, cancel_event=cancelled):
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except SearchCancelled:
+            print("⚠️ [/search/stream] クライアントが切断したため、検索を中断しました")
+        except Exception as e:
+            import traceback
+            print(f"Error in search stream: {e}")
+            print(f"Stack trace:\n{traceback.format_exc()}")
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "error", "detail": f"検索エラー: {e}"})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    async def watch_disconnect():
+        """クライアントの切断を監視し、中断フラグをセットする
+
+        イベントの送信時にしか切断を検知できないと、LLM・リランクの待ち時間中は検索が続くため、別タスクで確認する
+        """
+        while not cancelled.is_set():
+            if await req_obj.is_disconnected():
+                cancelled.set()
+                break
+            await asyncio.sleep(config.SEARCH_STREAM_DISCONNECT_POLL_INTERVAL)
+
+    search_task = asyncio.ensure_future(run_search_in_executor(execute_search, reject_when_busy=False))
+    watch_task = asyncio.ensure_future(watch_disconnect())
+
+    async def event_stream():
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            await search_task
+        finally:
+            # クライアントが切断した場合は、次のノード・外部API呼び出しの前で検索を打ち切る
+            cancelled.set()
+            watch_task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/prompts", response_model=PromptsResponse)
 async def get_default_prompts():
     """デフォルトプロンプトを取得"""
@@ -716,6 +911,9 @@ async def ingest_notes_endpoint(req_obj: Request, request: IngestRequest):
             use_synonym_normalization=request.use_synonym_normalization  # v3.2.1: 同義語正規化
         )
 
+        # v3.3.0: コレクションが更新されたため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         if request.rebuild_mode:
             message = f"ChromaDB再構築完了: {len(new_notes)}件のノートを取り込みました。"
         else:
@@ -1107,6 +1305,9 @@ async def add_synonym_group(req: SynonymGroupRequest, request: Request):
         if not success:
             raise HTTPException(status_code=400, detail=f"グループが既に存在します: {req.canonical}")
 
+        # v3.3.0: 同義語辞書が変わったため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return SynonymDictionaryResponse(
             success=True,
             groups=dictionary.get_all_groups(),
@@ -1136,6 +1337,9 @@ async def update_synonym_group(canonical: str, req: SynonymGroupUpdateRequest, r
         if not success:
             raise HTTPException(status_code=404, detail=f"グループが見つかりません: {canonical}")
 
+        # v3.3.0: 同義語辞書が変わったため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return SynonymDictionaryResponse(
             success=True,
             groups=dictionary.get_all_groups(),
@@ -1161,6 +1365,9 @@ async def delete_synonym_group(canonical: str, request: Request):
         if not success:
             raise HTTPException(status_code=404, detail=f"グループが見つかりません: {canonical}")
 
+        # v3.3.0: 同義語辞書が変わったため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return SynonymDictionaryResponse(
             success=True,
             groups=dictionary.get_all_groups(),
@@ -1186,6 +1393,9 @@ async def add_synonym_variant(canonical: str, req: SynonymVariantRequest, reques
         if not success:
             raise HTTPException(status_code=404, detail=f"グループが見つかりません: {canonical}")
 
+        # v3.3.0: 同義語辞書が変わったため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return SynonymDictionaryResponse(
             success=True,
             groups=dictionary.get_all_groups(),
@@ -1211,6 +1421,9 @@ async def delete_synonym_variant(canonical: str, variant: str, request: Request)
         if not success:
             raise HTTPException(status_code=404, detail=f"グループが見つかりません: {canonical}")
 
+        # v3.3.0: 同義語辞書が変わったため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         return SynonymDictionaryResponse(
             success=True,
             groups=dictionary.get_all_groups(),
@@ -1380,26 +1593,6 @@ async def evaluate_rag(req_obj: Request, request: EvaluateRequest):
         if not test_case:
             raise HTTPException(status_code=404, detail="テストケースが見つかりません")
 
-        # 検索を実行（v3.1.0: 3軸分離検索対応）
-        agent = SearchAgent(
-            openai_api_key=request.openai_api_key,
-            cohere_api_key=request.cohere_api_key,
-            embedding_model=request.embedding_model,
-            llm_model=request.llm_model,
-            search_llm_model=request.search_llm_model,
-            summary_llm_model=request.summary_llm_model,
-            search_mode=request.search_mode,
-            hybrid_alpha=request.hybrid_alpha,
-            prompts=request.custom_prompts,
-            team_id=team_id,  # v3.0: チームID指定
-            # v3.1.0: 3軸分離検索設定
-            multi_axis_enabled=request.multi_axis_enabled,
-            fusion_method=request.fusion_method,
-            axis_weights=request.axis_weights,
-            rerank_position=request.rerank_position,
-            rerank_enabled=request.rerank_enabled
-        )
-
         input_data = {
             "type": "initial_search",
             "purpose": test_case.query.get('purpose', ''),
@@ -1408,7 +1601,10 @@ async def evaluate_rag(req_obj: Request, request: EvaluateRequest):
             "instruction": ""
         }
 
-        result = agent.run(input_data)
+        # 検索を実行（v3.3.0: 検索用スレッドプールで実行）
+        result = await run_search_in_executor(
+            lambda: create_search_agent(request, team_id).run(input_data)
+        )
 
         # 検索結果を整形
         retrieved_docs = result.get("retrieved_docs", [])
@@ -1460,26 +1656,6 @@ async def batch_evaluate_rag(req_obj: Request, request: BatchEvaluateRequest):
                 print(f"テストケースが見つかりません: {test_case_id}")
                 continue
 
-            # 検索を実行（v3.1.0: 3軸分離検索対応）
-            agent = SearchAgent(
-                openai_api_key=request.openai_api_key,
-                cohere_api_key=request.cohere_api_key,
-                embedding_model=request.embedding_model,
-                llm_model=request.llm_model,
-                search_llm_model=request.search_llm_model,
-                summary_llm_model=request.summary_llm_model,
-                search_mode=request.search_mode,
-                hybrid_alpha=request.hybrid_alpha,
-                prompts=request.custom_prompts,
-                team_id=team_id,  # v3.0: チームID指定
-                # v3.1.0: 3軸分離検索設定
-                multi_axis_enabled=request.multi_axis_enabled,
-                fusion_method=request.fusion_method,
-                axis_weights=request.axis_weights,
-                rerank_position=request.rerank_position,
-                rerank_enabled=request.rerank_enabled
-            )
-
             input_data = {
                 "type": "initial_search",
                 "purpose": test_case.query.get('purpose', ''),
@@ -1488,7 +1664,11 @@ async def batch_evaluate_rag(req_obj: Request, request: BatchEvaluateRequest):
                 "instruction": ""
             }
 
-            result = agent.run(input_data)
+            # 検索を実行（v3.3.0: 検索用スレッドプールで実行。バッチの途中で503にならないよう空くまで待機）
+            result = await run_search_in_executor(
+                lambda: create_search_agent(request, team_id).run(input_data),
+                reject_when_busy=False
+            )
 
             # 検索結果を整形
             retrieved_docs = result.get("retrieved_docs", [])
@@ -1575,6 +1755,9 @@ async def save_prompt(http_request: Request, request: SavePromptRequest):
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result.get("error", "保存に失敗しました"))
 
+        # v3.3.0: チームのプロンプトが変わったため、LLM応答キャッシュを削除
+        invalidate_team_llm_responses(team_id)
+
         return result
 
     except HTTPException:
@@ -1624,6 +1807,9 @@ async def delete_prompt(request: Request, name: str):
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result.get("error", "削除に失敗しました"))
 
+        # v3.3.0: チームのプロンプトが変わったため、LLM応答キャッシュを削除
+        invalidate_team_llm_responses(team_id)
+
         return result
 
     except HTTPException:
@@ -1651,6 +1837,9 @@ async def update_prompt(http_request: Request, request: UpdatePromptRequest):
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result.get("error", "更新に失敗しました"))
 
+        # v3.3.0: チームのプロンプトが変わったため、LLM応答キャッシュを削除
+        invalidate_team_llm_responses(team_id)
+
         return result
 
     except HTTPException:
@@ -1735,6 +1924,9 @@ async def reset_chroma_db_endpoint(
             success = reset_chroma_db()
             message = "ChromaDBをリセットしました。「ChromaDBを再構築」ボタンをクリックして、既存ノートからデータベースを再構築してください。"
 
+        # v3.3.0: コレクションを削除したため、共有中の検索リソースを破棄
+        invalidate_agent_resources(team_id)
+
         if success:
             return ChromaDBResetResponse(
                 success=True,
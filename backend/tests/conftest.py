@@ -0,0 +1,5 @@
+"""backendのモジュール（フラット配置）をテストからimportできるようにする"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
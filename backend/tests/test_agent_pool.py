@@ -0,0 +1,61 @@
+"""AgentResourcesプールのテスト（他のワーカーでの破棄・リセットの検知）"""
+import pytest
+
+import agent
+import chroma_sync
+from agent import get_agent_resources, invalidate_agent_resources
+from collection_generation import advance_named_generation
+from config import config
+from storage import LocalStorage, storage
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHROMA_DB_FOLDER", str(tmp_path / "chroma"))
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(config, "AGENT_POOL_ENABLED", True)
+    # 辞書・Chroma設定ファイルをリポジトリ内に作成しない
+    monkeypatch.setattr(storage, "backend", LocalStorage(str(tmp_path / "storage")))
+    monkeypatch.setattr(chroma_sync, "get_chroma_config_path", lambda: str(tmp_path / "chroma_db_config.json"))
+    agent._agent_resources.clear()
+    yield
+    agent._agent_resources.clear()
+
+
+def _get():
+    return get_agent_resources("sk-test", "co-test", "text-embedding-3-small", "gpt-4o-mini", "gpt-4o-mini")
+
+
+def test_pooled_resources_are_reused(pool):
+    assert _get() is _get()
+
+
+def test_invalidation_in_another_worker_rebuilds_resources(pool):
+    resources = _get()
+
+    # 他のワーカーでの invalidate_agent_resources() はプロセス内のプールに触れず、世代番号ファイルのみを進める
+    advance_named_generation(config.EMBEDDING_CACHE_DIR, agent._INVALIDATION_GENERATION_ALL)
+
+    rebuilt = _get()
+    assert rebuilt is not resources
+    assert _get() is rebuilt
+
+
+def test_team_invalidation_does_not_rebuild_other_teams(pool):
+    resources = _get()
+    invalidate_agent_resources("other-team")
+    assert resources.is_current()
+
+
+def test_collection_reset_in_another_worker_rebuilds_resources(pool):
+    resources = _get()
+    vectorstore = resources.vectorstore
+    name = vectorstore._collection.name
+
+    # 他のワーカーでのリセット（コレクションの削除・再作成、破棄の通知なし）
+    vectorstore._client.delete_collection(name)
+    vectorstore._client.create_collection(name)
+
+    rebuilt = _get()
+    assert rebuilt is not resources
+    assert rebuilt.vectorstore._collection.id == vectorstore._client.get_collection(name).id
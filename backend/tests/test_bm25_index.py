@@ -0,0 +1,218 @@
+"""BM25インデックスのテスト（スコア計算・永続化・増分更新）"""
+import math
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import bm25_index
+import collection_generation
+from bm25_index import BM25Index, MappedBM25Index, get_collection_index, get_index_path, update_collection_index
+from collection_generation import advance_generation
+from config import config
+from tokenizer import tokenize
+
+
+class _StubCollection:
+    def __init__(self, name: str, ids, documents):
+        self.name = name
+        self.id = f"{name}-id"
+        self.ids = list(ids)
+        self.documents = list(documents)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, include=None):
+        return {"ids": list(self.ids), "documents": list(self.documents), "metadatas": [{} for _ in self.ids]}
+
+    def add(self, ids, documents):
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+
+    def replace(self, doc_id, document):
+        self.documents[self.ids.index(doc_id)] = document
+
+
+@pytest.fixture(autouse=True)
+def memory_generations(monkeypatch):
+    monkeypatch.setattr(collection_generation, "_memory_generations", {})
+
+
+@pytest.fixture
+def vectorstore():
+    bm25_index.invalidate_indexes()
+    collection = _StubCollection("notes", ["a", "b"], ["エタノール 撹拌", "水酸化ナトリウム 加熱"])
+    yield SimpleNamespace(_collection=collection, _persist_directory="")
+    bm25_index.invalidate_indexes()
+
+
+def test_update_does_not_modify_index_in_use(vectorstore):
+    """検索中のインデックスは変更せず、更新後のインデックスに差し替える"""
+    before = get_collection_index(vectorstore)
+    scores_before = before.score_queries(["エタノール"]).copy()
+
+    vectorstore._collection.add(["c"], ["エタノール 冷却"])
+    update_collection_index(vectorstore, ["c"], ["エタノール 冷却"], collection_generation=advance_generation(vectorstore))
+
+    assert before.doc_count == 2
+    assert before.score_queries(["エタノール"]).tolist() == scores_before.tolist()
+
+    after = get_collection_index(vectorstore)
+    assert after is not before
+    assert after.doc_count == 3
+    assert sorted(doc_index for doc_index, _ in after.search("エタノール", k=3)) == [0, 2]
+
+
+def test_copy_matches_original():
+    """複製したインデックスは元と同じスコアを返し、追記しても元は変わらない"""
+    index = BM25Index(name="notes")
+    index.add_documents(["a", "b"], ["エタノール 撹拌", "水酸化ナトリウム 加熱"])
+    copied = index.copy()
+
+    assert copied.score_queries(["エタノール 加熱"]).tolist() == index.score_queries(["エタノール 加熱"]).tolist()
+
+    term = index.vocabulary.tokens[0]
+    postings_before = index.get_postings(term).doc_indices.tolist()
+
+    copied.add_documents(["c"], ["エタノール 冷却"])
+    assert index.doc_count == 2
+    assert index.get_postings(term).doc_indices.tolist() == postings_before
+    assert copied.doc_count == 3
+
+
+def test_same_count_replace_is_detected(vectorstore):
+    """件数が変わらない置換（upsert）も世代番号で検知して再構築する"""
+    before = get_collection_index(vectorstore)
+    assert before.search("acetone", k=3) == []
+
+    vectorstore._collection.replace("b", "acetone heat")
+    advance_generation(vectorstore)
+
+    after = get_collection_index(vectorstore)
+    assert after is not before
+    assert [doc_index for doc_index, _ in after.search("acetone", k=3)] == [1]
+
+
+def test_stale_index_file_is_not_reused(tmp_path):
+    """他ワーカーの登録後は、保存済みのインデックスファイルを使わずに再構築する"""
+    bm25_index.invalidate_indexes()
+    collection = _StubCollection("notes", ["a", "b"], ["エタノール 撹拌", "水酸化ナトリウム 加熱"])
+    vectorstore = SimpleNamespace(_collection=collection, _persist_directory=str(tmp_path))
+    try:
+        get_collection_index(vectorstore)
+        path = get_index_path(str(tmp_path), "notes")
+        assert MappedBM25Index(path).collection_generation == 0
+
+        # 他ワーカーでの置換（このプロセスのキャッシュは破棄済みとする）
+        collection.replace("a", "acetone stir")
+        advance_generation(vectorstore)
+        bm25_index.invalidate_indexes()
+
+        index = get_collection_index(vectorstore)
+        assert index.collection_generation == 1
+        assert [doc_index for doc_index, _ in index.search("acetone", k=3)] == [0]
+        assert MappedBM25Index(path).collection_generation == 1
+    finally:
+        bm25_index.invalidate_indexes()
+
+
+def test_incremental_update_after_other_write_rebuilds(vectorstore):
+    """増分更新の前に他の登録があった場合は追記せずに再構築する"""
+    get_collection_index(vectorstore)
+    vectorstore._collection.replace("a", "acetone stir")
+    advance_generation(vectorstore)
+
+    vectorstore._collection.add(["c"], ["エタノール 冷却"])
+    update_collection_index(vectorstore, ["c"], ["エタノール 冷却"], collection_generation=advance_generation(vectorstore))
+
+    index = get_collection_index(vectorstore)
+    assert index.collection_generation == 2
+    assert [doc_index for doc_index, _ in index.search("acetone", k=3)] == [0]
+
+
+_WORDS = ["acetone", "ethanol", "water", "stir", "heat", "cool", "filter", "dry", "naoh", "hcl", "wash", "mix"]
+
+
+def _random_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    ids = [f"doc-{i}" for i in range(n)]
+    documents = [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 12))) for _ in range(n)]
+    metadatas = [{"note_id": f"ID{i}"} for i in range(n)]
+    return ids, documents, metadatas
+
+
+def _reference_scores(documents, query):
+    """全文書をトークン化して計算するBM25（転置インデックス導入前の計算方法）"""
+    tokenized = [tokenize(document) for document in documents]
+    n = len(tokenized)
+    avgdl = sum(len(tokens) for tokens in tokenized) / n
+    scores = []
+    for tokens in tokenized:
+        tfs = Counter(tokens)
+        score = 0.0
+        for term in tokenize(query):
+            df = sum(1 for other in tokenized if term in other)
+            if not tfs[term]:
+                continue
+            idf = math.log((n - df + 0.5) / (df + 0.5) + 1)
+            tf = tfs[term]
+            score += idf * tf * (bm25_index.BM25_K1 + 1) / (
+                tf + bm25_index.BM25_K1 * (1 - bm25_index.BM25_B + bm25_index.BM25_B * len(tokens) / avgdl)
+            )
+        scores.append(score)
+    return scores
+
+
+def _build(n: int = 200) -> BM25Index:
+    index = BM25Index("notes", "notes-id")
+    index.add_documents(*_random_corpus(n))
+    return index
+
+
+@pytest.mark.parametrize("query", ["acetone", "heat stir", "naoh naoh wash", "unknownword"])
+def test_scores_match_full_scan(query):
+    _, documents, _ = _random_corpus(200)
+    scores = _build(200).score_queries([query])[0]
+    assert scores.tolist() == pytest.approx(_reference_scores(documents, query))
+
+
+def test_only_query_term_postings_are_read(monkeypatch):
+    index = _build(200)
+    terms = []
+    original = BM25Index.get_postings
+    monkeypatch.setattr(BM25Index, "get_postings", lambda self, term: terms.append(term) or original(self, term))
+
+    index.search("acetone heat", k=5)
+
+    assert sorted(set(terms)) == ["acetone", "heat"]
+
+
+@pytest.mark.parametrize("query", ["acetone", "heat stir filter", ["naoh wash", "hcl dry"]])
+def test_maxscore_matches_exhaustive_search(monkeypatch, query):
+    """語の種類が少なく同点が多いコーパスでも、同点の順序を含めて全件スコアリングと一致する"""
+    index = _build(500)
+    monkeypatch.setattr(config, "BM25_MAXSCORE_ENABLED", False)
+    exhaustive = index.search(query, k=10)
+    monkeypatch.setattr(config, "BM25_MAXSCORE_ENABLED", True)
+    maxscore = index.search(query, k=10)
+
+    assert [doc_index for doc_index, _ in maxscore] == [doc_index for doc_index, _ in exhaustive]
+    assert [score for _, score in maxscore] == pytest.approx([score for _, score in exhaustive])
+
+
+def test_saved_index_matches_in_memory_index(tmp_path):
+    index = _build(200)
+    path = str(tmp_path / "notes.bm25")
+    index.save(path)
+    mapped = MappedBM25Index(path, name="notes")
+
+    queries = ["acetone", "heat stir", "unknownword"]
+    assert mapped.doc_count == index.doc_count
+    assert np.allclose(mapped.score_queries(queries), index.score_queries(queries))
+    assert mapped.search_notes("water mix", k=5) == index.search_notes("water mix", k=5)
+    assert mapped.find_document("doc-17") == index.find_document("doc-17") == 17
+    assert mapped.get_note_id(17) == "ID17"
+    assert mapped.get_document(17) == index.get_document(17)
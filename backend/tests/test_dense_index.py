@@ -0,0 +1,138 @@
+"""厳密ベクトル検索（numpyバックエンド）のテスト"""
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import collection_generation
+import dense_index
+from collection_generation import advance_generation
+from config import config
+from dense_index import DenseIndex, get_dense_backend, get_dense_index
+
+
+class _StubCollection:
+    def __init__(self, name: str, embeddings: dict, space: str = "l2"):
+        self.name = name
+        self.id = f"{name}-id"
+        self.metadata = {"hnsw:space": space}
+        self.embeddings = dict(embeddings)
+        self.loads = 0
+        self.load_started = threading.Event()
+        self.release = None  # threading.Event（設定した場合は読み込みを待機させる）
+
+    def count(self) -> int:
+        return len(self.embeddings)
+
+    def get(self, include=None):
+        self.loads += 1
+        self.load_started.set()
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        return {"ids": list(self.embeddings), "embeddings": list(self.embeddings.values())}
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(collection_generation, "_memory_generations", {})
+    dense_index.invalidate_dense_indexes()
+    yield
+    dense_index.invalidate_dense_indexes()
+
+
+def _make_vectorstore(collection, persist_directory: str = ""):
+    return SimpleNamespace(_collection=collection, _persist_directory=persist_directory)
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_search_matches_brute_force(space, dtype):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, 16)).astype(np.float32)
+    if space == "ip":
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.normal(size=(3, 16)).astype(np.float32)
+    index = DenseIndex("notes", "id", [f"d{i}" for i in range(100)], vectors, space=space, dtype=dtype)
+
+    for query, result in zip(queries, index.search(queries.tolist(), k=5)):
+        if space == "l2":
+            expected = ((vectors - query) ** 2).sum(axis=1)
+        elif space == "cosine":
+            expected = 1 - vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        else:
+            expected = 1 - vectors @ query
+        rows = [row for row, _ in result]
+        tolerance = 1e-4 if dtype == "float32" else 1e-2
+        assert np.allclose([distance for _, distance in result], np.sort(expected)[:5], atol=tolerance)
+        if dtype == "float32":
+            assert rows == list(np.argsort(expected)[:5])
+
+
+def test_empty_collection():
+    index = DenseIndex("notes", "id", [], np.zeros((0, 0)), space="cosine")
+    assert index.search([[1.0, 0.0]], k=5) == [[]]
+
+
+def test_reloads_after_update_in_other_worker(tmp_path):
+    """他のワーカーでの登録（件数が変わらない置換を含む）は保存された世代番号で検知する"""
+    collection = _StubCollection("notes", {"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    vectorstore = _make_vectorstore(collection, str(tmp_path))
+
+    first = get_dense_index(vectorstore)
+    assert get_dense_index(vectorstore) is first
+
+    # 別のvectorstore（他ワーカー相当）から世代番号を進める
+    collection.embeddings["a"] = [0.5, 0.5]
+    advance_generation(_make_vectorstore(collection, str(tmp_path)))
+
+    second = get_dense_index(vectorstore)
+    assert second is not first
+    assert np.allclose(second.matrix[0], [0.5, 0.5])
+    assert collection.loads == 2
+
+
+def test_loading_does_not_block_other_collections():
+    """読み込み中のコレクションがあっても、他のコレクションの取得は待たない"""
+    slow = _StubCollection("slow", {"a": [1.0, 0.0]})
+    slow.release = threading.Event()
+    fast = _StubCollection("fast", {"b": [0.0, 1.0]})
+
+    thread = threading.Thread(target=get_dense_index, args=(_make_vectorstore(slow),))
+    thread.start()
+    try:
+        assert slow.load_started.wait(timeout=5)
+        result = []
+        other = threading.Thread(target=lambda: result.append(get_dense_index(_make_vectorstore(fast))))
+        other.start()
+        other.join(timeout=2)
+        assert result and result[0].ids == ["b"]
+    finally:
+        slow.release.set()
+        thread.join(timeout=5)
+
+
+def test_concurrent_loads_of_same_collection_share_one_read():
+    collection = _StubCollection("notes", {"a": [1.0, 0.0]})
+    collection.release = threading.Event()
+    vectorstore = _make_vectorstore(collection)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_dense_index(vectorstore))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert collection.load_started.wait(timeout=5)
+    collection.release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(results) == 4 and all(index is results[0] for index in results)
+    assert collection.loads == 1
+
+
+def test_backend_by_team(monkeypatch):
+    monkeypatch.setattr(config, "DENSE_SEARCH_BACKEND", "chroma")
+    monkeypatch.setattr(config, "DENSE_SEARCH_BACKEND_BY_TEAM", {"team-a": "numpy", "team-b": "faiss"})
+    assert get_dense_backend("team-a") == "numpy"
+    assert get_dense_backend("team-b") == "chroma"
+    assert get_dense_backend("team-c") == "chroma"
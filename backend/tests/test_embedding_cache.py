@@ -0,0 +1,113 @@
+"""Embeddingキャッシュのテスト"""
+import sqlite3
+from array import array
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import DiskEmbeddingStore, EmbeddingCache
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DiskEmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+
+
+def test_vectors_are_stored_as_float32(store):
+    vector = [0.1, -0.25, 0.333333333333]
+    store.put_many("model", {"h1": vector})
+
+    loaded = store.get_many("model", ["h1", "missing"])
+    assert list(loaded) == ["h1"]
+    assert loaded["h1"] == pytest.approx(vector, rel=1e-6)
+
+    blob = sqlite3.connect(store.path).execute(f"SELECT vector FROM {store.TABLE_NAME}").fetchone()[0]
+    assert len(blob) == 4 * len(vector)
+
+
+def test_legacy_float64_vectors_are_still_read(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+        "PRIMARY KEY (model, text_hash))"
+    )
+    conn.execute("INSERT INTO embeddings VALUES (?, ?, ?)", ("model", "old", array("d", [0.5, 0.25]).tobytes()))
+    conn.commit()
+    conn.close()
+
+    store = DiskEmbeddingStore(path)
+    store.put_many("model", {"new": [1.0, 2.0]})
+    assert store.get_many("model", ["old", "new"]) == {"old": [0.5, 0.25], "new": [1.0, 2.0]}
+
+    store.clear()
+    assert store.get_many("model", ["old", "new"]) == {}
+
+
+def test_read_failure_is_treated_as_miss(store):
+    store.put_many("model", {"h1": [1.0]})
+    cache = EmbeddingCache(max_size=10, disk_store=store)
+
+    # 他のプロセスによるファイルの置き換え等で読み込みに失敗する場合
+    conn = sqlite3.connect(store.path)
+    conn.execute(f"DROP TABLE {store.TABLE_NAME}")
+    conn.commit()
+    conn.close()
+
+    assert cache.get_many("model", ["h1"]) == {}
+    assert cache.get_stats()["misses"] == 1
+
+
+class _FakeEmbeddings(Embeddings):
+    """テキストの長さから決まるベクトルを返すEmbedding（API呼び出しなし）"""
+
+    calls = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    def embed_documents(self, texts):
+        _FakeEmbeddings.calls += 1
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_ingest_proceeds_when_document_cache_read_fails(tmp_path, monkeypatch):
+    import chroma_sync
+    import embedding_cache
+    import ingest
+    from config import config
+    from storage import LocalStorage, storage
+
+    monkeypatch.setattr(storage, "backend", LocalStorage(str(tmp_path / "storage")))
+    monkeypatch.setattr(config, "CHROMA_DB_FOLDER", str(tmp_path / "chroma"))
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(config, "DOCUMENT_EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(embedding_cache, "_document_embedding_cache", None)
+    monkeypatch.setattr(ingest, "OpenAIEmbeddings", _FakeEmbeddings)
+    monkeypatch.setattr(chroma_sync, "get_chroma_config_path", lambda: str(tmp_path / "chroma_db_config.json"))
+    _FakeEmbeddings.calls = 0
+
+    storage.write_file("notes/new/ID1-1.md", "# ID1-1\n## 材料\n- アセトン\n## 方法\n1. 加熱する\n")
+
+    # 文書Embeddingキャッシュのファイルが読めない状態（テーブルの消失）
+    cache = embedding_cache.get_document_embedding_cache()
+    conn = sqlite3.connect(cache.disk_store.path)
+    conn.execute(f"DROP TABLE {cache.disk_store.TABLE_NAME}")
+    conn.commit()
+    conn.close()
+
+    new_notes, skipped_notes = ingest.ingest_notes(
+        api_key="sk-test",
+        source_folder="notes/new",
+        post_action="keep",
+        multi_collection=False,
+        use_synonym_normalization=False
+    )
+
+    # キャッシュの読み込み・保存に失敗してもEmbedding APIで取り込みを続行する
+    assert new_notes == ["ID1-1"]
+    assert skipped_notes == []
+    assert _FakeEmbeddings.calls >= 1
@@ -0,0 +1,120 @@
+"""重点指示のルールベース分類（focus_classifier）と分類ノードのテスト"""
+import pytest
+from langchain_core.messages import AIMessage
+
+from focus_classifier import classify_focus_by_rules
+
+
+DEFAULT_INSTRUCTION = "使用されている材料(化学物質、容量）と、方法（化学物質、容量、手順）の記述が類似している実験ノートを最優先して検索してください。"
+
+
+@pytest.mark.parametrize("instruction, expected", [
+    (DEFAULT_INSTRUCTION, "both"),
+    ("材料が近いもの", "materials"),
+    ("試薬の濃度を重視", "materials"),
+    ("手順が似ているもの", "methods"),
+    ("撹拌時間が近いもの", "methods"),
+])
+def test_rules_classify_instructions_without_unmatched_content(instruction, expected):
+    result = classify_focus_by_rules(instruction)
+    assert result is not None
+    assert result[0] == expected
+
+
+@pytest.mark.parametrize("instruction", [
+    # 化学物質名はプロンプトの基準では材料に当たるため、ルールでは判定しない
+    "エタノールを使って撹拌した実験",
+    "NaOHを加熱した実験を優先",
+    "抗体の濃度を重視",
+    # 否定表現
+    "材料は問わず手順重視",
+    # 材料・方法のどちらの語も含まない
+    "似た実験",
+])
+def test_rules_defer_to_llm(instruction):
+    assert classify_focus_by_rules(instruction) is None
+
+
+class _StubLLM:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return AIMessage(content=self.content)
+
+
+def _make_agent(prompts, llm_content):
+    from agent import SearchAgent
+
+    agent = SearchAgent.__new__(SearchAgent)
+    agent.team_id = None
+    agent.search_llm_model = "stub"
+    agent.prompts = prompts
+    agent.search_llm = _StubLLM(llm_content)
+    agent.search_llm_deterministic = True
+    agent.cancel_event = None
+    return agent
+
+
+@pytest.fixture
+def classify_config(monkeypatch):
+    from config import config
+
+    monkeypatch.setattr(config, "FOCUS_RULE_CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr(config, "SPECULATIVE_QUERY_GENERATION", False)
+    monkeypatch.setattr(config, "LLM_RESPONSE_CACHE_ENABLED", False)
+
+
+def test_classify_node_uses_rules_for_default_instruction(classify_config):
+    agent = _make_agent({}, '{"classification": "methods"}')
+    result = agent._classify_focus_node({"user_focus_instruction": DEFAULT_INSTRUCTION})
+    assert result["focus_classification"] == "both"
+    assert agent.search_llm.calls == 0
+
+
+def test_classify_node_uses_llm_for_chemical_names(classify_config):
+    agent = _make_agent({}, '{"classification": "both", "reason": "NaOHと加熱"}')
+    result = agent._classify_focus_node({"user_focus_instruction": "NaOHを加熱した実験を優先"})
+    assert result["focus_classification"] == "both"
+    assert agent.search_llm.calls == 1
+
+
+def test_classify_node_skips_rules_with_custom_prompt(classify_config):
+    custom_prompt = "重点指示を分類してください: {user_focus_instruction}"
+    agent = _make_agent({"focus_classification": custom_prompt}, '{"classification": "methods"}')
+    result = agent._classify_focus_node({"user_focus_instruction": "材料が近いもの"})
+    assert result["focus_classification"] == "methods"
+    assert agent.search_llm.calls == 1
+
+
+def test_speculative_queries_are_kept_out_of_state(classify_config, monkeypatch):
+    import agent as agent_module
+    from config import config
+
+    monkeypatch.setattr(config, "SPECULATIVE_QUERY_GENERATION", True)
+    monkeypatch.setattr(config, "SPECULATIVE_FOCUS_PREDICTION", "both")
+    agent = _make_agent({}, '{"classification": "methods"}')
+    agent._generate_axis_query = lambda axis, state, instruction: f"{axis}-query"
+
+    result = agent._classify_focus_node({"user_focus_instruction": "NaOHを加熱した実験を優先", "run_id": "run-1"})
+
+    # stateにはFutureを入れず、実行IDごとの表で管理する
+    assert result == {"focus_classification": "methods"}
+    speculative = agent_module._take_speculative_queries("run-1")
+    assert set(speculative) == {"material", "method", "combined"}
+    assert speculative["combined"][1].result() == "combined-query"
+
+
+def test_unused_speculative_queries_are_cancelled_at_run_end():
+    from concurrent.futures import Future
+    import agent as agent_module
+
+    pending = Future()
+    agent_module._speculative_queries["run-2"] = {"material": ("", pending)}
+
+    agent_module._discard_speculative_queries("run-2")
+
+    assert pending.cancelled()
+    assert "run-2" not in agent_module._speculative_queries
@@ -0,0 +1,79 @@
+"""HNSWパラメータのチューニングのテスト"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import hnsw_tuning
+from hnsw_tuning import apply_search_ef, measure_recall, select_search_ef
+
+
+class _StubCollection:
+    """HNSW検索の代わりに、クエリ自身 + 指定した近傍を返すコレクション"""
+    name = "notes"
+    id = "notes-id"
+    metadata = {}
+
+    def __init__(self, vectors: np.ndarray, exact_neighbors: bool):
+        self.vectors = vectors
+        self.ids = [f"d{i}" for i in range(len(vectors))]
+        self.exact_neighbors = exact_neighbors
+
+    def get(self, include=None):
+        return {"ids": list(self.ids), "embeddings": self.vectors.tolist()}
+
+    def query(self, query_embeddings, n_results, include=None):
+        query = np.asarray(query_embeddings[0])
+        distances = ((self.vectors - query) ** 2).sum(axis=1)
+        order = list(np.argsort(distances))
+        if not self.exact_neighbors:
+            # クエリ自身のみ正しく、残りは最も遠い文書
+            order = order[:1] + order[::-1][:n_results - 1]
+        return {"ids": [[self.ids[i] for i in order[:n_results]]]}
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(200, 8)).astype(np.float32)
+
+
+def test_recall_excludes_query_itself(monkeypatch, vectors):
+    """クエリ自身（距離0）はrecallの計算に含めない"""
+    monkeypatch.setattr(hnsw_tuning, "apply_search_ef", lambda vectorstore, search_ef: True)
+
+    exact = measure_recall(SimpleNamespace(_collection=_StubCollection(vectors, True)), [10], k=10, num_queries=20)
+    assert exact[0]["recall"] == 1.0
+
+    # 自身しか正しく返さない検索のrecallは0（自身を含めると1/kに見える）
+    wrong = measure_recall(SimpleNamespace(_collection=_StubCollection(vectors, False)), [10], k=10, num_queries=20)
+    assert wrong[0]["recall"] == 0.0
+
+
+def test_select_search_ef():
+    measurements = [
+        {"search_ef": 10, "recall": 0.8, "latency_ms": 1.0},
+        {"search_ef": 40, "recall": 0.96, "latency_ms": 2.0},
+        {"search_ef": 80, "recall": 0.99, "latency_ms": 3.0},
+    ]
+    assert select_search_ef(measurements, 0.95)["search_ef"] == 40
+    assert select_search_ef(measurements, 0.999)["search_ef"] == 80
+    assert select_search_ef([], 0.95) is None
+
+
+def test_apply_search_ef_on_chroma(tmp_path, vectors):
+    """search_efはコレクションのメタデータに設定し、既存のHNSWパラメータは保持する"""
+    chromadb = pytest.importorskip("chromadb")
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.create_collection(
+        "notes_test", metadata={"hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+    )
+    collection.add(ids=[f"d{i}" for i in range(len(vectors))], embeddings=vectors.tolist())
+    vectorstore = SimpleNamespace(_collection=collection, _client=client)
+
+    assert apply_search_ef(vectorstore, 120)
+    assert client.get_collection("notes_test").metadata == {
+        "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 120
+    }
+
+    measurements = measure_recall(vectorstore, [120], k=10, num_queries=20)
+    assert measurements[0]["recall"] >= 0.95
@@ -0,0 +1,74 @@
+"""ハイブリッド検索のテスト"""
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from bm25_index import BM25Index
+from hybrid_search import hybrid_search
+
+
+class _StubCollection:
+    name = "notes"
+    metadata = {"hnsw:space": "l2"}
+
+    def __init__(self, embeddings: dict):
+        self.embeddings = embeddings
+
+    def get(self, ids=None, include=None):
+        ids = [doc_id for doc_id in ids if doc_id in self.embeddings]
+        return {"ids": ids, "embeddings": [self.embeddings[doc_id] for doc_id in ids]}
+
+
+def _make_vectorstore(embeddings: dict):
+    return SimpleNamespace(
+        _collection=_StubCollection(embeddings),
+        _persist_directory="",
+        _select_relevance_score_fn=lambda: (lambda distance: 1.0 - distance / 2)
+    )
+
+
+def _make_index() -> BM25Index:
+    # N1は2チャンク（c2の方がethanolのBM25スコアが高い）
+    index = BM25Index(name="notes")
+    index.add_documents(
+        ["c1", "c2", "c3"],
+        ["ethanol stir reagent sample", "ethanol ethanol ethanol heat", "acetone cool"],
+        [{"note_id": "N1"}, {"note_id": "N1"}, {"note_id": "N2"}]
+    )
+    return index
+
+
+def _search(alpha: float):
+    vectorstore = _make_vectorstore({"c1": [1.0, 0.0], "c2": [0.0, 1.0], "c3": [0.6, 0.8]})
+    semantic_results = [
+        (Document(page_content="ethanol stir reagent sample", metadata={"note_id": "N1"}, id="c1"), 0.9),
+        (Document(page_content="acetone cool", metadata={"note_id": "N2"}, id="c3"), 0.5),
+    ]
+    return hybrid_search(
+        vectorstore,
+        _make_index(),
+        queries=["ethanol"],
+        query_embeddings=[[1.0, 0.0]],
+        semantic_result_sets=[semantic_results],
+        vector_storage={"mode": "float32"},
+        alpha=alpha,
+        k=10
+    )[0]
+
+
+def test_semantic_hits_are_aligned_by_chroma_id():
+    """セマンティック検索のチャンクは同じIDの文書番号のBM25スコアで評価する"""
+    results = _search(alpha=0.0)
+    # キーワードのみの重みでは、BM25スコアの高いc2（N1の別チャンク）が1位になる
+    assert results[0][0].id == "c2"
+    assert results[0][1] == 1.0
+
+
+def test_each_note_is_returned_once():
+    """同じnote_idの複数チャンクは統合スコアの高い1件のみ返す"""
+    for alpha in (0.0, 0.5, 1.0):
+        note_ids = [doc.metadata["note_id"] for doc, _ in _search(alpha)]
+        assert sorted(note_ids) == ["N1", "N2"]
+
+    # セマンティックのみの重みでは、セマンティック検索で返されたc1がN1を代表する
+    assert _search(alpha=1.0)[0][0].id == "c1"
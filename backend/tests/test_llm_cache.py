@@ -0,0 +1,108 @@
+"""LLM応答キャッシュのテスト"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+import llm_cache
+from agent import SearchAgent, _supports_temperature
+from llm_cache import DiskLLMResponseStore, LLMResponseCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def disk_store(tmp_path):
+    return DiskLLMResponseStore(str(tmp_path / "llm_responses.sqlite3"), max_size=100)
+
+
+def test_expired_responses_are_not_used(clock, disk_store):
+    cache = LLMResponseCache(max_size=10, ttl=60, disk_store=disk_store)
+    cache.put("team-a", "gpt-4o-mini", "prompt", "response")
+
+    clock.now += 59
+    assert cache.get("team-a", "gpt-4o-mini", "prompt") == "response"
+
+    # メモリ・ディスクの両方で有効期間を過ぎた応答は使わない
+    clock.now += 2
+    assert cache.get("team-a", "gpt-4o-mini", "prompt") is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_disk_entries_survive_restart(clock, disk_store):
+    LLMResponseCache(max_size=10, ttl=60, disk_store=disk_store).put(None, "gpt-4o-mini", "prompt", "response")
+
+    restarted = LLMResponseCache(max_size=10, ttl=60, disk_store=disk_store)
+    assert restarted.get(None, "gpt-4o-mini", "prompt") == "response"
+    assert restarted.get_stats()["disk_hits"] == 1
+
+
+def test_invalidate_team_only_removes_that_team(clock, disk_store):
+    cache = LLMResponseCache(max_size=10, ttl=60, disk_store=disk_store)
+    cache.put("team-a", "gpt-4o-mini", "prompt", "a")
+    cache.put("team-b", "gpt-4o-mini", "prompt", "b")
+
+    cache.invalidate_team("team-a")
+
+    assert cache.get("team-a", "gpt-4o-mini", "prompt") is None
+    assert cache.get("team-b", "gpt-4o-mini", "prompt") == "b"
+    # ディスクからも削除されている
+    restarted = LLMResponseCache(max_size=10, ttl=60, disk_store=disk_store)
+    assert restarted.get("team-a", "gpt-4o-mini", "prompt") is None
+    assert restarted.get("team-b", "gpt-4o-mini", "prompt") == "b"
+
+
+def _make_agent(deterministic: bool, replies):
+    calls = []
+
+    def invoke(prompt):
+        calls.append(prompt)
+        return SimpleNamespace(content=replies[len(calls) - 1])
+
+    stub = SimpleNamespace(
+        team_id="team-a",
+        search_llm_model="gpt-4o-mini" if deterministic else "gpt-5-mini",
+        search_llm=SimpleNamespace(invoke=invoke),
+        search_llm_deterministic=deterministic,
+        _extract_json_from_response=lambda text: SearchAgent._extract_json_from_response(None, text)
+    )
+    return stub, calls
+
+
+@pytest.mark.parametrize("deterministic, expected_calls", [(True, 1), (False, 2)])
+def test_only_deterministic_models_are_cached(monkeypatch, deterministic, expected_calls):
+    """temperature 0で呼び出せないモデルの応答はキャッシュしない"""
+    cache = LLMResponseCache(max_size=10, ttl=60)
+    monkeypatch.setattr(agent, "get_llm_response_cache", lambda: cache)
+
+    reply = json.dumps({"queries": ["q1"]})
+    stub, calls = _make_agent(deterministic, [reply, reply])
+    for _ in range(2):
+        assert SearchAgent._invoke_search_llm(stub, "prompt", required_key="queries") == reply
+    assert len(calls) == expected_calls
+
+
+@pytest.mark.parametrize("model, supported", [
+    ("gpt-4o-mini", True),
+    ("gpt-4.1", True),
+    ("o1-mini", False),
+    ("o3-mini", False),
+    ("gpt-5", False),
+    ("gpt-5-mini", False),
+])
+def test_supports_temperature(model, supported):
+    assert _supports_temperature(model) is supported
@@ -0,0 +1,71 @@
+"""Cohereリランクのキャッシュのテスト"""
+from types import SimpleNamespace
+
+import pytest
+
+import rerank_cache
+from rerank_cache import RerankCache, rerank
+
+
+class _StubCohere:
+    """文書本文の長さを関連度スコアとして返すCohereクライアント"""
+
+    def __init__(self):
+        self.requests = []
+
+    def rerank(self, model, query, documents, top_n):
+        self.requests.append(list(documents))
+        results = [SimpleNamespace(index=i, relevance_score=len(document) / 100) for i, document in enumerate(documents)]
+        results.sort(key=lambda r: -r.relevance_score)
+        return SimpleNamespace(results=results[:top_n])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = RerankCache(max_size=100)
+    monkeypatch.setattr(rerank_cache, "get_rerank_cache", lambda: cache)
+    return cache
+
+
+def test_only_uncached_documents_are_sent(cache):
+    client = _StubCohere()
+    rerank(client, "model", "query", ["a", "bbb", "cc"], top_n=3)
+    results = rerank(client, "model", "query", ["cc", "dddd", "a"], top_n=2)
+
+    assert client.requests == [["a", "bbb", "cc"], ["dddd"]]
+    assert [(r.index, r.relevance_score) for r in results] == [(1, 0.04), (0, 0.02)]
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["api_calls"]) == (2, 4, 2)
+
+
+def test_cached_results_match_uncached(cache, monkeypatch):
+    documents = ["aa", "b", "aa", "cccc"]
+    cached = rerank(_StubCohere(), "model", "query", documents, top_n=3)
+
+    monkeypatch.setattr(rerank_cache, "get_rerank_cache", lambda: None)
+    uncached = rerank(_StubCohere(), "model", "query", documents, top_n=3)
+
+    assert cached == [(3, 0.04), (0, 0.02), (2, 0.02)]
+    assert [(r.index, r.relevance_score) for r in uncached] == [(3, 0.04), (0, 0.02), (2, 0.02)]
+
+
+def test_full_hit_skips_api_and_keys_include_model_and_query(cache):
+    client = _StubCohere()
+    rerank(client, "model", "query", ["a", "bb"], top_n=2)
+    rerank(client, "model", "query", ["bb", "a"], top_n=2)
+    rerank(client, "other-model", "query", ["a"], top_n=1)
+    rerank(client, "model", "other query", ["a"], top_n=1)
+
+    assert len(client.requests) == 3
+    assert cache.get_stats()["full_hits"] == 1
+
+
+def test_size_is_bounded():
+    cache = RerankCache(max_size=2)
+    cache.put_many("model", "q", {"d1": 0.1, "d2": 0.2})
+    cache.get_many("model", "q", ["d1"])
+    cache.put_many("model", "q", {"d3": 0.3})
+
+    # 最も古く使われたd2から破棄される
+    assert cache.get_many("model", "q", ["d1", "d2", "d3"]) == {"d1": 0.1, "d3": 0.3}
+    assert cache.get_stats()["size"] == 2
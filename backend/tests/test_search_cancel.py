@@ -0,0 +1,48 @@
+"""検索の中断（/search/stream のクライアント切断）のテスト"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+import agent
+from agent import SearchAgent, SearchCancelled, _agent_node, SEARCH_AGENT_CONFIG_KEY
+
+
+def _make_agent(cancel_event):
+    search_agent = SearchAgent.__new__(SearchAgent)
+    search_agent.cancel_event = cancel_event
+    search_agent.search_mode = "semantic"
+    search_agent.hybrid_alpha = 0.7
+    search_agent.cohere_client = None
+    search_agent.vectorstore = SimpleNamespace(_collection=SimpleNamespace(count=lambda: 1))
+    return search_agent
+
+
+def test_node_is_not_started_after_cancel():
+    cancel_event = threading.Event()
+    search_agent = _make_agent(cancel_event)
+    node = _agent_node("_search_node")
+    cancel_event.set()
+
+    with pytest.raises(SearchCancelled):
+        node({"search_query": "q"}, {"configurable": {SEARCH_AGENT_CONFIG_KEY: search_agent}})
+
+
+def test_rerank_is_skipped_when_cancelled_during_search(monkeypatch):
+    cancel_event = threading.Event()
+    search_agent = _make_agent(cancel_event)
+
+    def search_with_synonym_expansion(**kwargs):
+        # 候補の取得中にクライアントが切断した場合
+        cancel_event.set()
+        return [(Document(page_content="note", metadata={"source": "ID1-1"}), 0.9)]
+
+    def rerank(*args, **kwargs):
+        raise AssertionError("中断後にリランクを呼び出した")
+
+    search_agent._search_with_synonym_expansion = search_with_synonym_expansion
+    monkeypatch.setattr(agent, "rerank", rerank)
+
+    with pytest.raises(SearchCancelled):
+        search_agent._search_node({"search_query": "q"})
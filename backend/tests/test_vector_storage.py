@@ -0,0 +1,133 @@
+"""ベクトル保存形式（reduced / int8）のテスト"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import vector_storage
+from config import config
+from vector_storage import (
+    QuantizedVectorStore,
+    add_texts_with_storage,
+    get_default_vector_storage,
+    reduce_embeddings,
+    rescore_results,
+)
+
+
+def _matryoshka_like_vectors(rng, count: int, dimensions: int = 128) -> np.ndarray:
+    """先頭の次元ほど分散が大きいベクトル（Matryoshka学習済みモデルの埋め込みを模擬）"""
+    scales = 1 / (1 + np.arange(dimensions) / 8)
+    return (rng.normal(size=(count, dimensions)) * scales).astype(np.float32)
+
+
+class _StubCollection:
+    name = "notes"
+    metadata = {"hnsw:space": "cosine"}
+
+    def __init__(self):
+        self.records = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for doc_id, embedding, document in zip(ids, embeddings, documents):
+            self.records[doc_id] = (embedding, document)
+
+
+def _make_vectorstore(persist_directory: str):
+    return SimpleNamespace(
+        _collection=_StubCollection(),
+        _persist_directory=persist_directory,
+        _select_relevance_score_fn=lambda: (lambda distance: 1.0 - distance)
+    )
+
+
+@pytest.mark.parametrize("model, expected", [
+    ("text-embedding-3-small", "int8"),
+    ("text-embedding-3-large", "int8"),
+    ("text-embedding-ada-002", "float32"),
+])
+def test_reduced_modes_require_reducible_model(monkeypatch, model, expected):
+    """Matryoshka学習済みでないモデルではreduced/int8形式を使用しない"""
+    monkeypatch.setattr(config, "VECTOR_STORAGE_MODE", "int8")
+    assert get_default_vector_storage(model)["mode"] == expected
+
+
+def test_reduce_embeddings_normalizes_leading_dimensions():
+    vectors = np.random.default_rng(0).normal(size=(5, 64)).tolist()
+    reduced = np.asarray(reduce_embeddings(vectors, {"mode": "reduced", "dimensions": 16}))
+    assert reduced.shape == (5, 16)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-6)
+    assert reduce_embeddings(vectors, {"mode": "float32", "dimensions": None}) is vectors
+
+
+def test_quantized_store_round_trip(tmp_path):
+    """量子化ベクトルの復元誤差は成分ごとにスケールの1/2以内"""
+    vectors = np.random.default_rng(1).normal(size=(20, 64)).astype(np.float32)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    store = QuantizedVectorStore(str(tmp_path / "quantized.sqlite3"))
+    store.add("notes", ids, vectors.tolist())
+
+    restored = store.get("notes", ids + ["missing"])
+    store.close()
+
+    assert set(restored) == set(ids)
+    for i, doc_id in enumerate(ids):
+        scale = np.abs(vectors[i]).max() / 127
+        assert np.abs(restored[doc_id] - vectors[i]).max() <= scale / 2 + 1e-6
+
+
+def test_add_texts_with_int8_storage(tmp_path):
+    """int8形式: Chromaには縮約ベクトル、量子化ストアには全次元ベクトルを保存"""
+    vectors = np.random.default_rng(2).normal(size=(3, 64)).astype(np.float32)
+    embeddings = SimpleNamespace(embed_documents=lambda texts: vectors.tolist())
+    vectorstore = _make_vectorstore(str(tmp_path))
+
+    ids = add_texts_with_storage(
+        vectorstore, embeddings, texts=["a", "b", "c"], metadatas=[{}, {}, {}],
+        vector_storage={"mode": "int8", "dimensions": 16}
+    )
+
+    stored = np.asarray([vectorstore._collection.records[doc_id][0] for doc_id in ids])
+    assert stored.shape == (3, 16)
+    quantized = vector_storage.get_quantized_store(str(tmp_path)).get("notes", ids)
+    assert np.allclose(np.stack([quantized[doc_id] for doc_id in ids]), vectors, atol=0.05)
+    vector_storage.remove_quantized_store(str(tmp_path))
+
+
+def test_int8_rescoring_recovers_exact_ranking(tmp_path):
+    """縮約ベクトルの候補をint8で再スコアリングすると、厳密検索（float32全次元）の上位k件をほぼ再現する"""
+    rng = np.random.default_rng(3)
+    k, dimensions = 10, 32
+    docs = _matryoshka_like_vectors(rng, 2000)
+    queries = _matryoshka_like_vectors(rng, 50)
+    ids = [f"d{i}" for i in range(len(docs))]
+
+    vectorstore = _make_vectorstore(str(tmp_path))
+    vector_storage.get_quantized_store(str(tmp_path)).add("notes", ids, docs.tolist())
+
+    def normalize(matrix):
+        return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    exact = np.argsort(-(normalize(queries) @ normalize(docs).T), axis=1)[:, :k]
+    reduced_docs = np.asarray(reduce_embeddings(docs.tolist(), {"mode": "reduced", "dimensions": dimensions}))
+    reduced_queries = np.asarray(reduce_embeddings(queries.tolist(), {"mode": "reduced", "dimensions": dimensions}))
+    reduced_order = np.argsort(-(reduced_queries @ reduced_docs.T), axis=1)
+
+    candidate_sets = [
+        [(Document(page_content="", id=ids[i]), 0.0) for i in order[:k * config.VECTOR_RESCORE_MULTIPLIER]]
+        for order in reduced_order
+    ]
+    rescored = rescore_results(vectorstore, queries.tolist(), candidate_sets, k)
+    vector_storage.remove_quantized_store(str(tmp_path))
+
+    def recall(result_ids):
+        return np.mean([
+            len(set(found) & {ids[i] for i in expected}) / k
+            for found, expected in zip(result_ids, exact)
+        ])
+
+    reduced_recall = recall([[ids[i] for i in order[:k]] for order in reduced_order])
+    rescored_recall = recall([[doc.id for doc, _ in results] for results in rescored])
+    assert rescored_recall >= 0.95
+    assert rescored_recall > reduced_recall
@@ -0,0 +1,108 @@
+"""
+トークナイザーモジュール（v3.3.0）
+
+キーワード検索（BM25）のインデックス構築とクエリで共通に使うトークナイザー
+- 英数字は単語単位、日本語（ひらがな・カタカナ・漢字）は2-gram + 1-gramに分割する
+- 正規表現は事前コンパイルし、n-gramはジェネレーターで逐次生成する（中間リストを作らない）
+- Vocabulary: トークンを整数IDにインターンし、インデックスを文字列ではなくIDで保持する
+- tokenize_query: 同じクエリ文字列（同義語展開・軸別検索で繰り返し現れる）の結果をLRUキャッシュする
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import config
+
+
+# 英数字の単語
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+# 日本語部分の抽出時に取り除く文字（英数字・空白・記号）
+_NON_JAPANESE_PATTERN = re.compile(r'[a-z0-9\s\.,!?:;()\[\]{}\-_]+')
+
+
+def iter_tokens(text: str) -> Iterator[str]:
+    """テキストをトークン化し、トークンを順に返す
+
+    Args:
+        text: 入力テキスト
+
+    Yields:
+        トークン（英数字の単語 → 日本語の2-gram → 日本語の1-gram の順）
+    """
+    # 小文字化
+    text = text.lower()
+
+    # 英数字の単語を抽出
+    for match in _WORD_PATTERN.finditer(text):
+        yield match.group()
+
+    # 日本語部分を抽出（ひらがな、カタカナ、漢字）
+    japanese_text = _NON_JAPANESE_PATTERN.sub('', text)
+    # 2-gramで分割（より精度の高いマッチングのため）
+    for i in range(len(japanese_text) - 1):
+        yield japanese_text[i:i + 2]
+    # 1-gramも追加
+    yield from japanese_text
+
+
+def tokenize(text: str) -> List[str]:
+    """テキストをトークン化（簡易的な日本語対応）
+
+    英数字は単語単位、日本語（ひらがな・カタカナ・漢字）は2-gram + 1-gramに分割する
+
+    Args:
+        text: 入力テキスト
+
+    Returns:
+        トークンのリスト
+    """
+    return list(iter_tokens(text))
+
+
+@lru_cache(maxsize=config.TOKENIZER_QUERY_CACHE_SIZE)
+def tokenize_query(text: str) -> Tuple[str, ...]:
+    """クエリ文字列をトークン化（LRUキャッシュ付き）
+
+    Args:
+        text: クエリ文字列
+
+    Returns:
+        トークンのタプル（キャッシュを共有するため変更不可）
+    """
+    return tuple(iter_tokens(text))
+
+
+class Vocabulary:
+    """トークン ↔ 整数IDの対応表（IDは登録順に0から採番）"""
+
+    def __init__(self, tokens: List[str] = None):
+        """
+        Args:
+            tokens: 初期トークン（リストの順にIDを割り当てる）
+        """
+        self.tokens: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for token in tokens or []:
+            self.intern(token)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._ids
+
+    def intern(self, token: str) -> int:
+        """トークンのIDを取得（未登録の場合は新しいIDを割り当てる）"""
+        token_id = self._ids.get(token)
+        if token_id is None:
+            token_id = self._ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def get_id(self, token: str) -> Optional[int]:
+        """トークンのIDを取得（未登録の場合はNone）"""
+        return self._ids.get(token)
+
+    def get_token(self, token_id: int) -> str:
+        """IDに対応するトークンを取得"""
+        return self.tokens[token_id]
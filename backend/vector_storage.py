@@ -0,0 +1,318 @@
+"""
+ベクトル保存形式モジュール（v3.3.0）
+
+チームのコレクションに保存するベクトルの形式を切り替える
+- "float32": 従来通り全次元のベクトルをChromaに保存
+- "reduced": 先頭N次元のみ（正規化し直して）Chromaに保存する
+  （text-embedding-3-* はMatryoshka学習のため、OpenAI APIのdimensionsパラメータと同等）
+  再スコアリングは行わず、順位は縮約したベクトルの類似度で決まる
+- "int8": Chromaには縮約次元のベクトル（候補検索用）を保存し、全次元のベクトルはint8に量子化して
+  persist_directory/quantized_vectors.sqlite3 に保存する。
+  検索時は候補を多めに取得し、全次元のクエリベクトルと量子化ベクトル（int8から復元した値）で再スコアリングする。
+  再スコアリングで除かれるのは次元の縮約による誤差で、量子化誤差（成分ごとに最大でスケールの1/2）は最終スコアに残る
+  （float32の全次元ベクトルは保存しない）
+- reduced/int8形式はconfig.VECTOR_REDUCIBLE_EMBEDDING_MODELS（Matryoshka学習済み）のモデルのみ使用できる。
+  それ以外のモデルでは先頭次元への縮約で検索精度が大きく下がるため、float32形式で作成する
+- 1件あたりのサイズ（1536次元、縮約256次元の場合）: float32 6KB、reduced 1KB、int8 1KB + 1.5KB
+形式はチームのchroma_db_config.json（vector_storage）に記録し、コレクション作成後は記録された形式を使う
+（形式を変更する場合はリセット → 再構築が必要）
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from config import config
+
+
+VECTOR_STORAGE_MODES = ("float32", "reduced", "int8")
+QUANTIZED_STORE_FILE_NAME = "quantized_vectors.sqlite3"
+
+# SQLiteのIN句に渡すパラメータ数の上限
+_SQLITE_BATCH_SIZE = 500
+
+
+def get_default_vector_storage(embedding_model: str = None) -> dict:
+    """新規コレクションに使うベクトル保存形式（config）を取得
+
+    Args:
+        embedding_model: コレクションのembeddingモデル名（Noneの場合はconfig.DEFAULT_EMBEDDING_MODEL）
+
+    Returns:
+        dict: {"mode": 保存形式, "dimensions": Chromaに保存する次元数（float32の場合はNone）}
+    """
+    embedding_model = embedding_model or config.DEFAULT_EMBEDDING_MODEL
+    mode = config.VECTOR_STORAGE_MODE
+    if mode not in VECTOR_STORAGE_MODES:
+        print(f"⚠️ 未対応のベクトル保存形式です: {mode}（float32を使用）")
+        mode = "float32"
+    elif mode != "float32" and embedding_model not in config.VECTOR_REDUCIBLE_EMBEDDING_MODELS:
+        print(f"⚠️ {embedding_model} は次元の縮約に対応していません: {mode}形式は使用できません（float32を使用）")
+        mode = "float32"
+    return {
+        "mode": mode,
+        "dimensions": config.VECTOR_REDUCED_DIMENSIONS if mode != "float32" else None
+    }
+
+
+def reduce_embeddings(embeddings: List[List[float]], vector_storage: dict) -> List[List[float]]:
+    """ベクトルをChromaに保存する次元に縮約（先頭N次元を取り出して正規化し直す）
+
+    Args:
+        embeddings: 全次元のベクトルのリスト
+        vector_storage: ベクトル保存形式
+
+    Returns:
+        縮約したベクトルのリスト（float32形式の場合はそのまま）
+    """
+    dimensions = vector_storage.get("dimensions")
+    if vector_storage.get("mode", "float32") == "float32" or not dimensions or not embeddings:
+        return embeddings
+
+    reduced = np.asarray(embeddings, dtype=np.float32)[:, :dimensions]
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    return (reduced / np.where(norms > 0, norms, 1)).tolist()
+
+
+def quantize_int8(embeddings: List[List[float]]):
+    """ベクトルを行ごとのスケールでint8に量子化
+
+    Returns:
+        (int8の行列, 行ごとのスケール)
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales
+
+
+class QuantizedVectorStore:
+    """int8量子化した全次元ベクトルのストア（SQLite、persist_directory内に保存）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLiteファイルのパス
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "collection TEXT NOT NULL, id TEXT NOT NULL, scale REAL NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (collection, id))"
+            )
+            self._conn.commit()
+
+    def add(self, collection_name: str, ids: List[str], embeddings: List[List[float]]) -> None:
+        """ベクトルを量子化して保存
+
+        Args:
+            collection_name: コレクション名
+            ids: ChromaのドキュメントIDリスト
+            embeddings: 全次元のベクトルのリスト
+        """
+        if not ids:
+            return
+        quantized, scales = quantize_int8(embeddings)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (collection, id, scale, vector) VALUES (?, ?, ?, ?)",
+                [(collection_name, doc_id, float(scale), row.tobytes())
+                 for doc_id, scale, row in zip(ids, scales, quantized)]
+            )
+            self._conn.commit()
+
+    def get(self, collection_name: str, ids: List[str]) -> Dict[str, np.ndarray]:
+        """量子化ベクトルを復元して取得
+
+        Args:
+            collection_name: コレクション名
+            ids: ChromaのドキュメントIDリスト
+
+        Returns:
+            {id: float32ベクトル}（保存されていないものは含まない）
+        """
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), _SQLITE_BATCH_SIZE):
+                batch = ids[i:i + _SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, scale, vector FROM vectors WHERE collection = ? AND id IN ({placeholders})",
+                    [collection_name, *batch]
+                )
+                for doc_id, scale, blob in rows:
+                    found[doc_id] = np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+        return found
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# {persist_directory: QuantizedVectorStore}
+_stores: Dict[str, QuantizedVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_quantized_store(persist_directory: str) -> QuantizedVectorStore:
+    """persist_directoryの量子化ベクトルストアを取得（初回呼び出し時に作成）"""
+    persist_directory = os.path.abspath(persist_directory)
+    with _stores_lock:
+        store = _stores.get(persist_directory)
+        if store is None:
+            store = _stores[persist_directory] = QuantizedVectorStore(
+                os.path.join(persist_directory, QUANTIZED_STORE_FILE_NAME)
+            )
+        return store
+
+
+def remove_quantized_store(persist_directory: str) -> None:
+    """量子化ベクトルストアを閉じてファイルを削除（コレクションのリセット時）"""
+    persist_directory = os.path.abspath(persist_directory)
+    with _stores_lock:
+        store = _stores.pop(persist_directory, None)
+        if store is not None:
+            store.close()
+        path = os.path.join(persist_directory, QUANTIZED_STORE_FILE_NAME)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def add_texts_with_storage(vectorstore, embeddings, texts: List[str], metadatas: List[dict], vector_storage: dict) -> List[str]:
+    """保存形式に応じてテキストをコレクションに追加
+
+    float32形式の場合はvectorstore.add_texts()と同じ。
+    それ以外は全次元のベクトルを1回で取得し、縮約ベクトルをChromaにupsert、
+    int8形式の場合は全次元ベクトルを量子化ストアにも保存する
+
+    Args:
+        vectorstore: 追加先のChroma vectorstore
+        embeddings: 全次元のベクトルを返すEmbeddings
+        texts: 本文のリスト
+        metadatas: メタデータのリスト
+        vector_storage: ベクトル保存形式
+
+    Returns:
+        追加したドキュメントのIDリスト
+    """
+    import uuid
+
+    mode = vector_storage.get("mode", "float32")
+    if mode == "float32":
+        return vectorstore.add_texts(texts=texts, metadatas=metadatas)
+
+    ids = [str(uuid.uuid4()) for _ in texts]
+    full_embeddings = embeddings.embed_documents(texts)
+    vectorstore._collection.upsert(
+        ids=ids,
+        embeddings=reduce_embeddings(full_embeddings, vector_storage),
+        documents=texts,
+        metadatas=metadatas
+    )
+    if mode == "int8":
+        get_quantized_store(vectorstore._persist_directory).add(vectorstore._collection.name, ids, full_embeddings)
+    return ids
+
+
+def _relevance_scores(query: np.ndarray, vectors: np.ndarray, space: str, relevance_score_fn) -> List[float]:
+    """クエリベクトルと文書ベクトル（行列）の関連度を計算（Chromaの距離関数と同じ距離を変換）"""
+    if space == "l2":
+        distances = np.sum((vectors - query) ** 2, axis=1)
+    elif space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        distances = 1 - (vectors @ query) / np.where(norms > 0, norms, 1)
+    else:
+        distances = 1 - vectors @ query
+    return [relevance_score_fn(float(distance)) for distance in distances]
+
+
+def rescore_results(vectorstore, query_embeddings: List[List[float]], result_sets: List[List[tuple]], k: int) -> List[List[tuple]]:
+    """候補を全次元のクエリベクトルと量子化ベクトルで再スコアリング（int8形式）
+
+    次元の縮約による誤差を除く（量子化ベクトルはint8から復元した値のため、量子化誤差は残る）
+
+    Args:
+        vectorstore: 検索対象のChroma vectorstore
+        query_embeddings: 全次元のクエリベクトルのリスト
+        result_sets: クエリごとの候補 (Document, 関連度) タプルのリスト（Document.idが必要）
+        k: クエリごとの上位件数
+
+    Returns:
+        クエリごとの (Document, 関連度) タプルのリスト（関連度はコレクションの距離関数に応じて変換）
+    """
+    store = get_quantized_store(vectorstore._persist_directory)
+    collection_name = vectorstore._collection.name
+    space = (vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+    relevance_score_fn = vectorstore._select_relevance_score_fn()
+
+    all_ids = list(dict.fromkeys(doc.id for results in result_sets for doc, _ in results if doc.id))
+    vectors = store.get(collection_name, all_ids)
+
+    rescored_sets = []
+    for query_embedding, results in zip(query_embeddings, result_sets):
+        # 量子化ベクトルがない文書は候補検索時のスコアを使用
+        quantized = [(doc, vectors[doc.id]) for doc, _ in results if doc.id in vectors]
+        rescored = [(doc, score) for doc, score in results if doc.id not in vectors]
+        if quantized:
+            scores = _relevance_scores(
+                np.asarray(query_embedding, dtype=np.float32),
+                np.stack([vector for _, vector in quantized]),
+                space,
+                relevance_score_fn
+            )
+            rescored.extend((doc, score) for (doc, _), score in zip(quantized, scores))
+        rescored.sort(key=lambda x: x[1], reverse=True)
+        rescored_sets.append(rescored[:k])
+    return rescored_sets
+
+
+def score_candidates(vectorstore, query_embeddings: List[List[float]], ids: List[str], vector_storage: dict) -> np.ndarray:
+    """指定した文書のセマンティック検索の関連度を計算（ハイブリッド検索でキーワード検索のみの候補用）
+
+    セマンティック検索と同じベクトル・距離で計算する
+    （float32/reduced形式: Chromaのベクトルと縮約したクエリ、int8形式: 量子化ベクトルと全次元のクエリ）
+
+    Args:
+        vectorstore: 検索対象のChroma vectorstore
+        query_embeddings: 全次元のクエリベクトルのリスト
+        ids: ChromaのドキュメントIDリスト
+        vector_storage: ベクトル保存形式
+
+    Returns:
+        np.ndarray: shape (クエリ数, 文書数) の関連度（ベクトルを取得できない文書はNaN）
+    """
+    scores = np.full((len(query_embeddings), len(ids)), np.nan)
+    if not ids or not query_embeddings:
+        return scores
+
+    space = (vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+    relevance_score_fn = vectorstore._select_relevance_score_fn()
+    positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    # (クエリ行列, {id: ベクトル})
+    sources = []
+    remaining = list(ids)
+    if vector_storage.get("mode") == "int8":
+        quantized = get_quantized_store(vectorstore._persist_directory).get(vectorstore._collection.name, remaining)
+        sources.append((np.asarray(query_embeddings, dtype=np.float32), quantized))
+        remaining = [doc_id for doc_id in remaining if doc_id not in quantized]
+    if remaining:
+        data = vectorstore._collection.get(ids=remaining, include=["embeddings"])
+        stored = dict(zip(data["ids"], data["embeddings"])) if data.get("embeddings") is not None else {}
+        search_embeddings = reduce_embeddings(query_embeddings, vector_storage)
+        sources.append((np.asarray(search_embeddings, dtype=np.float32), stored))
+
+    for queries, vectors in sources:
+        if not vectors:
+            continue
+        columns = [positions[doc_id] for doc_id in vectors]
+        matrix = np.asarray(list(vectors.values()), dtype=np.float32)
+        for query_index, query in enumerate(queries):
+            scores[query_index, columns] = _relevance_scores(query, matrix, space, relevance_score_fn)
+    return scores